@@ -0,0 +1,58 @@
+"""
+Medical image analysis entry points. This module is imported by inference
+worker processes, so it must not depend on the web app or the database.
+"""
+import logging
+import os
+from typing import List, Optional
+
+from .analyzers import DEFAULT_SOURCE, analyzer_key, parse_analyzer_key, preload, registry
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever model weights or post-processing change, so cached results
+# from an older analyzer are not served.
+ANALYZER_VERSION = "mock-1"
+
+def load_models():
+    """
+    Prepare this process for analysis. Runs once per inference worker at
+    warm-up. Analyzers load lazily on first use, except those listed in
+    ANALYZER_PRELOAD.
+    """
+    preload()
+    logger.info("Inference worker ready in process %s", os.getpid())
+
+def analyze_medical_image(image_type: str, image_data, source: str = DEFAULT_SOURCE):
+    """
+    Analyze a single image. `image_data` is a base64 string, raw bytes, or
+    the `Path` of a spooled upload; it has to be picklable so the call can
+    run in an inference worker process.
+    """
+    return analyze_medical_image_batch(analyzer_key(image_type, source), [image_data], [image_type])[0]
+
+def analyze_medical_image_batch(analyzer: str, images: list, image_types: Optional[List[str]] = None):
+    """
+    Analyze several images with one analyzer (see `analyzer_key`) in one model
+    call and return one result per image, in input order. Accepts the same
+    image payloads as `analyze_medical_image`; `image_types` selects the
+    decoder of each image. An image that could not be decoded gets no
+    findings and an `error` saying why instead.
+    """
+    if not images:
+        return []
+    # numpy and Pillow are only needed where analysis actually runs, not in
+    # web workers that hand it to an inference process
+    from .preprocessing import preprocess_batch
+
+    _, modality = parse_analyzer_key(analyzer)
+    batch = preprocess_batch(modality, images, image_types=image_types)
+    if not batch.valid.all():
+        logger.debug("%d of %d %s images could not be decoded", (~batch.valid).sum(), len(batch), analyzer)
+
+    with registry.use(analyzer) as backend:
+        results = backend.predict_batch(batch)
+    for index, error in enumerate(batch.errors):
+        if error is not None:
+            results[index] = {"findings": [], "confidence_scores": {}, "error": error}
+    return results
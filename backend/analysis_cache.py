@@ -0,0 +1,198 @@
+"""
+Content-addressed cache for analysis output.
+
+Entries are keyed by the SHA-256 of the decoded image bytes, the modality and
+the analyzer version, so re-uploads of the same study skip inference. There
+is an in-process LRU tier and an optional Redis tier shared between workers.
+Identical requests that arrive while one is already being analyzed wait for
+that run instead of starting their own.
+"""
+import asyncio
+import base64
+import binascii
+import copy
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .analysis import ANALYZER_VERSION
+from .analyzers import DEFAULT_SOURCE, analyzer_key
+from .metrics import CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+
+def decode_image_data(image_data: str) -> bytes:
+    """Decode a base64 image, accepting an optional data URL prefix."""
+    if image_data.startswith("data:") and "," in image_data:
+        image_data = image_data.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_data)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid base64 image data")
+
+
+def decode_and_hash(image_data: str) -> Tuple[bytes, str]:
+    """Decode a base64 image; returns the bytes and their SHA-256."""
+    image_bytes = decode_image_data(image_data)
+    return image_bytes, hashlib.sha256(image_bytes).hexdigest()
+
+
+class LocalCacheTier:
+    """LRU of serialized results bounded by entry count, total bytes and TTL."""
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 86400):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, blob = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return blob
+
+    def set(self, key: str, blob: bytes):
+        if len(blob) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, blob)
+        self.size += len(blob)
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str):
+        _, blob = self._entries.pop(key)
+        self.size -= len(blob)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCacheTier:
+    """Shared tier; Redis enforces the TTL, and its maxmemory policy bounds size."""
+
+    def __init__(self, url: str, ttl: float = 86400, max_value_bytes: int = 1024 * 1024):
+        import redis.asyncio as redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.max_value_bytes = max_value_bytes
+
+    async def get(self, key: str) -> Optional[bytes]:
+        try:
+            return await self.client.get(key)
+        except Exception as e:
+            logger.warning("Analysis cache Redis read failed: %s", e)
+            return None
+
+    async def set(self, key: str, blob: bytes):
+        if len(blob) > self.max_value_bytes:
+            return
+        try:
+            await self.client.set(key, blob, ex=self.ttl)
+        except Exception as e:
+            logger.warning("Analysis cache Redis write failed: %s", e)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AnalysisCache:
+    def __init__(
+        self,
+        local: Optional[LocalCacheTier] = None,
+        redis_tier: Optional[RedisCacheTier] = None,
+        version: str = ANALYZER_VERSION,
+        enabled: bool = True,
+    ):
+        self.local = local or LocalCacheTier()
+        self.redis = redis_tier
+        self.version = version
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+    def key(self, image_sha256: str, image_type: str, source: str = DEFAULT_SOURCE) -> str:
+        return f"analysis:{self.version}:{analyzer_key(image_type, source)}:{image_sha256}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        blob = self.local.get(key)
+        if blob is None and self.redis is not None:
+            blob = await self.redis.get(key)
+            if blob is not None:
+                self.local.set(key, blob)
+        return json.loads(blob) if blob is not None else None
+
+    async def set(self, key: str, result: Dict[str, Any]):
+        blob = json.dumps(result, separators=(",", ":")).encode()
+        self.local.set(key, blob)
+        if self.redis is not None:
+            await self.redis.set(key, blob)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Return `(result, cache_hit)`. Concurrent callers with the same key
+        share one `compute()` run; failures are never cached.
+        """
+        if not self.enabled:
+            return await compute(), False
+
+        cached = await self.get(key)
+        if cached is not None:
+            self.hits += 1
+            CACHE_LOOKUPS.labels("hit").inc()
+            return cached, True
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            CACHE_LOOKUPS.labels("coalesced").inc()
+            result = await asyncio.shield(task)
+            return copy.deepcopy(result), True
+
+        self.misses += 1
+        CACHE_LOOKUPS.labels("miss").inc()
+        task = asyncio.ensure_future(self._compute_and_store(key, compute))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result), False
+
+    async def _compute_and_store(self, key: str, compute):
+        result = await compute()
+        await self.set(key, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "local_entries": len(self.local),
+            "local_bytes": self.local.size,
+            "redis": self.redis is not None,
+        }
+
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.close()
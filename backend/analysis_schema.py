@@ -0,0 +1,243 @@
+"""
+Versioned storage representation of analysis_results documents.
+
+Version 1 is the API shape stored as is. Version 2 (`"v": 2`) keeps the same
+top-level field names, so indexes, sorts and projections keep working, but
+stores the bulky parts compactly:
+
+- `id` and `user_id` as binary UUIDs (18 bytes instead of 37) when they are
+  UUIDs, which ours are;
+- each finding as `{"n": name, "l": location, "s": severity, "d":
+  description, "r": recommendation}`, where the values are integer codes
+  from the shared `analysis_vocabulary` collection instead of the strings;
+  the boilerplate texts repeated across millions of results become one
+  vocabulary entry each;
+- `confidence_scores` keyed by the vocabulary code of the label;
+- `cache_hit` only when true.
+
+Strings longer than `max_term_length` (and non-string values) are stored
+inline under their usual field name rather than interned, so free text does
+not grow the vocabulary without bound. The
+vocabulary is append-only: a code never changes meaning, so every process
+caches it forever.
+
+Reads accept both versions, so results can be migrated in the background
+(`python -m backend.manage migrate-analysis-schema`) while the API runs.
+"""
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from bson.binary import Binary, UuidRepresentation
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+SCHEMA_VERSION = 2
+
+# Finding keys that are dictionary-encoded, and their stored names
+FINDING_FIELDS = {
+    "name": "n",
+    "location": "l",
+    "severity": "s",
+    "description": "d",
+    "recommendation": "r",
+}
+STORED_FINDING_FIELDS = {stored: field for field, stored in FINDING_FIELDS.items()}
+
+COUNTER_ID = "next_code"
+
+
+def encode_uuid(value: Any) -> Any:
+    """A UUID string as a binary UUID; anything else unchanged."""
+    if isinstance(value, str):
+        try:
+            return Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+        except ValueError:
+            pass
+    return value
+
+
+def decode_uuid(value: Any) -> Any:
+    if isinstance(value, Binary):
+        return str(value.as_uuid(UuidRepresentation.STANDARD))
+    return value
+
+
+class Vocabulary:
+    """
+    Term <-> integer code mapping shared by all workers. Each term is one
+    `{"_id": code, "t": term}` document; codes come from a counter document.
+    """
+
+    def __init__(self, collection=None, max_term_length: int = 512):
+        self.collection = collection
+        self.max_term_length = max_term_length
+        self._codes: Dict[str, int] = {}
+        self._terms: Dict[int, str] = {}
+
+    def interned(self, value: Any) -> bool:
+        return isinstance(value, str) and len(value) <= self.max_term_length
+
+    def _remember(self, documents: Iterable[Dict[str, Any]]):
+        for document in documents:
+            self._codes[document["t"]] = document["_id"]
+            self._terms[document["_id"]] = document["t"]
+
+    async def codes(self, terms: Iterable[str]) -> Dict[str, int]:
+        """Codes for `terms`, allocating the ones nobody has used yet."""
+        missing = {term for term in terms if term not in self._codes}
+        if missing:
+            self._remember(await self.collection.find({"t": {"$in": list(missing)}}).to_list(None))
+            missing -= self._codes.keys()
+        if missing:
+            counter = await self.collection.find_one_and_update(
+                {"_id": COUNTER_ID}, {"$inc": {"n": len(missing)}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            first = counter["n"] - len(missing) + 1
+            documents = [{"_id": first + offset, "t": term} for offset, term in enumerate(sorted(missing))]
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                # Another worker interned some of these first; use its codes
+                raced = {documents[error["index"]]["t"] for error in e.details.get("writeErrors", [])
+                         if error.get("code") == 11000}
+                if len(raced) != len(e.details.get("writeErrors", [])):
+                    raise
+                documents = [document for document in documents if document["t"] not in raced]
+                self._remember(await self.collection.find({"t": {"$in": list(raced)}}).to_list(None))
+            self._remember(documents)
+        return self._codes
+
+    async def terms(self, codes: Iterable[int]) -> Dict[int, str]:
+        missing = [code for code in set(codes) if code not in self._terms]
+        if missing:
+            self._remember(await self.collection.find({"_id": {"$in": missing}}).to_list(None))
+        return self._terms
+
+    def stats(self) -> Dict[str, Any]:
+        return {"cached_terms": len(self._terms)}
+
+
+class AnalysisCodec:
+    """
+    Converts analysis documents between the API shape and their stored form.
+    With `compact` false, new documents are stored as version 1; stored
+    documents of either version are always read back.
+    """
+
+    def __init__(self, vocabulary: Vocabulary, compact: bool = False):
+        self.vocabulary = vocabulary
+        self.compact = compact
+
+    # Queries
+
+    def stored_id(self, value: str) -> Any:
+        """How an id written now is stored (write-behind keys, cursor tie-breaks)."""
+        return encode_uuid(value) if self.compact else value
+
+    @staticmethod
+    def match_id(value: str) -> Any:
+        """Query value matching an id or user id stored in either version."""
+        encoded = encode_uuid(value)
+        return value if encoded is value else {"$in": [value, encoded]}
+
+    @staticmethod
+    def projection(projection: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+        """Extend an API-field projection to the stored fields both versions need."""
+        if not projection:
+            return projection
+        projection = dict(projection, v=1)
+        for field, stored in FINDING_FIELDS.items():
+            if projection.pop(f"findings.{field}", None):
+                projection[f"findings.{field}"] = 1
+                projection[f"findings.{stored}"] = 1
+        return projection
+
+    # Writes
+
+    async def encode_many(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if not self.compact:
+            return documents
+        terms: Set[str] = set()
+        for document in documents:
+            for finding in document.get("findings") or ():
+                terms.update(value for field, value in finding.items()
+                             if field in FINDING_FIELDS and self.vocabulary.interned(value))
+            terms.update(label for label in (document.get("confidence_scores") or {})
+                         if self.vocabulary.interned(label))
+        codes = await self.vocabulary.codes(terms) if terms else {}
+        return [self._encode(document, codes) for document in documents]
+
+    async def encode(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return (await self.encode_many([document]))[0]
+
+    def _encode(self, document: Dict[str, Any], codes: Dict[str, int]) -> Dict[str, Any]:
+        if document.get("v") == SCHEMA_VERSION:
+            return document
+        stored = {key: value for key, value in document.items() if key != "cache_hit"}
+        stored["v"] = SCHEMA_VERSION
+        stored["id"] = encode_uuid(document["id"])
+        stored["user_id"] = encode_uuid(document["user_id"])
+        if document.get("cache_hit"):
+            stored["cache_hit"] = True
+        if "findings" in document:
+            stored["findings"] = [self._encode_finding(finding, codes) for finding in document["findings"]]
+        if "confidence_scores" in document:
+            # Labels too long to intern stay strings; codes are stored as their decimal string
+            stored["confidence_scores"] = {
+                str(codes[label]) if label in codes else f"={label}": score
+                for label, score in document["confidence_scores"].items()
+            }
+        return stored
+
+    @staticmethod
+    def _encode_finding(finding: Dict[str, Any], codes: Dict[str, int]) -> Dict[str, Any]:
+        # Interned values move to the short key; anything else keeps its field as is
+        stored = {}
+        for field, value in finding.items():
+            if field in FINDING_FIELDS and isinstance(value, str) and value in codes:
+                stored[FINDING_FIELDS[field]] = codes[value]
+            else:
+                stored[field] = value
+        return stored
+
+    # Reads
+
+    async def decode_many(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The API shape of stored documents of any version (and any projection of them)."""
+        codes: Set[int] = set()
+        for document in documents:
+            if document.get("v") == SCHEMA_VERSION:
+                for finding in document.get("findings") or ():
+                    codes.update(value for field, value in finding.items() if field in STORED_FINDING_FIELDS)
+                codes.update(int(label) for label in (document.get("confidence_scores") or {})
+                             if not label.startswith("="))
+        terms = await self.vocabulary.terms(codes) if codes else {}
+        return [self._decode(document, terms) for document in documents]
+
+    async def decode(self, document: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if document is None:
+            return None
+        return (await self.decode_many([document]))[0]
+
+    @staticmethod
+    def _decode(document: Dict[str, Any], terms: Dict[int, str]) -> Dict[str, Any]:
+        version = document.get("v", 1)
+        decoded = {key: value for key, value in document.items() if key not in ("_id", "v")}
+        if version != SCHEMA_VERSION:
+            return decoded
+        for field in ("id", "user_id"):
+            if field in decoded:
+                decoded[field] = decode_uuid(decoded[field])
+        if "findings" in decoded:
+            decoded["findings"] = [
+                {STORED_FINDING_FIELDS.get(field, field): terms[value] if field in STORED_FINDING_FIELDS else value
+                 for field, value in finding.items()}
+                for finding in decoded["findings"]
+            ]
+        if "confidence_scores" in decoded:
+            decoded["confidence_scores"] = {
+                label[1:] if label.startswith("=") else terms[int(label)]: score
+                for label, score in decoded["confidence_scores"].items()
+            }
+        return decoded
@@ -0,0 +1,154 @@
+"""
+Per-user analysis statistics for the dashboard.
+
+Every stored analysis is folded into one summary document per user
+(`analysis_stats`, keyed by user id) with a single atomic `$inc`: counts per
+image type, how often each finding was reported, and a histogram of every
+confidence score. Reading the dashboard numbers is then one `find_one`,
+however many analyses the user has.
+
+Summaries are derived data. If they drift (e.g. an update failed after the
+analysis itself was stored) or predate this module, rebuild them from
+`analysis_results` with `python -m backend.manage rebuild-analysis-stats`.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set
+from urllib.parse import unquote
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Confidence histograms have HISTOGRAM_BUCKETS equal-width buckets over [0, 1]
+HISTOGRAM_BUCKETS = 10
+
+
+def _encode(name: str) -> str:
+    """Image types, finding names and score labels as safe field names ("." and "$" percent-escaped)."""
+    return str(name).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def _decode(field: str) -> str:
+    return unquote(field)
+
+
+def _bucket(score: float) -> int:
+    return min(HISTOGRAM_BUCKETS - 1, max(0, int(float(score) * HISTOGRAM_BUCKETS)))
+
+
+def _accumulate(documents: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Per user: the `$inc` counters, first and last timestamps of `documents`."""
+    users: Dict[str, Dict[str, Any]] = {}
+    for document in documents:
+        user = users.setdefault(
+            document["user_id"],
+            {"inc": defaultdict(int), "first": document["timestamp"], "last": document["timestamp"]},
+        )
+        counters = user["inc"]
+        counters["total"] += 1
+        counters[f"image_types.{_encode(document['image_type'])}"] += 1
+        for finding in document.get("findings", ()):
+            if finding.get("name"):
+                counters[f"findings.{_encode(finding['name'])}"] += 1
+        for label, score in (document.get("confidence_scores") or {}).items():
+            label = _encode(label)
+            counters[f"confidence.{label}.count"] += 1
+            counters[f"confidence.{label}.sum"] += float(score)
+            counters[f"confidence.{label}.buckets.{_bucket(score)}"] += 1
+        user["first"] = min(user["first"], document["timestamp"])
+        user["last"] = max(user["last"], document["timestamp"])
+    return users
+
+
+class AnalysisStats:
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.failed_updates = 0
+
+    async def record(self, documents: List[Dict[str, Any]]):
+        """
+        Fold stored analysis documents into their users' summaries. Failures
+        are logged, not raised: the analyses themselves are already stored.
+        """
+        if not documents:
+            return
+        now = datetime.utcnow()
+        updates = [
+            UpdateOne(
+                {"_id": user_id},
+                {
+                    "$inc": dict(user["inc"]),
+                    "$min": {"first_analysis_at": user["first"]},
+                    "$max": {"last_analysis_at": user["last"]},
+                    "$set": {"updated_at": now},
+                },
+                upsert=True,
+            )
+            for user_id, user in _accumulate(documents).items()
+        ]
+        try:
+            await self.collection.bulk_write(updates, ordered=False)
+        except PyMongoError as e:
+            self.failed_updates += 1
+            logger.error("Could not update analysis stats for %d analyses: %s", len(documents), e)
+
+    async def get(self, user_id: str) -> Dict[str, Any]:
+        """The user's summary in API shape (all zeros for a user without analyses)."""
+        return self.present(await self.collection.find_one({"_id": user_id}))
+
+    @staticmethod
+    def present(summary: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        summary = summary or {}
+        confidence = {}
+        for label, histogram in (summary.get("confidence") or {}).items():
+            count = histogram.get("count", 0)
+            buckets = histogram.get("buckets", {})
+            confidence[_decode(label)] = {
+                "count": count,
+                "mean": histogram.get("sum", 0.0) / count if count else None,
+                "buckets": [buckets.get(str(index), 0) for index in range(HISTOGRAM_BUCKETS)],
+            }
+        return {
+            "total": summary.get("total", 0),
+            "image_types": {_decode(name): count for name, count in (summary.get("image_types") or {}).items()},
+            "findings": {_decode(name): count for name, count in (summary.get("findings") or {}).items()},
+            "confidence": confidence,
+            "first_analysis_at": summary.get("first_analysis_at"),
+            "last_analysis_at": summary.get("last_analysis_at"),
+        }
+
+    async def rebuild(self, analysis_results, decode=None, batch_size: int = 1000) -> int:
+        """
+        Recompute every summary from `analysis_results`; returns the number of
+        users. `decode` turns a batch of stored documents back into the API
+        shape (see `AnalysisCodec.decode_many`). Analyses stored while a
+        user's summary is being rebuilt may be counted twice, so run it while
+        the API is quiet.
+        """
+        projection = {"_id": 0, "v": 1, "user_id": 1, "image_type": 1, "timestamp": 1,
+                      "findings.name": 1, "findings.n": 1, "confidence_scores": 1}
+        cursor = analysis_results.find({}, projection).sort("user_id", 1).batch_size(batch_size)
+        # A user's results are contiguous per storage version, so a user can
+        # come round twice while the collection is being migrated
+        seen: Set[str] = set()
+        batch: List[Dict[str, Any]] = []
+        async for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                await self._rebuild_batch(batch, decode, seen)
+                batch = []
+        await self._rebuild_batch(batch, decode, seen)
+        return len(seen)
+
+    async def _rebuild_batch(self, batch: List[Dict[str, Any]], decode, seen: Set[str]):
+        documents = await decode(batch) if decode is not None else batch
+        for user_id in {document["user_id"] for document in documents} - seen:
+            await self.collection.delete_one({"_id": user_id})
+            seen.add(user_id)
+        await self.record(documents)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"failed_updates": self.failed_updates}
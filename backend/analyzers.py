@@ -0,0 +1,224 @@
+"""
+Analyzer backends and the registry that loads them on demand. Runs inside
+inference workers, so like `analysis` it must not depend on the web app.
+
+Each (source, modality) pair maps to an `AnalyzerBackend` class. Backends are
+instantiated and loaded the first time a batch needs them, and the least
+recently used ones are unloaded when loading another would exceed the
+memory budget. Adding a modality or an external API is a `register()` call;
+nothing is loaded at import time.
+"""
+import copy
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MODALITIES = ("xray", "mri", "other")
+DEFAULT_SOURCE = "zemedic"
+
+
+def modality_for(image_type: str) -> str:
+    """Map a client supplied image type to the modality that analyzes it."""
+    image_type = image_type.lower()
+    return image_type if image_type in MODALITIES else "other"
+
+
+def analyzer_key(image_type: str, source: str = DEFAULT_SOURCE) -> str:
+    """Registry key for an image type: the modality, prefixed by the source unless it is the default one."""
+    modality = modality_for(image_type)
+    return modality if source == DEFAULT_SOURCE else f"{source}:{modality}"
+
+
+def parse_analyzer_key(key: str) -> Tuple[str, str]:
+    source, _, modality = key.rpartition(":")
+    return source or DEFAULT_SOURCE, modality
+
+
+class AnalyzerBackend:
+    """
+    One model. `load()` brings weights into memory, `predict_batch()` turns a
+    `PreprocessedBatch` into one result dict per image, in order.
+    `memory_bytes` is what the loaded model costs against the registry's
+    budget; set it in `load()` if it is only known then.
+    """
+
+    memory_bytes = 0
+
+    def load(self):
+        pass
+
+    def unload(self):
+        pass
+
+    def predict_batch(self, batch) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+class MockAnalyzer(AnalyzerBackend):
+    """Stand-in model returning canned findings (to be replaced with real integrations)."""
+
+    findings: List[Dict[str, Any]] = []
+    confidence_scores: Dict[str, float] = {}
+    memory_bytes = 1024 * 1024
+
+    def predict_batch(self, batch):
+        return [
+            {"findings": copy.deepcopy(self.findings), "confidence_scores": dict(self.confidence_scores)}
+            for _ in range(len(batch))
+        ]
+
+
+class XrayMockAnalyzer(MockAnalyzer):
+    findings = [
+        {"name": "Pneumonia", "location": "Right Lower Lobe", "severity": "Moderate"},
+        {"name": "Pleural Effusion", "location": "Right Side", "severity": "Mild"},
+    ]
+    confidence_scores = {"Pneumonia": 0.94, "Pleural Effusion": 0.78, "Tuberculosis": 0.01}
+
+
+class MriMockAnalyzer(MockAnalyzer):
+    findings = [
+        {"name": "Disc Herniation", "location": "L4-L5", "severity": "Moderate"},
+        {"name": "Spinal Stenosis", "location": "L3-L4", "severity": "Mild"},
+    ]
+    confidence_scores = {"Disc Herniation": 0.89, "Spinal Stenosis": 0.76, "Tumor": 0.02}
+
+
+class GeneralMockAnalyzer(MockAnalyzer):
+    findings = [{"name": "No significant findings", "location": "N/A", "severity": "N/A"}]
+    confidence_scores = {"Normal": 0.95}
+
+
+class GoogleHealthXrayAnalyzer(XrayMockAnalyzer):
+    """
+    Placeholder for the Google Health API: the X-ray mock plus the finding the
+    enhanced analysis would add. In production this would call the API.
+    """
+
+    def predict_batch(self, batch):
+        results = super().predict_batch(batch)
+        for result in results:
+            result["findings"].append({
+                "name": "Improved Analysis with Google Health API",
+                "location": "Full Image",
+                "severity": "Informational",
+                "description": "This analysis is enhanced with Google Health API's advanced machine learning models",
+                "recommendation": "Follow up with your healthcare provider for a detailed consultation",
+            })
+        return results
+
+
+class AnalyzerRegistry:
+    """
+    Lazily loaded analyzer backends with LRU eviction under `memory_budget`
+    bytes (0 means unlimited). Backends in use are never evicted; if they
+    alone exceed the budget, the budget is exceeded rather than failing.
+    Thread-safe, since the thread executor shares one registry.
+    """
+
+    def __init__(self, memory_budget: int = 0):
+        self.memory_budget = memory_budget
+        self._factories: Dict[str, Callable[[], AnalyzerBackend]] = {}
+        self._loaded: "OrderedDict[str, AnalyzerBackend]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.evictions = 0
+
+    def register(self, modality: str, factory: Callable[[], AnalyzerBackend], source: str = DEFAULT_SOURCE):
+        key = analyzer_key(modality, source)
+        with self._lock:
+            self._factories[key] = factory
+            self._unload(key)
+
+    def resolve(self, key: str) -> str:
+        """Fall back to the default source's backend for modalities a source does not cover."""
+        if key in self._factories:
+            return key
+        _, modality = parse_analyzer_key(key)
+        if modality in self._factories:
+            return modality
+        raise KeyError(f"No analyzer registered for {key!r}")
+
+    @property
+    def memory_used(self) -> int:
+        return sum(backend.memory_bytes for backend in self._loaded.values())
+
+    def _unload(self, key: str):
+        backend = self._loaded.pop(key, None)
+        if backend is not None:
+            backend.unload()
+
+    def _evict_for(self, needed: int, keep: Optional[str] = None):
+        if not self.memory_budget:
+            return
+        for key in list(self._loaded):
+            if self.memory_used + needed <= self.memory_budget:
+                return
+            if key == keep or self._in_use.get(key):
+                continue
+            logger.info("Unloading analyzer %s in process %s to stay within the memory budget", key, os.getpid())
+            self._unload(key)
+            self.evictions += 1
+
+    def load(self, key: str) -> AnalyzerBackend:
+        """Return the loaded backend for `key`, loading it (and evicting others) if needed."""
+        key = self.resolve(key)
+        with self._lock:
+            backend = self._loaded.get(key)
+            if backend is not None:
+                self._loaded.move_to_end(key)
+                return backend
+            backend = self._factories[key]()
+            self._evict_for(backend.memory_bytes)
+            backend.load()
+            self._loaded[key] = backend
+            # memory_bytes may only be known once the weights are loaded
+            self._evict_for(0, keep=key)
+            self.loads += 1
+            logger.info("Loaded analyzer %s in process %s", key, os.getpid())
+            return backend
+
+    @contextmanager
+    def use(self, key: str):
+        key = self.resolve(key)
+        with self._lock:
+            backend = self.load(key)
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield backend
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "memory_used": self.memory_used,
+                "memory_budget": self.memory_budget,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+registry = AnalyzerRegistry(
+    memory_budget=int(float(os.environ.get("ANALYZER_MEMORY_BUDGET_MB", 0)) * 1024 * 1024)
+)
+registry.register("xray", XrayMockAnalyzer)
+registry.register("mri", MriMockAnalyzer)
+registry.register("other", GeneralMockAnalyzer)
+registry.register("xray", GoogleHealthXrayAnalyzer, source="google_health")
+
+
+def preload(keys: Optional[List[str]] = None):
+    """Load the given analyzers now instead of on first use (e.g. `ANALYZER_PRELOAD=xray,mri`)."""
+    if keys is None:
+        keys = [key.strip() for key in os.environ.get("ANALYZER_PRELOAD", "").split(",") if key.strip()]
+    for key in keys:
+        registry.load(key)
@@ -0,0 +1,156 @@
+"""
+Micro-batching in front of the inference executor.
+
+Concurrent analysis requests are grouped per analyzer (the modality, e.g.
+xray, mri, other, prefixed by the source for external APIs) and dispatched
+together once a batch is full or the oldest request has waited
+`max_wait_ms`. Each awaiting handler gets back the result for its own image.
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from .analyzers import DEFAULT_SOURCE, MODALITIES, analyzer_key
+from .inference import InferenceExecutor, InferenceQueueFull, InferenceUnavailable
+from .metrics import BATCH_QUEUE_WAIT, BATCH_SIZE, span
+
+
+class BatchMetrics:
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.batch_sizes = Counter()
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, size: int, waits: List[float]):
+        self.batches += 1
+        self.items += size
+        self.batch_sizes[size] += 1
+        self.total_wait += sum(waits)
+        self.max_wait = max(self.max_wait, *waits)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            "avg_queue_wait_ms": 1000 * self.total_wait / self.items if self.items else 0.0,
+            "max_queue_wait_ms": 1000 * self.max_wait,
+        }
+
+
+class MicroBatcher:
+    """
+    Collects `submit()` calls per analyzer and runs them through
+    `batch_fn(analyzer, payloads, image_types)` on the executor, which must
+    return one result per payload in order.
+    """
+
+    def __init__(
+        self,
+        executor: InferenceExecutor,
+        batch_fn: Callable,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        max_queue: int = 256,
+    ):
+        self.executor = executor
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.metrics: Dict[str, BatchMetrics] = {modality: BatchMetrics() for modality in MODALITIES}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._collectors: Dict[str, asyncio.Task] = {}
+        self._in_flight = set()
+
+    async def submit(self, image_type: str, payload, source: str = DEFAULT_SOURCE) -> Dict[str, Any]:
+        """Queue one image for analysis by `source`'s analyzer and wait for its result."""
+        modality = analyzer_key(image_type, source)
+        queue = self._queue(modality)
+        if queue.qsize() >= self.max_queue:
+            raise InferenceQueueFull(self.executor.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((payload, future, time.perf_counter(), image_type))
+        return await future
+
+    def _queue(self, modality: str) -> asyncio.Queue:
+        if modality not in self._queues:
+            self._queues[modality] = asyncio.Queue()
+            self._collectors[modality] = asyncio.create_task(self._collect(modality))
+        return self._queues[modality]
+
+    async def _collect(self, modality: str):
+        queue = self._queues[modality]
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(modality, batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _run_batch(self, modality: str, batch: List[Tuple[Any, asyncio.Future, float, str]]):
+        # Drop requests whose handlers went away while they were queued.
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+        dispatched = time.perf_counter()
+        waits = [dispatched - queued for _, _, queued, _ in batch]
+        self.metrics.setdefault(modality, BatchMetrics()).record(len(batch), waits)
+        BATCH_SIZE.labels(modality).observe(len(batch))
+        for wait in waits:
+            BATCH_QUEUE_WAIT.labels(modality).observe(wait)
+
+        try:
+            with span("analyze_medical_image"):
+                results = await self.executor.run(
+                    self.batch_fn, modality,
+                    [payload for payload, _, _, _ in batch], [image_type for _, _, _, image_type in batch],
+                )
+        except Exception as e:
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": {modality: queue.qsize() for modality, queue in self._queues.items()},
+            "modalities": {modality: metrics.as_dict() for modality, metrics in self.metrics.items()},
+        }
+
+    async def shutdown(self):
+        """Stop collecting new batches and wait for dispatched ones to finish."""
+        for task in self._collectors.values():
+            task.cancel()
+        await asyncio.gather(*self._collectors.values(), return_exceptions=True)
+        for queue in self._queues.values():
+            while not queue.empty():
+                _, future, _, _ = queue.get_nowait()
+                if not future.done():
+                    future.set_exception(InferenceUnavailable())
+        self._collectors.clear()
+        self._queues.clear()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
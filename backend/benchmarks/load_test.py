@@ -0,0 +1,210 @@
+"""
+Local load test for the API.
+
+Runs the FastAPI app in-process against an in-memory Mongo stand-in
+(mongomock-motor) and drives it over ASGI at a fixed concurrency, so numbers
+are comparable between commits without any network or database noise.
+
+    python -m backend.benchmarks.load_test --workload token,analyze,list \\
+        --concurrency 32 --duration 10 --output bench/results.json
+
+Reports requests/s, latency percentiles, status codes and event-loop lag
+(how late a 10 ms timer fires while the workload runs).
+"""
+import asyncio
+import base64
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import typer
+
+cli = typer.Typer(add_completion=False)
+
+WORKLOADS = ("token", "analyze", "list")
+PASSWORD = "benchmark-password"
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(np.array(samples) * 1000, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "max": max(samples) * 1000}
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic timer fires on the running event loop."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, float]:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        return percentiles(self.samples)
+
+
+def setup_app(executor: str, bcrypt_rounds: int):
+    """Import the app with an in-memory database; returns the server module."""
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ["INFERENCE_EXECUTOR"] = executor
+    os.environ["BCRYPT_ROUNDS"] = str(bcrypt_rounds)
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    from mongomock_motor import AsyncMongoMockClient
+
+    from backend import server
+
+    server.bind_database(AsyncMongoMockClient()["zemedic_benchmark"])
+    return server
+
+
+def random_png(size: int = 64) -> str:
+    """A distinct, decodable grayscale PNG of noise (about 4 KB at 64x64), base64 encoded."""
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.frombytes("L", (size, size), os.urandom(size * size)).save(buffer, "PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+async def run_workload(client, name: str, headers: Dict[str, str], concurrency: int, duration: float, unique_images: bool):
+    image = random_png()
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    deadline = time.perf_counter() + duration
+
+    async def one_request():
+        if name == "token":
+            return await client.post("/api/token", data={"username": "bench@example.com", "password": PASSWORD})
+        if name == "analyze":
+            data = random_png() if unique_images else image
+            return await client.post("/api/analyze", json={"image_type": "xray", "image_data": data}, headers=headers)
+        return await client.get("/api/analyses", params={"limit": 50}, headers=headers)
+
+    async def user():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await one_request()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    lag = LoopLagMonitor()
+    lag.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[user() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "latency_ms": percentiles(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "event_loop_lag_ms": await lag.stop(),
+    }
+
+
+async def run_benchmark(workloads: List[str], concurrency: int, duration: float, seed_analyses: int,
+                        executor: str, bcrypt_rounds: int, unique_images: bool):
+    import httpx
+
+    server = setup_app(executor, bcrypt_rounds)
+    async with server.app.router.lifespan_context(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            response = await client.post("/api/users", json={
+                "email": "bench@example.com", "first_name": "Bench", "last_name": "Mark",
+                "role": "doctor", "medical_license_id": "BENCH-1", "password": PASSWORD,
+            })
+            response.raise_for_status()
+            response = await client.post("/api/token", data={"username": "bench@example.com", "password": PASSWORD})
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for _ in range(seed_analyses):
+                response = await client.post("/api/analyze", headers=headers, json={
+                    "image_type": "xray", "image_data": random_png(8),
+                })
+                response.raise_for_status()
+
+            results = {}
+            for name in workloads:
+                results[name] = await run_workload(client, name, headers, concurrency, duration, unique_images)
+                typer.echo(
+                    f"{name:>8}: {results[name]['rps']:8.1f} req/s  "
+                    f"p50 {results[name]['latency_ms']['p50']:7.2f} ms  "
+                    f"p99 {results[name]['latency_ms']['p99']:7.2f} ms  "
+                    f"loop lag p99 {results[name]['event_loop_lag_ms']['p99']:6.2f} ms  "
+                    f"{results[name]['status_codes']}"
+                )
+            return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@cli.command()
+def main(
+    workload: str = typer.Option(",".join(WORKLOADS), help="Comma separated: token, analyze, list"),
+    concurrency: int = typer.Option(16, help="Concurrent simulated clients"),
+    duration: float = typer.Option(5.0, help="Seconds per workload"),
+    seed_analyses: int = typer.Option(200, help="Analyses stored before the list workload"),
+    executor: str = typer.Option("process", help="INFERENCE_EXECUTOR mode: process, thread or inline"),
+    bcrypt_rounds: int = typer.Option(12, help="BCRYPT_ROUNDS for the token workload"),
+    unique_images: bool = typer.Option(True, help="Send a new image per request (cache misses)"),
+    output: Optional[Path] = typer.Option(None, help="Write results as JSON to this file"),
+):
+    workloads = [name.strip() for name in workload.split(",") if name.strip()]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        raise typer.BadParameter(f"Unknown workloads: {', '.join(sorted(unknown))}")
+
+    results = asyncio.run(run_benchmark(
+        workloads, concurrency, duration, seed_analyses, executor, bcrypt_rounds, unique_images
+    ))
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "concurrency": concurrency,
+            "duration_seconds": duration,
+            "executor": executor,
+            "bcrypt_rounds": bcrypt_rounds,
+            "unique_images": unique_images,
+        },
+        "results": results,
+    }
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        typer.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,133 @@
+"""
+Micro-benchmarks for the preprocessing pipeline.
+
+Times decoding per image (by format) and the full decode + normalize pass
+per batch, on synthetic studies, for each modality profile:
+
+    python -m backend.benchmarks.preprocessing --batch-sizes 1,8,32 \\
+        --repeat 20 --output bench/preprocessing.json
+"""
+import io
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import typer
+
+from backend.benchmarks.load_test import git_revision, percentiles
+from backend.preprocessing import PROFILES, RAW_DTYPE, BatchBuffers, decoder_for, normalize_batch, preprocess_batch
+
+cli = typer.Typer(add_completion=False)
+
+
+def synthetic_images(source_size: int, seed: int = 0) -> Dict[str, bytes]:
+    """Encoded test images: 8-bit PNG, 16-bit PNG and JPEG of `source_size` pixels square."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    # Smooth gradients plus noise compress roughly like real radiographs
+    gradient = np.linspace(0, 1, source_size)[None, :] * np.linspace(0.5, 1, source_size)[:, None]
+    pixels = np.clip(gradient + rng.normal(0, 0.05, (source_size, source_size)), 0, 1)
+
+    images = {}
+    for name, array, fmt in (
+        ("png8", (pixels * 255).astype(np.uint8), "PNG"),
+        ("png16", (pixels * 65535).astype(np.uint16), "PNG"),
+        ("jpeg", (pixels * 255).astype(np.uint8), "JPEG"),
+    ):
+        buffer = io.BytesIO()
+        Image.fromarray(array).save(buffer, fmt)
+        images[name] = buffer.getvalue()
+    return images
+
+
+def time_calls(fn, repeat: int) -> List[float]:
+    fn()  # warm-up: allocates buffers, loads codecs
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run(modalities: List[str], batch_sizes: List[int], source_size: int, repeat: int):
+    images = synthetic_images(source_size)
+    results = {}
+    for modality in modalities:
+        profile = PROFILES[modality]
+        decoder = decoder_for(modality)
+        out = np.empty(profile.size, dtype=RAW_DTYPE)
+        decode = {
+            name: percentiles(time_calls(lambda data=data: decoder.decode_into(data, out), repeat))
+            for name, data in images.items()
+        }
+
+        batches = {}
+        buffers = BatchBuffers()
+        for size in batch_sizes:
+            payloads = [images["png8"]] * size
+            total = time_calls(lambda: preprocess_batch(modality, payloads, buffers=buffers), repeat)
+            raw, tensor = buffers.get(modality, size, profile.size)
+            normalize = time_calls(lambda: normalize_batch(raw, tensor[:, 0], profile), repeat)
+            batches[str(size)] = {
+                "batch_ms": percentiles(total),
+                "per_image_ms": float(np.median(total) * 1000 / size),
+                "normalize_ms": percentiles(normalize),
+            }
+        results[modality] = {"input_size": list(profile.size), "decode_ms": decode, "batches": batches}
+
+        typer.echo(f"{modality} {profile.size[0]}x{profile.size[1]}")
+        for name, stats in decode.items():
+            typer.echo(f"  decode {name:>5}: p50 {stats['p50']:7.2f} ms")
+        for size, stats in batches.items():
+            typer.echo(
+                f"  batch {size:>3}: p50 {stats['batch_ms']['p50']:8.2f} ms  "
+                f"{stats['per_image_ms']:6.2f} ms/image  "
+                f"normalize p50 {stats['normalize_ms']['p50']:6.2f} ms"
+            )
+    return results
+
+
+@cli.command()
+def main(
+    modality: str = typer.Option(",".join(PROFILES), help="Comma separated modalities"),
+    batch_sizes: str = typer.Option("1,8,32", help="Comma separated batch sizes"),
+    source_size: int = typer.Option(1024, help="Width and height of the synthetic source images"),
+    repeat: int = typer.Option(20, help="Timed runs per measurement"),
+    output: Optional[Path] = typer.Option(None, help="Write results as JSON to this file"),
+):
+    modalities = [name.strip() for name in modality.split(",") if name.strip()]
+    unknown = set(modalities) - set(PROFILES)
+    if unknown:
+        raise typer.BadParameter(f"Unknown modalities: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in batch_sizes.split(",") if size.strip()]
+
+    results = run(modalities, sizes, source_size, repeat)
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "source_size": source_size,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        typer.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
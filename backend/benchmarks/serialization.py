@@ -0,0 +1,151 @@
+"""
+Serialization cost of analysis list responses.
+
+Times turning a page of stored analysis documents into a response body:
+the default path (build `ImageAnalysisResult`s, validate against the
+`response_model`, stdlib json) against the FAST_SERIALIZATION path (trim
+documents, orjson), and the compact list view (`view=compact`, always
+orjson) against what jsonable_encoder would make of it.
+
+    python -m backend.benchmarks.serialization --results 100 --repeat 200
+"""
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List, Optional
+
+import typer
+
+from backend.benchmarks.load_test import git_revision, percentiles
+
+cli = typer.Typer(add_completion=False)
+
+
+def stored_documents(count: int) -> List[dict]:
+    """Documents shaped like the ones /api/analyze writes to analysis_results."""
+    from backend.analyzers import XrayMockAnalyzer
+
+    now = datetime.utcnow()
+    findings = XrayMockAnalyzer.findings + [{
+        "name": "Improved Analysis with Google Health API",
+        "location": "Full Image",
+        "severity": "Informational",
+        "description": "This analysis is enhanced with Google Health API's advanced machine learning models",
+        "recommendation": "Follow up with your healthcare provider for a detailed consultation",
+    }]
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "user_id": "benchmark-user",
+            "image_type": "xray",
+            "findings": [dict(finding) for finding in findings],
+            "confidence_scores": dict(XrayMockAnalyzer.confidence_scores),
+            "timestamp": now - timedelta(minutes=index),
+            "image_url": f"/api/images/{index:064x}",
+            "image_sha256": f"{index:064x}",
+            "cache_hit": False,
+        }
+        for index in range(count)
+    ]
+
+
+def compact(documents: List[dict]) -> List[dict]:
+    """What the COMPACT_PROJECTION returns from Mongo."""
+    return [
+        {
+            **{key: value for key, value in document.items() if key not in ("findings", "confidence_scores")},
+            "findings": [{"name": f["name"], "severity": f["severity"]} for f in document["findings"]],
+        }
+        for document in documents
+    ]
+
+
+def measure(fn, repeat: int) -> List[float]:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def run(results: int, repeat: int):
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    from backend.serialization import DocumentShaper, json_response
+    from backend.server import ImageAnalysisResult
+
+    documents = stored_documents(results)
+    compact_documents = compact(documents)
+    field = create_response_field(name="response", type_=List[ImageAnalysisResult])
+    shaper = DocumentShaper(ImageAnalysisResult)
+    loop = asyncio.new_event_loop()
+
+    def default_path():
+        models = [ImageAnalysisResult(**document) for document in documents]
+        content = loop.run_until_complete(serialize_response(field=field, response_content=models))
+        return JSONResponse(content).body
+
+    def fast_path():
+        return ORJSONResponse(shaper.shape_many(documents)).body
+
+    def compact_view():
+        return json_response(compact_documents, fast=True).body
+
+    def compact_encoder():
+        return JSONResponse(jsonable_encoder(compact_documents)).body
+
+    report = {}
+    for name, fn in (
+        ("default", default_path),
+        ("fast", fast_path),
+        ("compact", compact_view),
+        ("compact_encoder", compact_encoder),
+    ):
+        report[name] = {"ms": percentiles(measure(fn, repeat)), "bytes": len(fn())}
+        typer.echo(
+            f"{name:>16}: p50 {report[name]['ms']['p50']:7.3f} ms  "
+            f"p99 {report[name]['ms']['p99']:7.3f} ms  {report[name]['bytes']:>7} bytes"
+        )
+    assert json.loads(default_path()) == json.loads(fast_path())
+    assert json.loads(compact_view()) == json.loads(compact_encoder())
+    loop.close()
+    return report
+
+
+@cli.command()
+def main(
+    results: int = typer.Option(100, help="Analyses per response"),
+    repeat: int = typer.Option(200, help="Timed runs per path"),
+    output: Optional[Path] = typer.Option(None, help="Write results as JSON to this file"),
+):
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results_per_response": results,
+            "repeat": repeat,
+        },
+        "results": run(results, repeat),
+    }
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        typer.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,130 @@
+"""
+Cold start cost of a web worker.
+
+Starts fresh interpreters that import the app and run its startup against an
+in-memory database, reporting how long imports, startup steps and the whole
+thing take until the worker would accept traffic, plus which top-level
+packages the import time goes to (from `python -X importtime`).
+
+    python -m backend.benchmarks.startup --runs 5
+    FAST_START=true INFERENCE_EXECUTOR=process python -m backend.benchmarks.startup
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import typer
+
+from backend.benchmarks.load_test import git_revision
+
+cli = typer.Typer(add_completion=False)
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+WORKER = """
+import asyncio, json, time
+started = time.perf_counter()
+from mongomock_motor import AsyncMongoMockClient
+mock = AsyncMongoMockClient()["zemedic_startup"]
+mock_ms = 1000 * (time.perf_counter() - started)
+from backend import server
+imported = time.perf_counter()
+
+async def main():
+    server.bind_database(mock)
+    async with server.app.router.lifespan_context(server.app):
+        ready = time.perf_counter()
+        print(json.dumps({
+            "import_ms": 1000 * (imported - started) - mock_ms,
+            "ready_ms": 1000 * (ready - started) - mock_ms,
+            "report": server.startup_report,
+        }))
+
+asyncio.run(main())
+"""
+
+
+def worker_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    env.setdefault("INFERENCE_EXECUTOR", "inline")
+    return env
+
+
+def run_worker() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER], cwd=REPO_ROOT, env=worker_env(),
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_breakdown(top: int) -> List[dict]:
+    """Self time of every module in `import backend.server`, summed by top-level package."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.server"], cwd=REPO_ROOT,
+        env=worker_env(), capture_output=True, text=True, check=True,
+    ).stderr
+    totals = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = "backend." + name.split(".")[1] if name.startswith("backend.") else name.split(".")[0]
+        totals[package] += int(self_us)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": package, "ms": us / 1000} for package, us in ranked]
+
+
+@cli.command()
+def main(
+    runs: int = typer.Option(5, help="Fresh interpreters to start"),
+    top: int = typer.Option(15, help="Packages to list in the import breakdown"),
+    output: Optional[Path] = typer.Option(None, help="Write results as JSON to this file"),
+):
+    samples = [run_worker() for _ in range(runs)]
+    steps = sorted({step for sample in samples for step in sample["report"]["init_ms"]})
+    results = {
+        "import_ms": statistics.median(sample["import_ms"] for sample in samples),
+        "ready_ms": statistics.median(sample["ready_ms"] for sample in samples),
+        "init_ms": {
+            step: statistics.median(sample["report"]["init_ms"].get(step, 0.0) for sample in samples)
+            for step in steps
+        },
+        "imports": import_breakdown(top),
+    }
+
+    typer.echo(f"ready in {results['ready_ms']:.0f} ms (median of {runs}), imports {results['import_ms']:.0f} ms")
+    for step, ms in results["init_ms"].items():
+        typer.echo(f"  init {step:>20}: {ms:8.1f} ms")
+    for entry in results["imports"]:
+        typer.echo(f"  import {entry['package']:>18}: {entry['ms']:8.1f} ms")
+
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "runs": runs,
+            "fast_start": os.environ.get("FAST_START", "false"),
+            "inference_executor": worker_env()["INFERENCE_EXECUTOR"],
+        },
+        "results": results,
+    }
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        typer.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
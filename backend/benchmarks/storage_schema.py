@@ -0,0 +1,107 @@
+"""
+Stored size of analysis_results documents per storage version.
+
+Encodes a sample of analysis documents in both storage versions and reports
+their BSON size, the vocabulary the compact version needs, and the cost of
+encoding and decoding, against an in-memory database.
+
+    python -m backend.benchmarks.storage_schema --results 10000
+"""
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import bson
+import typer
+
+from backend.benchmarks.load_test import git_revision
+from backend.benchmarks.serialization import stored_documents
+
+cli = typer.Typer(add_completion=False)
+
+
+def sample_documents(count: int, users: int) -> List[dict]:
+    """Like the serialization benchmark's documents, spread over `users` UUID user ids."""
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    documents = stored_documents(count)
+    for index, document in enumerate(documents):
+        document["user_id"] = user_ids[index % users]
+        document["cache_hit"] = index % 5 == 0
+    return documents
+
+
+def sizes(documents: List[dict]) -> dict:
+    lengths = [len(bson.encode(document)) for document in documents]
+    return {"total_bytes": sum(lengths), "mean_bytes": statistics.mean(lengths)}
+
+
+async def run(results: int, users: int):
+    from mongomock_motor import AsyncMongoMockClient
+
+    from backend.analysis_schema import AnalysisCodec, Vocabulary
+
+    vocabulary = AsyncMongoMockClient()["zemedic_schema"].analysis_vocabulary
+    codec = AnalysisCodec(Vocabulary(vocabulary), compact=True)
+    documents = sample_documents(results, users)
+
+    started = time.perf_counter()
+    compact = await codec.encode_many(documents)
+    encode_seconds = time.perf_counter() - started
+    # Decode through a cold vocabulary cache, as a fresh worker would
+    reader = AnalysisCodec(Vocabulary(vocabulary))
+    started = time.perf_counter()
+    decoded = await reader.decode_many(compact)
+    decode_seconds = time.perf_counter() - started
+    # cache_hit=False is left out of compact documents; the API model defaults it
+    assert [dict(document, cache_hit=document.get("cache_hit", False)) for document in decoded] == documents
+
+    vocabulary_documents = await vocabulary.find({}).to_list(None)
+    report = {
+        "v1": sizes(documents),
+        "v2": sizes(compact),
+        "vocabulary": {"terms": len(vocabulary_documents) - 1, **sizes(vocabulary_documents)},
+        "encode_us_per_document": 1e6 * encode_seconds / results,
+        "decode_us_per_document": 1e6 * decode_seconds / results,
+    }
+    report["saved_ratio"] = 1 - report["v2"]["total_bytes"] / report["v1"]["total_bytes"]
+    for version in ("v1", "v2"):
+        typer.echo(f"{version}: {report[version]['mean_bytes']:8.1f} bytes/document, "
+                   f"{report[version]['total_bytes'] / 1024:10.1f} KiB total")
+    typer.echo(f"vocabulary: {report['vocabulary']['terms']} terms, {report['vocabulary']['total_bytes']} bytes")
+    typer.echo(f"saved {100 * report['saved_ratio']:.1f}%; encode {report['encode_us_per_document']:.1f} us, "
+               f"decode {report['decode_us_per_document']:.1f} us per document")
+    return report
+
+
+@cli.command()
+def main(
+    results: int = typer.Option(10000, help="Analysis documents to encode"),
+    users: int = typer.Option(100, help="Distinct users they belong to"),
+    output: Optional[Path] = typer.Option(None, help="Write results as JSON to this file"),
+):
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "results": results,
+            "users": users,
+        },
+        "results": asyncio.run(run(results, users)),
+    }
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        typer.echo(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    cli()
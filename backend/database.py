@@ -0,0 +1,33 @@
+"""
+MongoDB client construction.
+
+Pool sizing and timeouts come from the environment, so they can be tuned per
+deployment. With several web workers every process has its own pool: the
+total connection count is workers x MONGO_MAX_POOL_SIZE.
+"""
+import os
+from typing import Any, Dict, Mapping, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# environment variable -> MongoClient option
+POOL_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE": "maxPoolSize",
+    "MONGO_MIN_POOL_SIZE": "minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS": "maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": "waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS": "connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS": "socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": "serverSelectionTimeoutMS",
+}
+
+
+def mongo_client_options(environ: Mapping[str, str] = os.environ) -> Dict[str, Any]:
+    """MongoClient keyword arguments for the pool settings that are set in `environ`."""
+    return {option: int(environ[name]) for name, option in POOL_OPTIONS.items() if environ.get(name)}
+
+
+def create_client(**kwargs) -> Tuple[AsyncIOMotorClient, Any]:
+    """A client configured from the environment, and the application database."""
+    client = AsyncIOMotorClient(os.environ["MONGO_URL"], **mongo_client_options(), **kwargs)
+    return client, client[os.environ.get("DB_NAME", "zemedic_ai_db")]
@@ -0,0 +1,313 @@
+"""
+Streaming export of stored analyses.
+
+Exports read analysis_results oldest first in `(timestamp, id)` order,
+`batch_size` documents at a time, and turn every batch into output bytes
+before the next one is fetched, so memory stays bounded however long the
+history is. Formats:
+
+- ndjson: one analysis per line, in the API shape;
+- csv and parquet: one row per finding (analyses without findings get one
+  row with empty finding columns), with the analysis columns repeated.
+  Parquet needs the optional `pyarrow` package.
+
+An interrupted export resumes with `after=<id of the last analysis
+received>`. `export_to_path` (used by `python -m backend.manage
+export-analyses`) keeps that checkpoint next to the output itself.
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import HTTPException
+
+ANALYSIS_COLUMNS = ["analysis_id", "user_id", "image_type", "timestamp", "image_sha256", "image_url",
+                    "cache_hit", "api_source"]
+FINDING_COLUMNS = ["finding_index", "finding_name", "finding_location", "finding_severity",
+                   "finding_description", "finding_recommendation"]
+COLUMNS = ANALYSIS_COLUMNS + FINDING_COLUMNS + ["confidence_scores"]
+
+EXPORT_SORT = [("timestamp", 1), ("id", 1)]
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+    PARQUET = "parquet"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+    ExportFormat.PARQUET: "application/vnd.apache.parquet",
+}
+
+
+def export_filter(
+    user_id: Optional[Any] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    image_type: Optional[str] = None,
+    after: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    `since` is inclusive and `until` exclusive. `after` is the stored sort
+    key (`timestamp` and `id`) of the last analysis already exported.
+    """
+    query: Dict[str, Any] = {}
+    if user_id is not None:
+        query["user_id"] = user_id
+    if image_type:
+        query["image_type"] = image_type
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = since
+        if until is not None:
+            query["timestamp"]["$lt"] = until
+    if after is not None:
+        query["$or"] = [
+            {"timestamp": {"$gt": after["timestamp"]}},
+            {"timestamp": after["timestamp"], "id": {"$gt": after["id"]}},
+        ]
+    return query
+
+
+async def resume_point(collection, analysis_id: str, match_id: Callable[[str], Any],
+                       owner: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+    """The stored sort key of an analysis to resume after, if it exists (and belongs to `owner`)."""
+    query = {"id": match_id(analysis_id)}
+    if owner is not None:
+        query["user_id"] = owner
+    return await collection.find_one(query, {"_id": 0, "timestamp": 1, "id": 1})
+
+
+async def iter_batches(collection, query: Dict[str, Any], decode, batch_size: int = 500) -> AsyncIterator[List[dict]]:
+    """Matching analyses in export order, `batch_size` at a time, decoded by `decode`."""
+    cursor = collection.find(query).sort(EXPORT_SORT).batch_size(batch_size)
+    batch = []
+    async for document in cursor:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            yield await decode(batch)
+            batch = []
+    if batch:
+        yield await decode(batch)
+
+
+def flatten(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Tabular rows of one analysis: one per finding."""
+    analysis = {
+        "analysis_id": document["id"],
+        "user_id": document["user_id"],
+        "image_type": document["image_type"],
+        "timestamp": document["timestamp"],
+        "image_sha256": document.get("image_sha256"),
+        "image_url": document.get("image_url"),
+        "cache_hit": document.get("cache_hit", False),
+        "api_source": document.get("api_source"),
+        "confidence_scores": document.get("confidence_scores") or {},
+    }
+    findings = document.get("findings") or [None]
+    return [
+        {
+            **analysis,
+            "finding_index": index if finding is not None else None,
+            "finding_name": (finding or {}).get("name"),
+            "finding_location": (finding or {}).get("location"),
+            "finding_severity": (finding or {}).get("severity"),
+            "finding_description": (finding or {}).get("description"),
+            "finding_recommendation": (finding or {}).get("recommendation"),
+        }
+        for index, finding in enumerate(findings)
+    ]
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class NdjsonWriter:
+    def write(self, documents: List[dict]) -> bytes:
+        return "".join(json.dumps(document, default=_json_default) + "\n" for document in documents).encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class CsvWriter:
+    def __init__(self, header: bool = True):
+        self.header = header
+
+    def write(self, documents: List[dict]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+        if self.header:
+            writer.writeheader()
+            self.header = False
+        for document in documents:
+            for row in flatten(document):
+                row["timestamp"] = row["timestamp"].isoformat()
+                row["confidence_scores"] = json.dumps(row["confidence_scores"])
+                writer.writerow(row)
+        return buffer.getvalue().encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last `drain()`."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data, self._buffer = bytes(self._buffer), bytearray()
+        return data
+
+
+class ParquetWriter:
+    """One row group per batch; the file is complete once `finish()` output is written."""
+
+    def __init__(self):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise HTTPException(status_code=501, detail="Parquet export requires pyarrow on the server")
+
+        self._pa = pa
+        string = pa.string()
+        self.schema = pa.schema([
+            ("analysis_id", string), ("user_id", string), ("image_type", string),
+            ("timestamp", pa.timestamp("ms")), ("image_sha256", string), ("image_url", string),
+            ("cache_hit", pa.bool_()), ("api_source", string),
+            ("finding_index", pa.int32()), ("finding_name", string), ("finding_location", string),
+            ("finding_severity", string), ("finding_description", string), ("finding_recommendation", string),
+            ("confidence_scores", pa.map_(string, pa.float64())),
+        ])
+        self._sink = _Sink()
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression="zstd")
+
+    def write(self, documents: List[dict]) -> bytes:
+        rows = [row for document in documents for row in flatten(document)]
+        for row in rows:
+            row["confidence_scores"] = list(row["confidence_scores"].items())
+        if rows:
+            self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self.schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def create_writer(export_format: ExportFormat, header: bool = True):
+    if export_format == ExportFormat.PARQUET:
+        return ParquetWriter()
+    if export_format == ExportFormat.CSV:
+        return CsvWriter(header=header)
+    return NdjsonWriter()
+
+
+def _write_checkpoint(path: Path, checkpoint: Dict[str, Any]):
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_text(json.dumps(checkpoint))
+    os.replace(temporary, path)
+
+
+async def export_to_path(
+    collection,
+    decode,
+    match_id: Callable[[str], Any],
+    output: Path,
+    export_format: ExportFormat,
+    query: Dict[str, Any],
+    batch_size: int = 500,
+    part_size: int = 100000,
+    resume: bool = False,
+) -> int:
+    """
+    Export to `output` and return the number of analyses written. NDJSON and
+    CSV go to one file, checkpointed after every batch; Parquet goes to a
+    directory of `part-NNNNN.parquet` files of `part_size` analyses,
+    checkpointed after every part. With `resume`, an export interrupted
+    earlier continues from its last checkpoint.
+    """
+    parquet = export_format == ExportFormat.PARQUET
+    if parquet:
+        output.mkdir(parents=True, exist_ok=True)
+        checkpoint_path = output / "_checkpoint.json"
+    else:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        checkpoint_path = output.with_name(output.name + ".checkpoint")
+
+    checkpoint = {"after": None, "offset": 0, "parts": 0, "exported": 0}
+    if resume and checkpoint_path.exists():
+        checkpoint = json.loads(checkpoint_path.read_text())
+    if checkpoint["after"] is not None:
+        after = await resume_point(collection, checkpoint["after"], match_id)
+        if after is None:
+            raise ValueError(f"Checkpointed analysis {checkpoint['after']} no longer exists")
+        query = {**query, **export_filter(after=after)}
+
+    batches = iter_batches(collection, query, decode, batch_size)
+    if parquet:
+        writer, part, in_part = None, None, 0
+        async for batch in batches:
+            if writer is None:
+                part = output / f"part-{checkpoint['parts']:05d}.parquet"
+                partial = part.with_name(part.name + ".partial")
+                writer, sink = ParquetWriter(), open(partial, "wb")
+            sink.write(writer.write(batch))
+            in_part += len(batch)
+            if in_part >= part_size:
+                sink.write(writer.finish())
+                sink.close()
+                os.replace(partial, part)
+                checkpoint.update(after=batch[-1]["id"], parts=checkpoint["parts"] + 1,
+                                  exported=checkpoint["exported"] + in_part)
+                _write_checkpoint(checkpoint_path, checkpoint)
+                writer, in_part = None, 0
+        if writer is not None:
+            sink.write(writer.finish())
+            sink.close()
+            os.replace(partial, part)
+            checkpoint.update(after=batch[-1]["id"], parts=checkpoint["parts"] + 1,
+                              exported=checkpoint["exported"] + in_part)
+            _write_checkpoint(checkpoint_path, checkpoint)
+        return checkpoint["exported"]
+
+    with open(output, "r+b" if checkpoint["offset"] else "wb") as sink:
+        # Drop anything written after the last checkpoint
+        sink.truncate(checkpoint["offset"])
+        sink.seek(checkpoint["offset"])
+        writer = create_writer(export_format, header=checkpoint["offset"] == 0)
+        async for batch in batches:
+            sink.write(writer.write(batch))
+            sink.flush()
+            os.fsync(sink.fileno())
+            checkpoint.update(after=batch[-1]["id"], offset=sink.tell(), exported=checkpoint["exported"] + len(batch))
+            _write_checkpoint(checkpoint_path, checkpoint)
+        sink.write(writer.finish())
+    return checkpoint["exported"]
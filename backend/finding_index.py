@@ -0,0 +1,188 @@
+"""
+Finding-level search index.
+
+analysis_results keeps findings and confidence scores nested inside each
+analysis, which no index can serve "pneumonia findings scored above 0.9
+in the last 30 days" from. Every stored analysis is therefore also written
+out as one `analysis_findings` document per finding, with the finding's
+name (case-folded for matching), severity, the confidence score for that
+name, and the analysis fields needed to filter and link back. Searches
+always match on the name and walk an index in the requested sort order, so
+their cost depends on the page size, not on the size of the collection.
+
+Like the dashboard stats, this is derived data: existing or drifted
+entries are rebuilt with `python -m backend.manage rebuild-finding-index`.
+"""
+import base64
+import binascii
+import json
+import logging
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from pymongo import ReplaceOne
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+
+class FindingSort(str, Enum):
+    NEWEST = "newest"
+    CONFIDENCE = "confidence"
+
+
+SORT_KEYS = {
+    FindingSort.NEWEST: [("timestamp", -1), ("_id", -1)],
+    FindingSort.CONFIDENCE: [("confidence", -1), ("timestamp", -1), ("_id", -1)],
+}
+
+
+def name_key(name: str) -> str:
+    return name.strip().casefold()
+
+
+def finding_documents(analysis: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The index entries of one analysis (in the API shape)."""
+    scores = analysis.get("confidence_scores") or {}
+    return [
+        {
+            "_id": f"{analysis['id']}:{index}",
+            "analysis_id": analysis["id"],
+            "user_id": analysis["user_id"],
+            "image_type": analysis["image_type"],
+            "timestamp": analysis["timestamp"],
+            "name": finding["name"],
+            "name_key": name_key(finding["name"]),
+            "location": finding.get("location"),
+            "severity": finding.get("severity"),
+            "confidence": scores.get(finding["name"]),
+        }
+        for index, finding in enumerate(analysis.get("findings") or ())
+        if finding.get("name")
+    ]
+
+
+def _encode_cursor(document: Dict[str, Any], sort: FindingSort) -> str:
+    key = {"t": document["timestamp"].isoformat(), "i": document["_id"]}
+    if sort == FindingSort.CONFIDENCE:
+        key["c"] = document["confidence"]
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _keyset_filter(cursor: str, sort: FindingSort) -> Dict[str, Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        timestamp, last_id = datetime.fromisoformat(key["t"]), str(key["i"])
+        confidence = float(key["c"]) if sort == FindingSort.CONFIDENCE else None
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    after_time = [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "_id": {"$lt": last_id}},
+    ]
+    if sort == FindingSort.NEWEST:
+        return {"$or": after_time}
+    return {"$or": [
+        {"confidence": {"$lt": confidence}},
+        *({"confidence": confidence, **condition} for condition in after_time),
+    ]}
+
+
+class FindingIndex:
+    def __init__(self, collection=None):
+        self.collection = collection
+        self.failed_updates = 0
+
+    async def record(self, analyses: List[Dict[str, Any]]):
+        """
+        Index the findings of stored analyses. Entries are keyed by analysis
+        and position, so recording an analysis twice is harmless. Failures are
+        logged, not raised: the analyses themselves are already stored.
+        """
+        documents = [document for analysis in analyses for document in finding_documents(analysis)]
+        if not documents:
+            return
+        try:
+            await self.collection.bulk_write(
+                [ReplaceOne({"_id": document["_id"]}, document, upsert=True) for document in documents],
+                ordered=False,
+            )
+        except PyMongoError as e:
+            self.failed_updates += 1
+            logger.error("Could not index findings of %d analyses: %s", len(analyses), e)
+
+    async def search(
+        self,
+        name: str,
+        user_id: Optional[str] = None,
+        severity: Optional[str] = None,
+        image_type: Optional[str] = None,
+        min_confidence: Optional[float] = None,
+        max_confidence: Optional[float] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        sort: FindingSort = FindingSort.NEWEST,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of matching findings and the cursor for the next page (None
+        on the last one). Sorting by confidence leaves out findings that
+        have no score.
+        """
+        query: Dict[str, Any] = {"name_key": name_key(name)}
+        if user_id is not None:
+            query["user_id"] = user_id
+        if severity:
+            query["severity"] = severity
+        if image_type:
+            query["image_type"] = image_type
+        confidence = {}
+        if min_confidence is not None:
+            confidence["$gte"] = min_confidence
+        if max_confidence is not None:
+            confidence["$lte"] = max_confidence
+        if sort == FindingSort.CONFIDENCE:
+            confidence.setdefault("$ne", None)
+        if confidence:
+            query["confidence"] = confidence
+        timestamp = {}
+        if since is not None:
+            timestamp["$gte"] = since
+        if until is not None:
+            timestamp["$lt"] = until
+        if timestamp:
+            query["timestamp"] = timestamp
+        if cursor:
+            query = {"$and": [query, _keyset_filter(cursor, sort)]}
+
+        documents = await self.collection.find(query).sort(SORT_KEYS[sort]).limit(limit + 1).to_list(limit + 1)
+        next_cursor = None
+        if len(documents) > limit:
+            documents = documents[:limit]
+            next_cursor = _encode_cursor(documents[-1], sort)
+        for document in documents:
+            del document["_id"], document["name_key"]
+        return documents, next_cursor
+
+    async def rebuild(self, analysis_results, decode, batch_size: int = 1000) -> int:
+        """Index every stored analysis; `decode` as for `AnalysisStats.rebuild`. Returns the analyses indexed."""
+        projection = {"_id": 0, "v": 1, "id": 1, "user_id": 1, "image_type": 1, "timestamp": 1,
+                      "findings": 1, "confidence_scores": 1}
+        indexed = 0
+        batch = []
+        async for document in analysis_results.find({}, projection).batch_size(batch_size):
+            batch.append(document)
+            if len(batch) >= batch_size:
+                await self.record(await decode(batch))
+                indexed += len(batch)
+                batch = []
+        if batch:
+            await self.record(await decode(batch))
+            indexed += len(batch)
+        return indexed
+
+    def stats(self) -> Dict[str, Any]:
+        return {"failed_updates": self.failed_updates}
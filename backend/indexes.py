@@ -0,0 +1,102 @@
+"""
+MongoDB indexes required by the hot queries, declared in one place.
+
+`IndexManager.ensure()` creates them idempotently (creating an index that
+already exists with the same spec is a no-op) and tracks per-index build
+state for /api/health. Run `python -m backend.manage create-indexes` to
+apply them ahead of a deploy.
+"""
+import logging
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        # get_user() on every authenticated request, duplicate checks on sign-up
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "analysis_results": [
+        # GET /analyses: filter by user, keyset-paginate on (timestamp, id)
+        IndexModel(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("id", DESCENDING)],
+            name="user_timestamp_id",
+        ),
+        # GET /analyses/{id}
+        IndexModel([("id", ASCENDING), ("user_id", ASCENDING)], name="id_user"),
+        # Exports across all users, oldest first
+        IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+        # GET /images/{digest} ownership check
+        IndexModel([("user_id", ASCENDING), ("image_sha256", ASCENDING)], name="user_image_sha256"),
+    ],
+    "analysis_findings": [
+        # GET /findings/search: a finding name, newest first or highest confidence first
+        IndexModel(
+            [("name_key", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="name_timestamp",
+        ),
+        IndexModel(
+            [("name_key", ASCENDING), ("confidence", DESCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="name_confidence",
+        ),
+        # ... within one user's analyses
+        IndexModel(
+            [("user_id", ASCENDING), ("name_key", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_name_timestamp",
+        ),
+        IndexModel(
+            [("user_id", ASCENDING), ("name_key", ASCENDING), ("confidence", DESCENDING),
+             ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_name_confidence",
+        ),
+    ],
+    "analysis_vocabulary": [
+        # Term lookups when encoding; sparse so the code counter document is exempt
+        IndexModel([("t", ASCENDING)], name="term_unique", unique=True, sparse=True),
+    ],
+    "analysis_jobs": [
+        IndexModel([("id", ASCENDING), ("user_id", ASCENDING)], name="id_user"),
+        # Finished or abandoned jobs are only interesting for a week
+        IndexModel([("created_at", ASCENDING)], name="created_at_ttl", expireAfterSeconds=7 * 24 * 60 * 60),
+    ],
+}
+
+
+class IndexManager:
+    def __init__(self, indexes: Dict[str, List[IndexModel]] = REQUIRED_INDEXES):
+        self.indexes = indexes
+        self.state: Dict[str, Dict[str, Any]] = {
+            f"{collection}.{index.document['name']}": {"state": "pending"}
+            for collection, models in indexes.items()
+            for index in models
+        }
+
+    async def ensure(self, db) -> bool:
+        """Create every declared index; returns False if any of them failed."""
+        ok = True
+        for collection, models in self.indexes.items():
+            for index in models:
+                name = f"{collection}.{index.document['name']}"
+                self.state[name] = {"state": "building"}
+                try:
+                    await db[collection].create_indexes([index])
+                except PyMongoError as e:
+                    ok = False
+                    self.state[name] = {"state": "failed", "error": str(e)}
+                    logger.error("Could not build index %s: %s", name, e)
+                else:
+                    self.state[name] = {"state": "ready"}
+        return ok
+
+    def status(self) -> Dict[str, Any]:
+        states = {entry["state"] for entry in self.state.values()}
+        if "failed" in states:
+            overall = "failed"
+        elif states == {"ready"}:
+            overall = "ready"
+        else:
+            overall = "building"
+        return {"state": overall, "indexes": self.state}
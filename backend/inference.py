@@ -0,0 +1,184 @@
+"""
+Inference executor: runs analysis calls off the event loop.
+
+Jobs go to a process pool (or a thread pool, or inline for development)
+behind a bounded admission counter. When the counter is full, new jobs are
+rejected with 429 and a Retry-After estimate instead of queueing forever.
+Each job has a timeout, and pool workers load model weights once at start-up.
+"""
+import asyncio
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+
+from .analysis import load_models
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceQueueFull(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail="Analysis queue is full, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class InferenceTimeout(HTTPException):
+    def __init__(self, timeout: float):
+        super().__init__(status_code=504, detail=f"Analysis did not finish within {timeout:g} seconds")
+
+
+class InferenceUnavailable(HTTPException):
+    def __init__(self):
+        super().__init__(status_code=503, detail="Analysis workers are restarting, please retry")
+
+
+def _warm_up_worker():
+    load_models()
+
+
+def _ping():
+    return True
+
+
+class InferenceExecutor:
+    """
+    Bounded executor for analysis jobs.
+
+    `mode` is "process" (default), "thread" or "inline". `max_queue` caps the
+    number of jobs admitted at once (running plus waiting); a slot is only
+    freed once the underlying job has really finished, so timed-out jobs
+    still count against the limit while a worker is busy with them.
+    """
+
+    def __init__(
+        self,
+        mode: str = "process",
+        workers: int = 2,
+        max_queue: int = 32,
+        timeout: float = 60.0,
+        start_method: str = "spawn",
+        initializer: Optional[Callable] = _warm_up_worker,
+    ):
+        if mode not in ("process", "thread", "inline"):
+            raise ValueError(f"Unknown inference executor mode: {mode}")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.timeout = timeout
+        self.start_method = start_method
+        self.initializer = initializer
+        self.pending = 0
+        self._pool = None
+        # Moving average of job duration, used for Retry-After estimates.
+        self._avg_job_seconds = 1.0
+
+    def _create_pool(self):
+        if self.mode == "process":
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(self.start_method),
+                initializer=self.initializer,
+            )
+        if self.mode == "thread":
+            return ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="inference",
+                initializer=self.initializer,
+            )
+        return None
+
+    async def start(self):
+        """Create the pool and wait until every worker has warmed up."""
+        if self._pool is not None:
+            return
+        self._pool = self._create_pool()
+        if self._pool is None:
+            if self.initializer:
+                self.initializer()
+            return
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        await asyncio.gather(*[loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)])
+        logger.info(
+            "Inference executor ready: %s x%d in %.2fs",
+            self.mode, self.workers, time.perf_counter() - started,
+        )
+
+    async def shutdown(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(
+                None, partial(pool.shutdown, wait=True, cancel_futures=True)
+            )
+
+    def retry_after(self) -> int:
+        backlog = self.pending / self.workers
+        return max(1, math.ceil(backlog * self._avg_job_seconds))
+
+    def _record_duration(self, seconds: float):
+        self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * seconds
+
+    async def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run `fn(*args)` on the executor and return its result."""
+        if self.pending >= self.max_queue:
+            raise InferenceQueueFull(self.retry_after())
+        if self._pool is None and self.mode != "inline":
+            await self.start()
+
+        timeout = self.timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        self.pending += 1
+        started = time.perf_counter()
+
+        if self.mode == "inline":
+            try:
+                return fn(*args)
+            finally:
+                self.pending -= 1
+                self._record_duration(time.perf_counter() - started)
+
+        def release():
+            self.pending -= 1
+            self._record_duration(time.perf_counter() - started)
+
+        def on_done(_):
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:  # event loop already closed during shutdown
+                pass
+
+        pool = self._pool
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            self.pending -= 1
+            await self._restart(pool)
+            raise InferenceUnavailable()
+        future.add_done_callback(on_done)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            future.cancel()
+            raise InferenceTimeout(timeout)
+        except BrokenProcessPool:
+            await self._restart(pool)
+            raise InferenceUnavailable()
+
+    async def _restart(self, broken_pool):
+        if self._pool is not broken_pool:
+            return  # another job already replaced it
+        logger.error("Inference worker pool broke, restarting it")
+        self._pool = None
+        broken_pool.shutdown(wait=False, cancel_futures=True)
+        await self.start()
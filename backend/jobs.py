@@ -0,0 +1,255 @@
+"""
+Asynchronous analysis jobs.
+
+A job is submitted, returns its id immediately and runs in the background.
+Its state (queued -> running -> done/failed) is kept in Mongo so any worker
+can answer polls, and local subscribers get pushed every state change for
+server-sent events. With a `RedisJobEvents` channel, state changes are also
+published to Redis so subscribers on other workers get pushed too instead of
+waiting for the next Mongo poll. The synchronous /analyze endpoint runs
+through the same manager without persisting anything.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set
+
+from bson import json_util
+from fastapi import HTTPException
+
+from .scheduling import FairScheduler, Priority
+
+logger = logging.getLogger(__name__)
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+TERMINAL_STATUSES = (JobStatus.DONE, JobStatus.FAILED)
+
+
+class JobQueueFull(HTTPException):
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=429,
+            detail="Too many analysis jobs queued, please retry later",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+class RedisJobEvents:
+    """Job state changes fanned out to every worker over Redis pub/sub."""
+
+    def __init__(self, url: str, prefix: str = "jobs:"):
+        import redis.asyncio as redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    async def publish(self, job: Dict[str, Any]):
+        try:
+            await self.client.publish(self.prefix + job["id"], json_util.dumps(job))
+        except Exception as e:
+            logger.warning("Could not publish state of analysis job %s: %s", job["id"], e)
+
+    async def forward(self, job_id: str, queue: asyncio.Queue):
+        """Put every state published for the job on `queue` until cancelled."""
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(self.prefix + job_id)
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    queue.put_nowait(json_util.loads(message["data"]))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Subscribers fall back to polling Mongo
+            logger.warning("Job event subscription for %s failed: %s", job_id, e)
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class AnalysisJobManager:
+    """
+    Runs job coroutines through `scheduler` (by default a `FairScheduler`
+    with `max_concurrency` slots), with at most `max_queued` waiting for a
+    slot. `work` must return a Pydantic model (or a plain dict), which
+    becomes the job's `result`. `events` optionally shares state changes
+    with other workers.
+    """
+
+    def __init__(
+        self,
+        collection,
+        max_concurrency: int = 16,
+        max_queued: int = 256,
+        poll_interval: float = 2.0,
+        retry_after: Callable[[], int] = lambda: 1,
+        scheduler: Optional[FairScheduler] = None,
+        events: Optional[RedisJobEvents] = None,
+    ):
+        self.collection = collection
+        self.event_channel = events
+        self.scheduler = scheduler or FairScheduler(max_concurrency)
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.retry_after = retry_after
+        self.queued = 0
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    async def submit(
+        self,
+        user_id: str,
+        image_type: str,
+        work: Callable[[], Awaitable[Any]],
+        background: bool = True,
+        priority: Priority = Priority.ROUTINE,
+    ) -> Dict[str, Any]:
+        """
+        Start a job. Background jobs are persisted for polling and cleaned up
+        on their own; foreground jobs live only in memory and the caller must
+        `wait()` for them.
+        """
+        if self.queued >= self.max_queued:
+            raise JobQueueFull(self.retry_after())
+
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "image_type": image_type,
+            "status": JobStatus.QUEUED,
+            "priority": priority,
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "error": None,
+        }
+        if background:
+            await self.collection.insert_one(dict(job))
+        self._jobs[job["id"]] = job
+        self.queued += 1
+        task = asyncio.create_task(self._run(job, work, background))
+        self._tasks[job["id"]] = task
+        # Also for foreground jobs: their waiter may go away before they finish
+        task.add_done_callback(lambda t: self._discard_task(job["id"], t))
+        return dict(job)
+
+    def _discard_task(self, job_id: str, task: asyncio.Task):
+        self._tasks.pop(job_id, None)
+        if not task.cancelled():
+            task.exception()  # already recorded on the job
+
+    async def _run(self, job: Dict[str, Any], work, persist: bool):
+        waiting = True
+        try:
+            async with self.scheduler.slot(job["user_id"], job["priority"]):
+                self.queued -= 1
+                waiting = False
+                await self._update(job, persist, status=JobStatus.RUNNING)
+                result = await work()
+        except asyncio.CancelledError:
+            await self._update(job, persist, status=JobStatus.FAILED, error="Interrupted by worker shutdown")
+            raise
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else str(e) or type(e).__name__
+            if not isinstance(e, HTTPException):
+                logger.exception("Analysis job %s failed", job["id"])
+            await self._update(job, persist, status=JobStatus.FAILED, error=error)
+            raise
+        else:
+            payload = result.dict() if hasattr(result, "dict") else result
+            await self._update(job, persist, status=JobStatus.DONE, result=payload)
+            return result
+        finally:
+            if waiting:
+                self.queued -= 1
+            self._jobs.pop(job["id"], None)
+
+    async def _update(self, job: Dict[str, Any], persist: bool, **changes):
+        changes["updated_at"] = datetime.utcnow()
+        job.update(changes)
+        if persist:
+            try:
+                await self.collection.update_one({"id": job["id"]}, {"$set": changes})
+            except Exception:
+                logger.exception("Could not persist state of analysis job %s", job["id"])
+            if self.event_channel is not None:
+                await self.event_channel.publish(job)
+        for queue in self._subscribers.get(job["id"], ()):
+            queue.put_nowait(dict(job))
+
+    async def wait(self, job_id: str) -> Any:
+        """Wait for a job started by this worker; re-raises its failure."""
+        return await asyncio.shield(self._tasks[job_id])
+
+    async def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        if job is not None and job["user_id"] == user_id:
+            return dict(job)
+        return await self.collection.find_one({"id": job_id, "user_id": user_id}, {"_id": 0})
+
+    async def events(self, job: Dict[str, Any]) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """
+        Yield the job's state each time it changes, ending after a terminal
+        state. Yields `None` as a keep-alive when nothing changed for
+        `poll_interval`; jobs running on another worker are pushed over the
+        event channel if there is one, and picked up by re-reading Mongo at
+        that point otherwise.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job["id"], set()).add(queue)
+        forwarder = None
+        if self.event_channel is not None and job["id"] not in self._jobs:
+            forwarder = asyncio.create_task(self.event_channel.forward(job["id"], queue))
+        try:
+            snapshot = await self.get(job["id"], job["user_id"]) or job
+            last_status = None
+            while True:
+                if snapshot["status"] != last_status:
+                    last_status = snapshot["status"]
+                    yield snapshot
+                    if last_status in TERMINAL_STATUSES:
+                        return
+                try:
+                    snapshot = await asyncio.wait_for(queue.get(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    yield None
+                    snapshot = await self.get(job["id"], job["user_id"]) or snapshot
+        finally:
+            if forwarder is not None:
+                forwarder.cancel()
+            subscribers = self._subscribers.get(job["id"])
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[job["id"]]
+
+    async def shutdown(self, timeout: Optional[float] = None):
+        """
+        Let running and queued jobs finish. After `timeout` seconds the rest
+        are cancelled and marked failed, so pollers are not left waiting on
+        a job nobody is running.
+        """
+        if self._tasks:
+            tasks = list(self._tasks.values())
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            if pending:
+                logger.warning("Cancelling %d analysis jobs still running at shutdown", len(pending))
+                for task in pending:
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self.event_channel is not None:
+            await self.event_channel.close()
@@ -0,0 +1,186 @@
+"""
+Operational commands that run outside the web server.
+
+    python -m backend.manage create-indexes
+    python -m backend.manage seed-test-users
+    python -m backend.manage rebuild-analysis-stats
+    python -m backend.manage rebuild-finding-index
+    python -m backend.manage migrate-analysis-schema --to 2
+    python -m backend.manage export-analyses --format parquet --output exports/analyses
+"""
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import typer
+from dotenv import load_dotenv
+from pymongo import ReplaceOne
+
+from .analysis_schema import SCHEMA_VERSION, AnalysisCodec, Vocabulary
+from .analysis_stats import AnalysisStats
+from .database import create_client
+from .export import ExportFormat, export_filter, export_to_path
+from .finding_index import FindingIndex
+from .indexes import IndexManager
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+cli = typer.Typer(help="ZemedicAI backend management commands")
+
+
+@cli.callback()
+def main():
+    pass
+
+
+def get_database():
+    return create_client()
+
+
+@cli.command("create-indexes")
+def create_indexes():
+    """Build the MongoDB indexes the API relies on."""
+    async def run():
+        client, db = get_database()
+        try:
+            manager = IndexManager()
+            ok = await manager.ensure(db)
+            for name, entry in manager.state.items():
+                typer.echo(f"{name}: {entry['state']}" + (f" ({entry['error']})" if "error" in entry else ""))
+            return ok
+        finally:
+            client.close()
+
+    if not asyncio.run(run()):
+        raise typer.Exit(code=1)
+
+
+@cli.command("rebuild-analysis-stats")
+def rebuild_analysis_stats():
+    """Recompute every user's dashboard summary from analysis_results."""
+    async def run():
+        client, db = get_database()
+        try:
+            codec = AnalysisCodec(Vocabulary(db.analysis_vocabulary))
+            return await AnalysisStats(db.analysis_stats).rebuild(db.analysis_results, decode=codec.decode_many)
+        finally:
+            client.close()
+
+    typer.echo(f"Rebuilt analysis stats for {asyncio.run(run())} users")
+
+
+@cli.command("rebuild-finding-index")
+def rebuild_finding_index():
+    """Index the findings of every stored analysis for /api/findings/search."""
+    async def run():
+        client, db = get_database()
+        try:
+            codec = AnalysisCodec(Vocabulary(db.analysis_vocabulary))
+            return await FindingIndex(db.analysis_findings).rebuild(db.analysis_results, codec.decode_many)
+        finally:
+            client.close()
+
+    typer.echo(f"Indexed the findings of {asyncio.run(run())} analyses")
+
+
+@cli.command("migrate-analysis-schema")
+def migrate_analysis_schema(
+    to: int = typer.Option(SCHEMA_VERSION, help="Storage version to convert analysis_results to (1 or 2)"),
+    batch_size: int = typer.Option(500, help="Documents converted per bulk write"),
+):
+    """
+    Convert stored analyses between storage versions in place. Safe to run
+    while the API serves traffic and to re-run after an interruption; set
+    ANALYSIS_COMPACT_STORAGE to match so new results are written the same way.
+    """
+    if to not in (1, SCHEMA_VERSION):
+        raise typer.BadParameter(f"Unknown storage version {to}")
+
+    async def run():
+        client, db = get_database()
+        codec = AnalysisCodec(Vocabulary(db.analysis_vocabulary), compact=True)
+        query = {"v": {"$ne": SCHEMA_VERSION}} if to == SCHEMA_VERSION else {"v": SCHEMA_VERSION}
+        converted = 0
+        try:
+            cursor = db.analysis_results.find(query).batch_size(batch_size)
+            batch = []
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) >= batch_size:
+                    converted += await convert(db, codec, batch, to)
+                    batch = []
+            converted += await convert(db, codec, batch, to)
+        finally:
+            client.close()
+        return converted
+
+    typer.echo(f"Converted {asyncio.run(run())} analyses to storage version {to}")
+
+
+async def convert(db, codec, batch, to: int) -> int:
+    if not batch:
+        return 0
+    if to == SCHEMA_VERSION:
+        documents = await codec.encode_many(batch)
+    else:
+        documents = [dict(decoded, _id=original["_id"])
+                     for original, decoded in zip(batch, await codec.decode_many(batch))]
+    # Only replace what is still in the old version, in case the API rewrote it meanwhile
+    await db.analysis_results.bulk_write([
+        ReplaceOne({"_id": document["_id"], "v": original.get("v")}, document)
+        for original, document in zip(batch, documents)
+    ], ordered=False)
+    return len(documents)
+
+
+@cli.command("export-analyses")
+def export_analyses(
+    output: Path = typer.Option(..., help="File to write (a directory of part files for parquet)"),
+    export_format: ExportFormat = typer.Option(ExportFormat.NDJSON, "--format"),
+    user_id: Optional[str] = typer.Option(None, help="Only this user's analyses (default: everyone's)"),
+    since: Optional[datetime] = typer.Option(None, help="Analyses at or after this time"),
+    until: Optional[datetime] = typer.Option(None, help="Analyses before this time"),
+    image_type: Optional[str] = typer.Option(None),
+    batch_size: int = typer.Option(500, help="Analyses read and written per batch"),
+    part_size: int = typer.Option(100000, help="Analyses per parquet part file"),
+    resume: bool = typer.Option(False, help="Continue an interrupted export from its checkpoint"),
+):
+    """Export stored analyses for audits and offline analysis."""
+    async def run():
+        client, db = get_database()
+        codec = AnalysisCodec(Vocabulary(db.analysis_vocabulary))
+        query = export_filter(
+            codec.match_id(user_id) if user_id else None, since, until, image_type
+        )
+        try:
+            return await export_to_path(
+                db.analysis_results, codec.decode_many, codec.match_id, output, export_format, query,
+                batch_size=batch_size, part_size=part_size, resume=resume,
+            )
+        finally:
+            client.close()
+
+    typer.echo(f"Exported {asyncio.run(run())} analyses to {output}")
+
+
+@cli.command("seed-test-users")
+def seed_test_users():
+    """Create the demo patient and doctor accounts (password "testpassword") if missing."""
+    from .server import create_test_users, password_hasher
+
+    async def run():
+        client, db = get_database()
+        try:
+            await create_test_users(db)
+        finally:
+            client.close()
+            password_hasher.shutdown()
+
+    asyncio.run(run())
+    typer.echo("Test users present: patient@example.com, doctor@example.com")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,168 @@
+"""
+Prometheus metrics for the API.
+
+- `PrometheusMiddleware` records per-route latency and in-flight requests,
+  labelled with the route template rather than the raw path.
+- `MongoCommandTimer` is a pymongo command listener timing every Mongo
+  command per collection.
+- Scheduler queue depth and wait time per priority class.
+- `span()` times hot-path sections (inference, JWT decode, bcrypt).
+- `StatsCollector` exposes the in-process stats of the executor, batcher and
+  caches at scrape time.
+"""
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import Response
+
+REQUEST_LATENCY = Histogram(
+    "zemedic_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "zemedic_http_requests_in_flight",
+    "HTTP requests currently being handled",
+    ["method"],
+)
+MONGO_LATENCY = Histogram(
+    "zemedic_mongo_command_duration_seconds",
+    "MongoDB command latency by collection",
+    ["collection", "command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+SPAN_LATENCY = Histogram(
+    "zemedic_span_duration_seconds",
+    "Duration of instrumented hot-path sections",
+    ["span"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+BATCH_SIZE = Histogram(
+    "zemedic_inference_batch_size",
+    "Number of images per inference batch",
+    ["modality"],
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+BATCH_QUEUE_WAIT = Histogram(
+    "zemedic_inference_queue_wait_seconds",
+    "Time an image waited for its batch to be dispatched",
+    ["modality"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "zemedic_scheduler_queue_depth",
+    "Analysis requests waiting for a slot, by priority class",
+    ["priority"],
+)
+SCHEDULER_WAIT = Histogram(
+    "zemedic_scheduler_wait_seconds",
+    "Time an analysis request waited for a slot, by priority class",
+    ["priority"],
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+CACHE_LOOKUPS = Counter(
+    "zemedic_analysis_cache_lookups_total",
+    "Analysis cache lookups by outcome",
+    ["outcome"],
+)
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        SPAN_LATENCY.labels(name).observe(time.perf_counter() - started)
+
+
+class PrometheusMiddleware:
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_flight = REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(
+                method, getattr(route, "path", "unmatched"), str(status["code"])
+            ).observe(time.perf_counter() - started)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Pass to AsyncIOMotorClient(event_listeners=[...])."""
+
+    def __init__(self):
+        self._collections: Dict[Any, str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "-"
+        )
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        MONGO_LATENCY.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+
+class StatsCollector:
+    """Turns the nested numeric `stats()` dicts of in-process components into gauges."""
+
+    def __init__(self, sources: Dict[str, Callable[[], Dict[str, Any]]]):
+        self.sources = sources
+
+    def collect(self):
+        for name, source in self.sources.items():
+            family = GaugeMetricFamily(f"zemedic_{name}", f"In-process {name} statistics", labels=["stat"])
+            for stat, value in _flatten(source()).items():
+                family.add_metric([stat], value)
+            yield family
+
+
+def _flatten(stats: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (bool, int, float)):
+            flat[name] = float(value)
+    return flat
+
+
+def register_stats(sources: Dict[str, Callable[[], Dict[str, Any]]]):
+    REGISTRY.register(StatsCollector(sources))
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
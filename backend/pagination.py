@@ -0,0 +1,61 @@
+"""
+Keyset pagination helpers for list endpoints sorted by `(timestamp, id)`
+descending. Cursors are opaque to clients: URL-safe base64 of the sort key
+of the last item on the previous page.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from fastapi import HTTPException
+
+SORT_ORDER = [("timestamp", -1), ("id", -1)]
+
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    key = {"t": doc["timestamp"].isoformat(), "i": doc["id"]}
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return {"timestamp": datetime.fromisoformat(key["t"]), "id": str(key["i"])}
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(query: Dict[str, Any], cursor: Optional[str] = None, since: Optional[datetime] = None,
+                  stored_id: Callable[[str], Any] = lambda value: value) -> Dict[str, Any]:
+    """
+    Narrow `query` to items after `cursor` in sort order and newer than
+    `since`. `stored_id` maps the cursor's id to how ids are stored.
+    """
+    query = dict(query)
+    if since is not None:
+        query["timestamp"] = {"$gt": since}
+    if cursor:
+        key = decode_cursor(cursor)
+        query["$or"] = [
+            {"timestamp": {"$lt": key["timestamp"]}},
+            {"timestamp": key["timestamp"], "id": {"$lt": stored_id(key["id"])}},
+        ]
+    return query
+
+
+def parse_projection(fields: Optional[str], allowed: Iterable[str]) -> Optional[Dict[str, int]]:
+    """
+    Turn a `fields=a,b` parameter into a Mongo projection. The sort key is
+    always included so the page can produce a cursor.
+    """
+    if not fields:
+        return None
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    projection = {field: 1 for field in requested | {"id", "timestamp"}}
+    projection["_id"] = 0
+    return projection
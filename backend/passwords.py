@@ -0,0 +1,85 @@
+"""
+Password hashing off the event loop.
+
+bcrypt costs 100-300 ms of CPU per call by design. Hashing and verification
+run on a small dedicated thread pool (bcrypt releases the GIL), behind a
+semaphore and a cap on waiting callers, so a login storm queues or gets a
+429 instead of stalling every other request and competing with inference.
+passlib is imported on first use, keeping it out of worker startup.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+
+from .metrics import span
+
+
+class PasswordHasherBusy(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=429,
+            detail="Too many password operations in progress, please retry",
+            headers={"Retry-After": "1"},
+        )
+
+
+class PasswordHasher:
+    """
+    bcrypt with a configurable cost. Hashes made with any other cost are
+    flagged by `verify_and_update`, so they can be rehashed on login.
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 64):
+        self.rounds = rounds
+        self._context = None
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def context(self):
+        if self._context is None:
+            from passlib.context import CryptContext
+
+            self._context = CryptContext(
+                schemes=["bcrypt"],
+                deprecated="auto",
+                bcrypt__rounds=self.rounds,
+                bcrypt__min_rounds=self.rounds,
+                bcrypt__max_rounds=self.rounds,
+            )
+        return self._context
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            raise PasswordHasherBusy()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            self._slots = asyncio.Semaphore(self.workers)
+        self.pending += 1
+        try:
+            async with self._slots:
+                with span("bcrypt"):
+                    return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """Return `(valid, new_hash)`; `new_hash` is set when the stored hash uses a different cost."""
+        return await self._run(self.context.verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            self._slots = None
@@ -0,0 +1,194 @@
+"""
+Image preprocessing ahead of inference. Like `analysis`, this module runs in
+inference worker processes and must not depend on the web app.
+
+A batch of payloads is decoded straight into a reusable, preallocated
+uint16 array (16-bit studies keep their full range, 8-bit images are
+scaled up). The whole batch is then normalized in one vectorized pass into
+a float32 NCHW tensor, which is handed to the analyzer as a view without
+copying.
+
+Decoders are looked up by image type in a registry, so formats such as
+DICOM can be added with `register_decoder()` without touching the pipeline.
+"""
+import base64
+import io
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+RAW_DTYPE = np.uint16
+RAW_MAX = float(np.iinfo(RAW_DTYPE).max)
+
+
+class ImageDecodeError(Exception):
+    pass
+
+
+class ModalityProfile:
+    """
+    Input geometry and normalization for one modality. `fixed` normalization
+    uses dataset-wide `mean`/`std` (on the 0-1 scale); `per_image`
+    standardizes each image on its own statistics, which suits MRI, where
+    intensities are not calibrated between scanners.
+    """
+
+    def __init__(self, size: Tuple[int, int], normalization: str = "fixed", mean: float = 0.0, std: float = 1.0):
+        if normalization not in ("fixed", "per_image"):
+            raise ValueError(f"Unknown normalization {normalization!r}")
+        self.size = size
+        self.normalization = normalization
+        self.mean = mean
+        self.std = std
+
+
+PROFILES: Dict[str, ModalityProfile] = {
+    "xray": ModalityProfile((512, 512), "fixed", mean=0.5, std=0.25),
+    "mri": ModalityProfile((256, 256), "per_image"),
+    "other": ModalityProfile((224, 224), "fixed", mean=0.5, std=0.5),
+}
+
+
+class ImageDecoder:
+    name = "base"
+
+    def decode_into(self, source, out: np.ndarray):
+        """Decode one image (bytes or a file path) into the 2-D uint16 array `out`, resizing to fit."""
+        raise NotImplementedError
+
+
+class RasterDecoder(ImageDecoder):
+    """PNG and JPEG (and anything else Pillow reads), 8 or 16 bits per pixel."""
+
+    name = "raster"
+
+    def decode_into(self, source, out):
+        from PIL import Image, UnidentifiedImageError
+
+        height, width = out.shape
+        try:
+            with Image.open(source if isinstance(source, Path) else io.BytesIO(source)) as image:
+                # JPEG only: decode at a reduced scale instead of full size then downsampling
+                image.draft("L", (width, height))
+                sixteen_bit = image.mode.startswith("I")
+                image = image.convert("I" if sixteen_bit else "L")
+                if image.size != (width, height):
+                    image = image.resize((width, height), Image.BILINEAR)
+                if sixteen_bit:
+                    np.copyto(out, np.asarray(image), casting="unsafe")
+                else:
+                    np.multiply(np.asarray(image), RAW_DTYPE(257), out=out)  # 0-255 -> 0-65535
+        except UnidentifiedImageError as e:
+            raise ImageDecodeError("Unrecognized image format") from e
+        except (Image.DecompressionBombError, OSError, ValueError) as e:
+            raise ImageDecodeError(str(e)) from e
+
+
+_DECODERS: Dict[str, ImageDecoder] = {}
+_DECODERS_BY_IMAGE_TYPE: Dict[str, str] = {}
+DEFAULT_DECODER = "raster"
+
+
+def register_decoder(decoder: ImageDecoder, image_types=()):
+    """Register a decoder and make it the one used for `image_types`."""
+    _DECODERS[decoder.name] = decoder
+    for image_type in image_types:
+        _DECODERS_BY_IMAGE_TYPE[image_type.lower()] = decoder.name
+
+
+def decoder_for(image_type: str) -> ImageDecoder:
+    return _DECODERS[_DECODERS_BY_IMAGE_TYPE.get(image_type.lower(), DEFAULT_DECODER)]
+
+
+register_decoder(RasterDecoder(), image_types=("xray", "mri", "other"))
+
+
+class BatchBuffers(threading.local):
+    """
+    Raw and tensor arrays for each modality, grown to the largest batch seen
+    and reused, so steady-state preprocessing allocates nothing. Each thread
+    gets its own set, for the thread executor.
+    """
+
+    def __init__(self):
+        self._raw: Dict[str, np.ndarray] = {}
+        self._tensor: Dict[str, np.ndarray] = {}
+
+    def get(self, modality: str, count: int, size: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+        raw = self._raw.get(modality)
+        if raw is None or raw.shape[0] < count or raw.shape[1:] != size:
+            raw = self._raw[modality] = np.empty((count, *size), dtype=RAW_DTYPE)
+            self._tensor[modality] = np.empty((count, 1, *size), dtype=np.float32)
+        return raw[:count], self._tensor[modality][:count]
+
+
+_buffers = BatchBuffers()
+
+
+class PreprocessedBatch:
+    """
+    `tensor` is a float32 (N, 1, H, W) view into a reused buffer: it is only
+    valid until the next batch of the same modality is preprocessed in this
+    thread. `valid[i]` is False, and `errors[i]` says why, when image `i`
+    could not be decoded; its plane is all zeros.
+    """
+
+    def __init__(self, tensor: np.ndarray, valid: np.ndarray, errors: List[Optional[str]]):
+        self.tensor = tensor
+        self.valid = valid
+        self.errors = errors
+
+    def __len__(self):
+        return self.tensor.shape[0]
+
+
+def payload_source(image_data):
+    """Turn an analysis payload (base64 string, bytes or spooled file `Path`) into something a decoder opens."""
+    if isinstance(image_data, (bytes, Path)):
+        return image_data
+    if image_data.startswith("data:") and "," in image_data:
+        image_data = image_data.split(",", 1)[1]
+    try:
+        return base64.b64decode(image_data)
+    except ValueError as e:
+        raise ImageDecodeError("Invalid base64 image data") from e
+
+
+def normalize_batch(raw: np.ndarray, out: np.ndarray, profile: ModalityProfile):
+    """Normalize a (N, H, W) uint16 batch into the float32 array `out` of the same shape, in one pass per step."""
+    if profile.normalization == "fixed":
+        np.multiply(raw, np.float32(1 / (RAW_MAX * profile.std)), out=out, casting="unsafe")
+        out -= np.float32(profile.mean / profile.std)
+        return
+    np.multiply(raw, np.float32(1 / RAW_MAX), out=out, casting="unsafe")
+    mean = out.mean(axis=(1, 2), keepdims=True)
+    std = out.std(axis=(1, 2), keepdims=True)
+    out -= mean
+    out /= np.maximum(std, np.float32(1e-6))
+
+
+def preprocess_batch(modality: str, images: list, *, image_types: Optional[List[str]] = None,
+                     buffers: BatchBuffers = _buffers) -> PreprocessedBatch:
+    """
+    Decode and normalize `images` for `modality`. Each image is decoded by the
+    decoder registered for its entry in `image_types` (the modality itself
+    when no image types are given).
+    """
+    profile = PROFILES[modality]
+    raw, tensor = buffers.get(modality, len(images), profile.size)
+    valid = np.ones(len(images), dtype=bool)
+    errors: List[Optional[str]] = [None] * len(images)
+
+    for index, image in enumerate(images):
+        decoder = decoder_for(image_types[index] if image_types else modality)
+        try:
+            decoder.decode_into(payload_source(image), raw[index])
+        except ImageDecodeError as e:
+            raw[index] = 0
+            valid[index] = False
+            errors[index] = str(e)
+
+    normalize_batch(raw, tensor[:, 0], profile)
+    return PreprocessedBatch(tensor, valid, errors)
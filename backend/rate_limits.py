@@ -0,0 +1,253 @@
+"""
+Per-user rate limiting and usage accounting.
+
+Every user gets one token bucket per scope ("read" for cheap lookups,
+"analysis" for inference), sized by their `UserRole`. Buckets live in
+process memory, or in Redis so that all workers share them. Admitted
+requests are also counted per calendar month, which is what subscription
+quotas are enforced against and what `/api/users/me/usage` reports.
+Counters kept in process memory are per worker and reset on restart; use
+Redis when quotas matter.
+
+Redis errors are logged and let the request through: a limiter outage
+should not take the API down with it.
+"""
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ("read", "analysis")
+
+
+class RateLimitExceeded(HTTPException):
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(
+            status_code=429,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+class TokenBucketLimit:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, spec: Optional[str]) -> Optional["TokenBucketLimit"]:
+        """
+        Parse "rate,burst" (e.g. "0.5,10"); empty or a zero rate alone ("0",
+        "0.0") means unlimited. Raises ValueError for anything else that would
+        not admit requests: a rate of zero or less, or a burst below 1.
+        """
+        if not spec or spec.strip() in ("none", "unlimited"):
+            return None
+        rate, _, burst = spec.partition(",")
+        try:
+            rate = float(rate)
+            burst = int(burst) if burst.strip() else None
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {spec!r}: expected \"rate,burst\", e.g. \"0.5,10\"")
+        if rate == 0 and burst is None:
+            return None
+        if not rate > 0:
+            raise ValueError(f"Invalid rate limit {spec!r}: the rate must be positive (or \"0\" for unlimited)")
+        if burst is None:
+            burst = max(1, math.ceil(rate))
+        if burst < 1:
+            raise ValueError(f"Invalid rate limit {spec!r}: the burst must be at least 1")
+        return cls(rate, burst)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {"rate_per_second": self.rate, "burst": self.burst}
+
+
+def current_period(now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m")
+
+
+def seconds_until_next_period(now: Optional[datetime] = None) -> float:
+    now = now or datetime.utcnow()
+    next_month = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+    return (next_month - now).total_seconds()
+
+
+class LocalRateLimitBackend:
+    """Buckets and counters in process memory, bounded to `max_keys` each (least recently used go first)."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._counters: "OrderedDict[str, int]" = OrderedDict()
+
+    async def take(self, key: str, limit: TokenBucketLimit, cost: int = 1) -> Tuple[bool, float]:
+        """Try to take `cost` tokens; returns `(allowed, seconds until enough tokens)`."""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (float(limit.burst), now))
+        tokens = min(float(limit.burst), tokens + (now - updated) * limit.rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (cost - tokens) / limit.rate
+
+    async def incr(self, key: str, amount: int, ttl: float) -> int:
+        value = self._counters.pop(key, 0) + amount
+        self._counters[key] = value
+        if len(self._counters) > self.max_keys:
+            self._counters.popitem(last=False)
+        return value
+
+    async def get_counters(self, keys: List[str]) -> List[int]:
+        return [self._counters.get(key, 0) for key in keys]
+
+    async def close(self):
+        pass
+
+
+# KEYS[1] = bucket; ARGV = rate, burst, cost. Uses the server clock so every
+# worker sees the same time.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisRateLimitBackend:
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        import redis.asyncio as redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key, limit, cost=1):
+        try:
+            allowed, tokens = await self._take(keys=[self.prefix + key], args=[limit.rate, limit.burst, cost])
+        except Exception as e:
+            logger.warning("Rate limiter Redis call failed, allowing request: %s", e)
+            return True, 0.0
+        allowed = bool(int(allowed))
+        return allowed, 0.0 if allowed else (cost - float(tokens)) / limit.rate
+
+    async def incr(self, key, amount, ttl):
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.incrby(self.prefix + key, amount)
+                pipe.expire(self.prefix + key, int(ttl))
+                value, _ = await pipe.execute()
+            return int(value)
+        except Exception as e:
+            logger.warning("Rate limiter Redis counter update failed: %s", e)
+            return 0
+
+    async def get_counters(self, keys):
+        try:
+            values = await self.client.mget([self.prefix + key for key in keys])
+        except Exception as e:
+            logger.warning("Rate limiter Redis counter read failed: %s", e)
+            values = [None] * len(keys)
+        return [int(value) if value is not None else 0 for value in values]
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class RateLimiter:
+    """
+    `limits[scope][role]` is the bucket for that role (None or missing means
+    unlimited); `monthly_quotas[scope][role]` caps admitted requests per
+    calendar month.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        limits: Optional[Dict[str, Dict[str, Optional[TokenBucketLimit]]]] = None,
+        monthly_quotas: Optional[Dict[str, Dict[str, Optional[int]]]] = None,
+        enabled: bool = True,
+    ):
+        self.backend = backend or LocalRateLimitBackend()
+        self.limits = limits or {}
+        self.monthly_quotas = monthly_quotas or {}
+        self.enabled = enabled
+        self.allowed = {scope: 0 for scope in SCOPES}
+        self.rejected = {scope: 0 for scope in SCOPES}
+
+    @staticmethod
+    def _usage_key(scope: str, user_id: str, period: str) -> str:
+        return f"usage:{scope}:{user_id}:{period}"
+
+    async def hit(self, scope: str, user_id: str, role: str, cost: int = 1):
+        """Admit `cost` requests in `scope` for the user, or raise `RateLimitExceeded`."""
+        if not self.enabled:
+            return
+        period = current_period()
+        quota = self.monthly_quotas.get(scope, {}).get(role)
+        if quota is not None:
+            [used] = await self.backend.get_counters([self._usage_key(scope, user_id, period)])
+            if used + cost > quota:
+                self.rejected[scope] += 1
+                raise RateLimitExceeded(
+                    f"Monthly {scope} quota of {quota} reached", seconds_until_next_period()
+                )
+
+        limit = self.limits.get(scope, {}).get(role)
+        if limit is not None:
+            allowed, retry_after = await self.backend.take(f"bucket:{scope}:{user_id}", limit, cost)
+            if not allowed:
+                self.rejected[scope] += 1
+                raise RateLimitExceeded("Too many requests, please slow down", retry_after)
+
+        self.allowed[scope] += 1
+        # Counters outlive their month by a few days so the previous period can still be read
+        await self.backend.incr(
+            self._usage_key(scope, user_id, period), cost, seconds_until_next_period() + 7 * 86400
+        )
+
+    async def usage(self, user_id: str, role: str) -> Dict[str, Any]:
+        period = current_period()
+        counts = await self.backend.get_counters([self._usage_key(scope, user_id, period) for scope in SCOPES])
+        report = {"period": period, "resets_in_seconds": int(seconds_until_next_period()), "scopes": {}}
+        for scope, used in zip(SCOPES, counts):
+            limit = self.limits.get(scope, {}).get(role)
+            quota = self.monthly_quotas.get(scope, {}).get(role)
+            report["scopes"][scope] = {
+                "used": used,
+                "monthly_quota": quota,
+                "remaining": max(0, quota - used) if quota is not None else None,
+                "rate_limit": limit.as_dict() if limit is not None else None,
+            }
+        return report
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "allowed": dict(self.allowed), "rejected": dict(self.rejected)}
+
+    async def close(self):
+        await self.backend.close()
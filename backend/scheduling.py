@@ -0,0 +1,190 @@
+"""
+Priority-aware, fair admission to the analysis path.
+
+Requests wait for one of `max_concurrency` slots. Waiting requests are
+grouped by priority class (stat, routine, bulk) and the most urgent non-empty
+class is served first. Within a class, users share slots by weighted fair
+queuing: every request is tagged with its user's virtual finish time, so one
+user's 200-image backlog interleaves with everyone else's requests instead
+of running ahead of them. A request that has waited longer than its class's
+`max_wait` is served next regardless of class, so bulk work cannot starve.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_WAIT
+
+
+class Priority(str, Enum):
+    STAT = "stat"
+    ROUTINE = "routine"
+    BULK = "bulk"
+
+
+PRIORITY_ORDER = (Priority.STAT, Priority.ROUTINE, Priority.BULK)
+
+
+def bump_priority(priority: Priority) -> Priority:
+    """One class more urgent (stat stays stat)."""
+    return PRIORITY_ORDER[max(0, PRIORITY_ORDER.index(priority) - 1)]
+
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "future", "enqueued", "done")
+
+    def __init__(self, user_id: str, priority: Priority, future: asyncio.Future):
+        self.user_id = user_id
+        self.priority = priority
+        self.future = future
+        self.enqueued = time.monotonic()
+        self.done = False
+
+
+class _PriorityClass:
+    def __init__(self):
+        self.heap: List[Tuple[float, int, _Waiter]] = []
+        self.arrivals: Deque[_Waiter] = deque()
+        self.clock = 0.0
+        self.finish: Dict[str, float] = {}
+        self.depth = 0
+        self.admitted = 0
+        self.aged = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+
+    def oldest(self) -> Optional[_Waiter]:
+        while self.arrivals and self._gone(self.arrivals[0]):
+            self.arrivals.popleft()
+        return self.arrivals[0] if self.arrivals else None
+
+    def pop_fair(self) -> Optional[_Waiter]:
+        while self.heap:
+            tag, _, waiter = heapq.heappop(self.heap)
+            if not self._gone(waiter):
+                self.clock = tag
+                return waiter
+        return None
+
+    def _gone(self, waiter: _Waiter) -> bool:
+        """Admitted or cancelled; a cancellation its `acquire()` has not handled yet is accounted here."""
+        if not waiter.done and waiter.future.done():
+            self.discard(waiter)
+        return waiter.done
+
+    def discard(self, waiter: _Waiter):
+        waiter.done = True
+        self.depth -= 1
+        SCHEDULER_QUEUE_DEPTH.labels(waiter.priority.value).set(self.depth)
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        max_wait: Optional[Dict[Priority, float]] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_wait = max_wait if max_wait is not None else {Priority.ROUTINE: 10.0, Priority.BULK: 30.0}
+        self.active = 0
+        self._classes = {priority: _PriorityClass() for priority in PRIORITY_ORDER}
+        self._sequence = itertools.count()
+
+    async def acquire(self, user_id: str, priority: Priority = Priority.ROUTINE, weight: float = 1.0):
+        """Wait for a slot; every successful `acquire()` must be paired with `release()`."""
+        waiting = self._classes[priority]
+        if self.active < self.max_concurrency and not any(cls.depth for cls in self._classes.values()):
+            self.active += 1
+            self._record_admission(waiting, priority, 0.0)
+            return
+
+        waiter = _Waiter(user_id, priority, asyncio.get_running_loop().create_future())
+        tag = max(waiting.clock, waiting.finish.get(user_id, 0.0)) + 1.0 / weight
+        waiting.finish[user_id] = tag
+        heapq.heappush(waiting.heap, (tag, next(self._sequence), waiter))
+        waiting.arrivals.append(waiter)
+        waiting.depth += 1
+        SCHEDULER_QUEUE_DEPTH.labels(priority.value).set(waiting.depth)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.cancelled():
+                # The slot was handed over just as the caller went away
+                self.release()
+            elif not waiter.done:
+                waiting.discard(waiter)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: Priority = Priority.ROUTINE, weight: float = 1.0):
+        await self.acquire(user_id, priority, weight)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _next(self) -> Optional[_Waiter]:
+        now = time.monotonic()
+        # Starvation protection: whoever has been waiting longest past their class's limit
+        overdue = None
+        for priority, limit in self.max_wait.items():
+            oldest = self._classes[priority].oldest()
+            if oldest is not None and now - oldest.enqueued > limit:
+                if overdue is None or oldest.enqueued < overdue.enqueued:
+                    overdue = oldest
+        if overdue is not None:
+            self._classes[overdue.priority].aged += 1
+            return overdue
+        for priority in PRIORITY_ORDER:
+            waiter = self._classes[priority].pop_fair()
+            if waiter is not None:
+                return waiter
+        return None
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency:
+            waiter = self._next()
+            if waiter is None:
+                return
+            waiting = self._classes[waiter.priority]
+            waiter.done = True
+            waiting.depth -= 1
+            SCHEDULER_QUEUE_DEPTH.labels(waiter.priority.value).set(waiting.depth)
+            if not waiting.depth:
+                # Nobody is backlogged: forget finish times so idle users get no credit
+                waiting.finish.clear()
+            self.active += 1
+            self._record_admission(waiting, waiter.priority, time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    @staticmethod
+    def _record_admission(waiting: _PriorityClass, priority: Priority, waited: float):
+        waiting.admitted += 1
+        waiting.total_wait += waited
+        waiting.max_wait_seen = max(waiting.max_wait_seen, waited)
+        SCHEDULER_WAIT.labels(priority.value).observe(waited)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "classes": {
+                priority.value: {
+                    "queued": waiting.depth,
+                    "admitted": waiting.admitted,
+                    "aged": waiting.aged,
+                    "avg_wait_ms": 1000 * waiting.total_wait / waiting.admitted if waiting.admitted else 0.0,
+                    "max_wait_ms": 1000 * waiting.max_wait_seen,
+                }
+                for priority, waiting in self._classes.items()
+            },
+        }
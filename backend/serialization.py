@@ -0,0 +1,62 @@
+"""
+Fast response serialization for documents the API wrote itself.
+
+Returning Pydantic models from an endpoint validates every document twice
+(once when the model is built, once more against `response_model`) and then
+serializes it with the stdlib json module. Analysis documents in Mongo were
+produced from those same models, so with FAST_SERIALIZATION enabled they are
+trimmed to the model's fields and written straight out with orjson.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import BaseModel
+from pydantic_core import PydanticUndefined
+
+# List views: findings without descriptions and recommendations, no scores
+COMPACT_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "user_id": 1,
+    "image_type": 1,
+    "timestamp": 1,
+    "image_url": 1,
+    "image_sha256": 1,
+    "cache_hit": 1,
+    "findings.name": 1,
+    "findings.severity": 1,
+}
+
+
+class DocumentShaper:
+    """
+    Trims stored documents to a model's fields and fills in defaults for
+    fields older documents lack, which is all the validation our own
+    documents need.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.fields = list(model.model_fields)
+        self.defaults = {
+            name: field.default
+            for name, field in model.model_fields.items()
+            if field.default is not PydanticUndefined
+        }
+
+    def shape(self, document: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            name: document[name] if name in document else self.defaults[name]
+            for name in self.fields
+            if name in document or name in self.defaults
+        }
+
+    def shape_many(self, documents: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [self.shape(document) for document in documents]
+
+
+def json_response(content: Any, fast: bool, headers: Optional[Dict[str, str]] = None, status_code: int = 200):
+    """orjson when `fast`, otherwise FastAPI's usual jsonable_encoder + json path."""
+    if fast:
+        return ORJSONResponse(content, status_code=status_code, headers=headers)
+    return JSONResponse(jsonable_encoder(content), status_code=status_code, headers=headers)
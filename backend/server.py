@@ -1,8 +1,14 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Depends, Form, Body
+import time
+# Startup report: import cost is measured from here
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Depends, Form, Body, Request, Response, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, PyMongoError
 import os
 import logging
 from pathlib import Path
@@ -11,22 +17,55 @@ from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime, timedelta
 import jwt
-from passlib.context import CryptContext
 import json
 import base64
+import asyncio
+from contextlib import asynccontextmanager
 from enum import Enum
 
+# backend/ is a package: start from the repository root with `uvicorn backend.server:app`
+# (as the supervisor config does), not `uvicorn server:app` from inside backend/.
+from .analysis import analyze_medical_image_batch
+from .analysis_cache import AnalysisCache, LocalCacheTier, RedisCacheTier, decode_and_hash
+from .analysis_schema import AnalysisCodec, Vocabulary
+from .analysis_stats import AnalysisStats
+from .analyzers import DEFAULT_SOURCE
+from .batching import MicroBatcher
+from .database import create_client
+from .export import MEDIA_TYPES, ExportFormat, create_writer, export_filter, iter_batches, resume_point
+from .finding_index import FindingIndex, FindingSort
+from .indexes import IndexManager
+from .inference import InferenceExecutor
+from .jobs import AnalysisJobManager, JobStatus, RedisJobEvents
+from .metrics import MongoCommandTimer, PrometheusMiddleware, metrics_endpoint, register_stats, span
+from .pagination import SORT_ORDER, encode_cursor, keyset_filter, parse_projection
+from .passwords import PasswordHasher
+from .rate_limits import LocalRateLimitBackend, RateLimiter, RedisRateLimitBackend, TokenBucketLimit
+from .scheduling import FairScheduler, Priority, bump_priority
+from .serialization import COMPACT_PROJECTION, DocumentShaper, json_response
+from .storage import LocalImageStorage, NullImageStorage, S3ImageStorage
+from .uploads import UploadReceiver
+from .user_cache import UserCache
+from .write_behind import WriteBehindBuffer
+
 # Directory setup
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'zemedic_ai_db')]
+# MongoDB connection: each worker process opens its own pool when the app
+# starts (see `lifespan`), sized by the MONGO_* pool settings
+client = None
+db = None
+
+# Opt-in: orjson responses, and stored analyses are sent without re-validation
+FAST_SERIALIZATION = os.environ.get("FAST_SERIALIZATION", "false").lower() == "true"
 
-# Create the main app without a prefix
-app = FastAPI(title="ZemedicAI API", description="AI-powered medical imaging analysis API")
+# Fast start: accept traffic before inference workers have warmed up; they
+# finish starting in the background (or on the first analysis)
+FAST_START = os.environ.get("FAST_START", "false").lower() == "true"
+
+# How long shutdown waits for in-flight analysis jobs before failing them
+SHUTDOWN_DRAIN_TIMEOUT_SECONDS = float(os.environ.get("SHUTDOWN_DRAIN_TIMEOUT_SECONDS", 30))
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -36,9 +75,148 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "zemedicai_secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 day
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get("BCRYPT_ROUNDS", 12)),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", 2)),
+    max_pending=int(os.environ.get("PASSWORD_HASH_MAX_PENDING", 64)),
+)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
 
+# Authenticated users are cached briefly instead of loaded on every request.
+# With AUTH_TRUST_TOKEN_CLAIMS=true, read-only endpoints skip the lookup
+# entirely and trust the signed user claims in the token.
+user_cache = UserCache(
+    ttl=float(os.environ.get("USER_CACHE_TTL_SECONDS", 30)),
+    max_entries=int(os.environ.get("USER_CACHE_MAX_ENTRIES", 10000)),
+)
+AUTH_TRUST_TOKEN_CLAIMS = os.environ.get("AUTH_TRUST_TOKEN_CLAIMS", "false").lower() == "true"
+
+# Upload setup
+upload_receiver = UploadReceiver(
+    max_memory=int(os.environ.get("UPLOAD_SPOOL_MAX_MEMORY", 1024 * 1024)),
+    max_bytes=int(os.environ.get("UPLOAD_MAX_BYTES", 200 * 1024 * 1024)),
+    tmp_dir=os.environ.get("UPLOAD_TMP_DIR") or None,
+)
+
+# Batch analysis setup
+ANALYZE_BATCH_MAX_FILES = int(os.environ.get("ANALYZE_BATCH_MAX_FILES", 100))
+ANALYZE_BATCH_CONCURRENCY = int(os.environ.get("ANALYZE_BATCH_CONCURRENCY", 8))
+ANALYZE_BATCH_INSERT_CHUNK = int(os.environ.get("ANALYZE_BATCH_INSERT_CHUNK", 50))
+
+# Export setup: analyses read from Mongo and written out per batch
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", 500))
+
+# Inference setup
+inference_executor = InferenceExecutor(
+    mode=os.environ.get("INFERENCE_EXECUTOR", "process"),
+    workers=int(os.environ.get("INFERENCE_WORKERS", 2)),
+    max_queue=int(os.environ.get("INFERENCE_MAX_QUEUE", 32)),
+    timeout=float(os.environ.get("INFERENCE_TIMEOUT_SECONDS", 60)),
+)
+analysis_batcher = MicroBatcher(
+    inference_executor,
+    analyze_medical_image_batch,
+    max_batch_size=int(os.environ.get("BATCH_MAX_SIZE", 8)),
+    max_wait_ms=float(os.environ.get("BATCH_MAX_WAIT_MS", 5)),
+)
+
+# Analysis cache setup
+ANALYSIS_CACHE_TTL_SECONDS = float(os.environ.get("ANALYSIS_CACHE_TTL_SECONDS", 24 * 60 * 60))
+REDIS_URL = os.environ.get("REDIS_URL")
+analysis_cache = AnalysisCache(
+    local=LocalCacheTier(
+        max_entries=int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", 1024)),
+        max_bytes=int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        ttl=ANALYSIS_CACHE_TTL_SECONDS,
+    ),
+    redis_tier=RedisCacheTier(REDIS_URL, ttl=ANALYSIS_CACHE_TTL_SECONDS) if REDIS_URL else None,
+    enabled=os.environ.get("ANALYSIS_CACHE_ENABLED", "true").lower() == "true",
+)
+
+# Rate limiting setup: a token bucket per user and scope, sized by role as
+# "tokens per second,burst" (RATE_LIMIT_<SCOPE>_<ROLE>, empty for unlimited),
+# plus optional monthly quotas (MONTHLY_QUOTA_<SCOPE>_<ROLE>)
+RATE_LIMIT_DEFAULTS = {
+    "read": {"patient": "10,50", "doctor": "20,100", "admin": ""},
+    "analysis": {"patient": "0.2,10", "doctor": "1,30", "admin": ""},
+}
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "redis" if REDIS_URL else "local")
+rate_limiter = RateLimiter(
+    backend=RedisRateLimitBackend(REDIS_URL) if RATE_LIMIT_BACKEND == "redis" else LocalRateLimitBackend(),
+    limits={
+        scope: {
+            role: TokenBucketLimit.parse(os.environ.get(f"RATE_LIMIT_{scope.upper()}_{role.upper()}", default))
+            for role, default in roles.items()
+        }
+        for scope, roles in RATE_LIMIT_DEFAULTS.items()
+    },
+    monthly_quotas={
+        scope: {
+            role: int(os.environ[f"MONTHLY_QUOTA_{scope.upper()}_{role.upper()}"])
+            for role in roles
+            if os.environ.get(f"MONTHLY_QUOTA_{scope.upper()}_{role.upper()}")
+        }
+        for scope, roles in RATE_LIMIT_DEFAULTS.items()
+    },
+    enabled=os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true",
+)
+
+# Image storage setup
+IMAGE_STORAGE_BACKEND = os.environ.get("IMAGE_STORAGE_BACKEND", "local")
+if IMAGE_STORAGE_BACKEND == "s3":
+    image_storage = S3ImageStorage(
+        bucket=os.environ["IMAGE_STORAGE_S3_BUCKET"],
+        prefix=os.environ.get("IMAGE_STORAGE_S3_PREFIX", "images/"),
+        endpoint_url=os.environ.get("IMAGE_STORAGE_S3_ENDPOINT_URL") or None,
+        region_name=os.environ.get("AWS_REGION") or None,
+    )
+elif IMAGE_STORAGE_BACKEND == "local":
+    image_storage = LocalImageStorage(os.environ.get("IMAGE_STORAGE_DIR", ROOT_DIR / "image_store"))
+else:
+    image_storage = NullImageStorage()
+
+# Analysis job setup: every analysis waits for a slot from the fair-share scheduler
+analysis_scheduler = FairScheduler(
+    max_concurrency=int(os.environ.get("ANALYSIS_JOBS_MAX_CONCURRENCY", 16)),
+    max_wait={
+        Priority.ROUTINE: float(os.environ.get("SCHEDULER_MAX_WAIT_ROUTINE_SECONDS", 10)),
+        Priority.BULK: float(os.environ.get("SCHEDULER_MAX_WAIT_BULK_SECONDS", 30)),
+    },
+)
+analysis_jobs = AnalysisJobManager(
+    None,
+    max_queued=int(os.environ.get("ANALYSIS_JOBS_MAX_QUEUED", 256)),
+    retry_after=inference_executor.retry_after,
+    scheduler=analysis_scheduler,
+    events=RedisJobEvents(REDIS_URL) if REDIS_URL else None,
+)
+
+# Write-behind setup: opt-in buffering of analysis_results inserts
+analysis_writes = None
+if os.environ.get("ANALYSIS_WRITE_BEHIND", "false").lower() == "true":
+    analysis_writes = WriteBehindBuffer(
+        None,
+        spill_dir=os.environ.get("ANALYSIS_WRITE_BEHIND_SPILL_DIR", ROOT_DIR / "write_spill"),
+        max_pending=int(os.environ.get("ANALYSIS_WRITE_BEHIND_MAX_PENDING", 10000)),
+        flush_size=int(os.environ.get("ANALYSIS_WRITE_BEHIND_FLUSH_SIZE", 500)),
+        flush_interval=float(os.environ.get("ANALYSIS_WRITE_BEHIND_FLUSH_INTERVAL", 0.25)),
+    )
+
+# Per-user dashboard summaries, updated as results are stored
+analysis_stats = AnalysisStats()
+
+# Finding-level search entries, written alongside every stored result
+finding_index = FindingIndex()
+
+# Storage schema: with ANALYSIS_COMPACT_STORAGE=true new results are stored in
+# the compact version 2 form; either version is read back
+analysis_codec = AnalysisCodec(
+    Vocabulary(max_term_length=int(os.environ.get("ANALYSIS_VOCABULARY_MAX_TERM_LENGTH", 512))),
+    compact=os.environ.get("ANALYSIS_COMPACT_STORAGE", "false").lower() == "true",
+)
+
+index_manager = IndexManager()
+
 # Data Models
 class UserRole(str, Enum):
     PATIENT = "patient"
@@ -78,17 +256,56 @@ class ImageAnalysisResult(BaseModel):
     confidence_scores: Dict[str, float]
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     image_url: Optional[str] = None
+    image_sha256: Optional[str] = None
+    cache_hit: bool = False
+
+analysis_shaper = DocumentShaper(ImageAnalysisResult)
+
+class FindingSearchResult(BaseModel):
+    analysis_id: str
+    user_id: str
+    image_type: str
+    timestamp: datetime
+    name: str
+    location: Optional[str] = None
+    severity: Optional[str] = None
+    confidence: Optional[float] = None
+
+class ConfidenceHistogram(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    buckets: List[int]  # equal-width buckets over [0, 1]
+
+class AnalysisStatsSummary(BaseModel):
+    total: int
+    image_types: Dict[str, int]
+    findings: Dict[str, int]
+    confidence: Dict[str, ConfidenceHistogram]
+    first_analysis_at: Optional[datetime] = None
+    last_analysis_at: Optional[datetime] = None
 
 class AnalysisRequest(BaseModel):
     image_type: str
     image_data: str  # Base64 encoded image
+    priority: Priority = Priority.ROUTINE
+
+class AnalysisJob(BaseModel):
+    id: str
+    user_id: str
+    image_type: str
+    status: JobStatus
+    priority: Priority = Priority.ROUTINE
+    created_at: datetime
+    updated_at: datetime
+    result: Optional[ImageAnalysisResult] = None
+    error: Optional[str] = None
 
 # Authentication functions
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 async def get_user(email: str):
     user = await db.users.find_one({"email": email})
@@ -99,8 +316,13 @@ async def authenticate_user(email: str, password: str):
     user = await get_user(email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        # BCRYPT_ROUNDS changed since this password was stored
+        await db.users.update_one({"id": user.id}, {"$set": {"hashed_password": new_hash}})
+        user_cache.invalidate(user.email)
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -109,72 +331,167 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": str(uuid.uuid4())})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    credentials_exception = HTTPException(
-        status_code=401,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def user_token_claims(user: User):
+    return {
+        "sub": user.email,
+        "role": user.role,
+        "uid": user.id,
+        "first_name": user.first_name,
+        "last_name": user.last_name,
+        "created_at": user.created_at.isoformat(),
+    }
+
+credentials_exception = HTTPException(
+    status_code=401,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+def decode_access_token(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
+        with span("jwt_decode"):
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.PyJWTError:
         raise credentials_exception
-    user = await get_user(email=token_data.username)
-    if user is None:
+    if payload.get("sub") is None:
         raise credentials_exception
+    return payload
+
+async def get_token_user(payload: dict):
+    token_data = TokenData(username=payload["sub"])
+    user = user_cache.get(token_data.username, payload.get("jti"))
+    if user is None:
+        user = await get_user(email=token_data.username)
+        if user is None:
+            raise credentials_exception
+        user_cache.set(token_data.username, payload.get("jti"), user)
     return user
 
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return await get_token_user(decode_access_token(token))
+
+async def get_current_user_readonly(token: str = Depends(oauth2_scheme)):
+    """
+    For endpoints that only read data. Builds the user from the signed token
+    claims when AUTH_TRUST_TOKEN_CLAIMS is enabled; tokens issued before the
+    claims existed fall back to the normal lookup.
+    """
+    payload = decode_access_token(token)
+    if AUTH_TRUST_TOKEN_CLAIMS and "uid" in payload:
+        return User(
+            id=payload["uid"],
+            email=payload["sub"],
+            role=payload["role"],
+            first_name=payload.get("first_name", ""),
+            last_name=payload.get("last_name", ""),
+            created_at=payload.get("created_at") or datetime.utcnow(),
+        )
+    return await get_token_user(payload)
+
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     return current_user
 
-# Mock AI analysis function (to be replaced with real integration)
-def analyze_medical_image(image_type: str, image_data: str):
+async def get_reading_user(current_user: User = Depends(get_current_user_readonly)):
+    """Read-only endpoints: the user, charged against their "read" rate limit."""
+    await rate_limiter.hit("read", current_user.id, current_user.role.value)
+    return current_user
+
+async def get_analysis_user(current_user: User = Depends(get_current_active_user)):
+    """Endpoints that run inference: the user, charged against their "analysis" rate limit and quota."""
+    await rate_limiter.hit("analysis", current_user.id, current_user.role.value)
+    return current_user
+
+def analysis_priority(requested: Optional[str], user: User, default: Priority = Priority.ROUTINE) -> Priority:
     """
-    Mock function to simulate AI analysis of medical images.
-    In production, this would integrate with Google Cloud Healthcare API or another AI service.
+    The scheduling class for a request: stat is reserved for clinicians, and
+    doctors are bumped one class up.
     """
-    # Simulated response
-    if image_type.lower() == "xray":
-        return {
-            "findings": [
-                {"name": "Pneumonia", "location": "Right Lower Lobe", "severity": "Moderate"},
-                {"name": "Pleural Effusion", "location": "Right Side", "severity": "Mild"}
-            ],
-            "confidence_scores": {
-                "Pneumonia": 0.94,
-                "Pleural Effusion": 0.78,
-                "Tuberculosis": 0.01
-            }
-        }
-    elif image_type.lower() == "mri":
-        return {
-            "findings": [
-                {"name": "Disc Herniation", "location": "L4-L5", "severity": "Moderate"},
-                {"name": "Spinal Stenosis", "location": "L3-L4", "severity": "Mild"}
-            ],
-            "confidence_scores": {
-                "Disc Herniation": 0.89,
-                "Spinal Stenosis": 0.76,
-                "Tumor": 0.02
-            }
-        }
+    try:
+        priority = Priority(requested) if requested else default
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Priority must be one of: {', '.join(p.value for p in Priority)}")
+    if user.role == UserRole.DOCTOR:
+        return bump_priority(priority)
+    if priority == Priority.STAT and user.role != UserRole.ADMIN:
+        return Priority.ROUTINE
+    return priority
+
+async def run_analysis(image_type: str, payload, digest: str, source: str = DEFAULT_SOURCE):
+    """
+    Analyze an image through the result cache; returns `(result, cache_hit)`.
+    An image that cannot be decoded raises a 422, so its result is neither
+    cached nor stored.
+    """
+    async def compute():
+        result = await analysis_batcher.submit(image_type, payload, source)
+        if result.get("error"):
+            raise HTTPException(status_code=422, detail=f"Image could not be decoded: {result['error']}")
+        return result
+
+    with span("analysis"):
+        return await analysis_cache.get_or_compute(analysis_cache.key(digest, image_type, source), compute)
+
+async def store_analysis_result(result: ImageAnalysisResult, **extra_fields):
+    document = {**result.dict(), **extra_fields}
+    stored = await analysis_codec.encode(document)
+    if analysis_writes is not None:
+        # The buffer spills to disk, so the write is as good as done
+        await analysis_writes.put(stored)
     else:
-        return {
-            "findings": [
-                {"name": "No significant findings", "location": "N/A", "severity": "N/A"}
-            ],
-            "confidence_scores": {
-                "Normal": 0.95
-            }
-        }
+        await db.analysis_results.insert_one(stored)
+    await asyncio.gather(analysis_stats.record([document]), finding_index.record([document]))
+
+async def store_analysis_results(results: List[ImageAnalysisResult]) -> Dict[int, str]:
+    """Insert many results in one round trip; returns the errors of the ones that failed, by position."""
+    if not results:
+        return {}
+    documents = [result.dict() for result in results]
+    stored = await analysis_codec.encode_many(documents)
+    errors = {}
+    if analysis_writes is not None:
+        for document in stored:
+            await analysis_writes.put(document)
+    else:
+        try:
+            await db.analysis_results.insert_many(stored, ordered=False)
+        except BulkWriteError as e:
+            errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details.get("writeErrors", [])}
+        except PyMongoError as e:
+            logging.error(f"Could not store {len(results)} analysis results: {e}")
+            return {index: "Could not store the analysis result" for index in range(len(results))}
+    stored_documents = [document for index, document in enumerate(documents) if index not in errors]
+    await asyncio.gather(analysis_stats.record(stored_documents), finding_index.record(stored_documents))
+    return errors
+
+async def analyze_payload(user_id: str, image_type: str, payload, digest: str, content_type: Optional[str] = None,
+                          source: str = DEFAULT_SOURCE):
+    # Write the image to storage while it is being analyzed
+    image_url, (analysis_result, cache_hit) = await asyncio.gather(
+        image_storage.save(digest, payload, content_type),
+        run_analysis(image_type, payload, digest, source)
+    )
+    return ImageAnalysisResult(
+        user_id=user_id,
+        image_type=image_type,
+        findings=analysis_result["findings"],
+        confidence_scores=analysis_result["confidence_scores"],
+        image_url=image_url,
+        image_sha256=digest,
+        cache_hit=cache_hit
+    )
+
+async def analyze_and_store(user_id: str, image_type: str, payload, digest: str, content_type: Optional[str] = None,
+                            source: str = DEFAULT_SOURCE):
+    result = await analyze_payload(user_id, image_type, payload, digest, content_type, source)
+    if source == DEFAULT_SOURCE:
+        await store_analysis_result(result)
+    else:
+        await store_analysis_result(result, api_source=source)
+    return result
 
 # Authentication Routes
 @api_router.post("/token", response_model=Token)
@@ -188,7 +505,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role}, 
+        data=user_token_claims(user), 
         expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
@@ -206,65 +523,412 @@ async def create_user(user: UserCreate):
         raise HTTPException(status_code=400, detail="Medical license ID required for doctor registration")
     
     # Create new user
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
     user_data = user.dict()
     user_data.pop("password")
     user_obj = UserInDB(**user_data, hashed_password=hashed_password)
     
     await db.users.insert_one(user_obj.dict())
+    user_cache.invalidate(user_obj.email)
     return User(**user_data)
 
 @api_router.get("/users/me", response_model=User)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
+async def read_users_me(current_user: User = Depends(get_reading_user)):
     return current_user
 
+@api_router.get("/users/me/usage")
+async def read_users_me_usage(current_user: User = Depends(get_current_user_readonly)):
+    """Requests admitted this month per scope, with the user's quotas and rate limits."""
+    return await rate_limiter.usage(current_user.id, current_user.role.value)
+
 # Image Analysis Routes
 @api_router.post("/analyze", response_model=ImageAnalysisResult)
 async def analyze_image(
     analysis_request: AnalysisRequest,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_analysis_user)
 ):
-    # Perform AI analysis using the mock function
-    analysis_result = analyze_medical_image(
-        analysis_request.image_type, 
-        analysis_request.image_data
+    # Run the analysis as an in-memory job and wait for it
+    image_bytes, digest = decode_and_hash(analysis_request.image_data)
+    job = await analysis_jobs.submit(
+        current_user.id,
+        analysis_request.image_type,
+        lambda: analyze_and_store(current_user.id, analysis_request.image_type, image_bytes, digest),
+        background=False,
+        priority=analysis_priority(analysis_request.priority, current_user)
     )
-    
-    # Create result object
-    result = ImageAnalysisResult(
-        user_id=current_user.id,
-        image_type=analysis_request.image_type,
-        findings=analysis_result["findings"],
-        confidence_scores=analysis_result["confidence_scores"]
+    return await analysis_jobs.wait(job["id"])
+
+@api_router.post("/analyses/jobs", response_model=AnalysisJob, status_code=202)
+async def submit_analysis_job(
+    analysis_request: AnalysisRequest,
+    current_user: User = Depends(get_analysis_user)
+):
+    """Queue an analysis and return immediately; poll or stream the job for its result."""
+    image_bytes, digest = decode_and_hash(analysis_request.image_data)
+    return await analysis_jobs.submit(
+        current_user.id,
+        analysis_request.image_type,
+        lambda: analyze_and_store(current_user.id, analysis_request.image_type, image_bytes, digest),
+        priority=analysis_priority(analysis_request.priority, current_user)
     )
-    
-    # Save to database
-    await db.analysis_results.insert_one(result.dict())
-    
-    return result
+
+@api_router.get("/analyses/jobs/{job_id}", response_model=AnalysisJob)
+async def get_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_reading_user)
+):
+    job = await analysis_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+    return job
+
+@api_router.get("/analyses/jobs/{job_id}/events")
+async def stream_analysis_job(
+    job_id: str,
+    current_user: User = Depends(get_reading_user)
+):
+    """Server-sent events: one event per state change, named after the new status."""
+    job = await analysis_jobs.get(job_id, current_user.id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Analysis job not found")
+
+    async def event_stream():
+        async for snapshot in analysis_jobs.events(job):
+            if snapshot is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {JobStatus(snapshot['status']).value}\n"
+            yield f"data: {AnalysisJob(**snapshot).json()}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.post("/upload-image", response_model=ImageAnalysisResult)
+async def upload_image(
+    request: Request,
+    current_user: User = Depends(get_analysis_user)
+):
+    """
+    Streaming multipart alternative to /analyze. Expects a `file` part, a
+    `type` (or `image_type`) field and optionally `priority`; the image is
+    never base64 encoded or held in memory as a whole.
+    """
+    upload, fields = await upload_receiver.receive(request)
+    with upload:
+        image_type = fields.get("type") or fields.get("image_type")
+        if not image_type:
+            raise HTTPException(status_code=400, detail="Image type is required")
+
+        job = await analysis_jobs.submit(
+            current_user.id,
+            image_type,
+            lambda: analyze_and_store(
+                current_user.id, image_type, upload.payload(), upload.sha256, upload.content_type
+            ),
+            background=False,
+            priority=analysis_priority(fields.get("priority"), current_user)
+        )
+        return await analysis_jobs.wait(job["id"])
+
+@api_router.post("/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Analyze many images from one multipart request. Send any number of `files`
+    parts; `type` (or `image_type`) and `priority` fields apply to the files
+    that follow them, or to all files if they only come at the end. Analysis
+    starts as soon as each file has arrived, at bulk priority by default.
+
+    The response is NDJSON, one line per image in completion order:
+    `{"index", "filename", "status": "ok", "result"}` or
+    `{"index", "filename", "status": "error", "error": {"status_code", "detail"}}`.
+    Results are stored with chunked insert_many calls before their line is sent.
+    """
+    slots = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
+    finished: asyncio.Queue = asyncio.Queue()
+    tasks: List[asyncio.Task] = []
+    deferred = []
+
+    async def analyze_one(index: int, upload, image_fields: Dict[str, str]):
+        item = {"index": index, "filename": upload.filename}
+        try:
+            image_type = image_fields.get("type") or image_fields.get("image_type")
+            if not image_type:
+                raise HTTPException(status_code=400, detail="Image type is required")
+            priority = analysis_priority(image_fields.get("priority"), current_user, default=Priority.BULK)
+            # Every image counts against the analysis limit, not the request
+            await rate_limiter.hit("analysis", current_user.id, current_user.role.value)
+            async with slots, analysis_scheduler.slot(current_user.id, priority):
+                item["result"] = await analyze_payload(
+                    current_user.id, image_type, upload.payload(), upload.sha256, upload.content_type
+                )
+        except HTTPException as e:
+            item["error"] = {"status_code": e.status_code, "detail": e.detail}
+        except Exception:
+            logging.exception(f"Batch analysis of {upload.filename!r} failed")
+            item["error"] = {"status_code": 500, "detail": "Analysis failed"}
+        finished.put_nowait(item)
+
+    def start(index: int, upload, image_fields: Dict[str, str]):
+        task = asyncio.create_task(analyze_one(index, upload, image_fields))
+        # Also closes the upload of a task cancelled before it got to run
+        task.add_done_callback(lambda _: upload.close())
+        tasks.append(task)
+
+    fields: Dict[str, str] = {}
+    try:
+        index = 0
+        async for upload, seen_fields in upload_receiver.iter_files(
+            request, fields, file_field="files", max_files=ANALYZE_BATCH_MAX_FILES
+        ):
+            if seen_fields.get("type") or seen_fields.get("image_type"):
+                start(index, upload, seen_fields)
+            else:
+                deferred.append((index, upload))
+            index += 1
+    except BaseException:
+        for _, upload in deferred:
+            upload.close()
+        for task in tasks:
+            task.cancel()
+        raise
+
+    for deferred_index, upload in deferred:
+        start(deferred_index, upload, fields)
+    if not tasks:
+        raise HTTPException(status_code=400, detail="No image files provided")
+
+    def line(item: dict) -> str:
+        if "result" in item:
+            return json.dumps(jsonable_encoder({**item, "status": "ok"})) + "\n"
+        return json.dumps({**item, "status": "error"}) + "\n"
+
+    async def flush(pending: List[dict]):
+        errors = await store_analysis_results([item["result"] for item in pending])
+        for position, item in enumerate(pending):
+            if position in errors:
+                logging.error(f"Could not store batch result {item['result'].id}: {errors[position]}")
+                item = {"index": item["index"], "filename": item["filename"],
+                        "error": {"status_code": 500, "detail": "Could not store the analysis result"}}
+            yield line(item)
+
+    async def results():
+        pending: List[dict] = []
+        try:
+            for _ in range(len(tasks)):
+                item = await finished.get()
+                if "result" in item:
+                    pending.append(item)
+                else:
+                    yield line(item)
+                # Insert in chunks, or whenever nothing else has finished yet
+                if pending and (len(pending) >= ANALYZE_BATCH_INSERT_CHUNK or finished.empty()):
+                    async for flushed in flush(pending):
+                        yield flushed
+                    pending = []
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @api_router.get("/analyses", response_model=List[ImageAnalysisResult])
-async def get_user_analyses(current_user: User = Depends(get_current_active_user)):
-    analyses = await db.analysis_results.find(
-        {"user_id": current_user.id}
-    ).sort("timestamp", -1).to_list(100)
-    
+async def get_user_analyses(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|compact)$"),
+    current_user: User = Depends(get_reading_user)
+):
+    """
+    Newest first, `limit` per page. When more results exist the opaque cursor
+    for the next page is returned in the `X-Next-Cursor` header. `since` only
+    returns analyses newer than the given time; `fields=a,b` returns just
+    those fields (plus `id` and `timestamp`). `view=compact` leaves out
+    confidence scores and keeps only the name and severity of each finding.
+    """
+    projection = parse_projection(fields, ImageAnalysisResult.model_fields)
+    if not projection and view == "compact":
+        projection = COMPACT_PROJECTION
+    query = keyset_filter(
+        {"user_id": analysis_codec.match_id(current_user.id)},
+        cursor=cursor, since=since, stored_id=analysis_codec.stored_id,
+    )
+    analyses = await analysis_codec.decode_many(await db.analysis_results.find(
+        query, analysis_codec.projection(projection) or {"_id": 0}
+    ).sort(SORT_ORDER).limit(limit + 1).to_list(limit + 1))
+
+    headers = {}
+    if len(analyses) > limit:
+        analyses = analyses[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(analyses[-1])
+
+    if projection:
+        # Partial documents skip model validation either way; orjson keeps the
+        # smaller views cheaper than the full one even without FAST_SERIALIZATION
+        return json_response(analyses, fast=True, headers=headers)
+    if FAST_SERIALIZATION:
+        return ORJSONResponse(analysis_shaper.shape_many(analyses), headers=headers)
+    response.headers.update(headers)
     return [ImageAnalysisResult(**analysis) for analysis in analyses]
 
+# Registered before /analyses/{analysis_id}, which would otherwise match "stats" and "export"
+@api_router.get("/analyses/stats", response_model=AnalysisStatsSummary)
+async def get_analysis_stats(current_user: User = Depends(get_reading_user)):
+    """Dashboard numbers for all of the user's analyses, from their summary document."""
+    return await analysis_stats.get(current_user.id)
+
+@api_router.get("/analyses/export")
+async def export_analyses(
+    export_format: ExportFormat = Query(ExportFormat.NDJSON, alias="format"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    image_type: Optional[str] = None,
+    after: Optional[str] = None,
+    all_users: bool = False,
+    current_user: User = Depends(get_reading_user)
+):
+    """
+    Stream the user's whole analysis history, oldest first, as NDJSON, CSV or
+    Parquet (one row per finding). `since` is inclusive, `until` exclusive.
+    To resume an interrupted export pass `after=<id of the last analysis
+    received>`. Admins can export every user's analyses with `all_users=true`.
+    Parquet needs `pyarrow` on the server (in backend/requirements.txt);
+    without it the request fails with 501.
+    """
+    if all_users and current_user.role != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Only admins can export all users' analyses")
+    user_filter = None if all_users else analysis_codec.match_id(current_user.id)
+
+    resume_from = None
+    if after:
+        resume_from = await resume_point(db.analysis_results, after, analysis_codec.match_id, user_filter)
+        if not resume_from:
+            raise HTTPException(status_code=400, detail="Unknown analysis to resume after")
+    query = export_filter(user_filter, since, until, image_type, resume_from)
+    writer = create_writer(export_format)
+
+    async def stream():
+        async for batch in iter_batches(db.analysis_results, query, analysis_codec.decode_many, EXPORT_BATCH_SIZE):
+            # Formatting a batch (Parquet especially) is CPU work; keep it off the event loop
+            chunk = await asyncio.to_thread(writer.write, batch)
+            if chunk:
+                yield chunk
+        tail = await asyncio.to_thread(writer.finish)
+        if tail:
+            yield tail
+
+    filename = f"analyses-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format.value}"
+    return StreamingResponse(
+        stream(),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @api_router.get("/analyses/{analysis_id}", response_model=ImageAnalysisResult)
 async def get_analysis_by_id(
     analysis_id: str,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_reading_user)
 ):
-    analysis = await db.analysis_results.find_one({"id": analysis_id, "user_id": current_user.id})
+    analysis = None
+    if analysis_writes is not None:
+        analysis = await analysis_codec.decode(analysis_writes.get(analysis_codec.stored_id(analysis_id)))
+    if analysis is None or analysis["user_id"] != current_user.id:
+        analysis = await analysis_codec.decode(await db.analysis_results.find_one({
+            "id": analysis_codec.match_id(analysis_id), "user_id": analysis_codec.match_id(current_user.id)
+        }))
     if not analysis:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
+    if FAST_SERIALIZATION:
+        return ORJSONResponse(analysis_shaper.shape(analysis))
     return ImageAnalysisResult(**analysis)
 
+@api_router.get("/findings/search", response_model=List[FindingSearchResult])
+async def search_findings(
+    response: Response,
+    name: str = Query(..., min_length=1),
+    severity: Optional[str] = None,
+    image_type: Optional[str] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1),
+    max_confidence: Optional[float] = Query(None, ge=0, le=1),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    sort: FindingSort = FindingSort.NEWEST,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_reading_user)
+):
+    """
+    Findings with the given name (case-insensitive) across analyses, e.g.
+    `name=pneumonia&min_confidence=0.9&since=...`, newest first or
+    `sort=confidence`. Patients search their own analyses. Doctors and
+    admins search across analyses, or one user's with `user_id`; until
+    patients are assigned to doctors, doctors can only narrow a search to a
+    patient, not to another doctor or an admin. The cursor for the next
+    page is returned in the `X-Next-Cursor` header.
+    """
+    if current_user.role == UserRole.PATIENT:
+        if user_id not in (None, current_user.id):
+            raise HTTPException(status_code=403, detail="Patients can only search their own analyses")
+        user_id = current_user.id
+    elif current_user.role == UserRole.DOCTOR and user_id not in (None, current_user.id):
+        target = await db.users.find_one({"id": user_id}, {"_id": 0, "role": 1})
+        if not target or target.get("role") != UserRole.PATIENT.value:
+            raise HTTPException(status_code=403, detail="Doctors can only search patients' analyses")
+    findings, next_cursor = await finding_index.search(
+        name, user_id=user_id, severity=severity, image_type=image_type,
+        min_confidence=min_confidence, max_confidence=max_confidence,
+        since=since, until=until, sort=sort, limit=limit, cursor=cursor,
+    )
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if FAST_SERIALIZATION:
+        return ORJSONResponse(findings, headers=headers)
+    response.headers.update(headers)
+    return findings
+
+@api_router.get("/images/{digest}")
+async def get_image(
+    digest: str,
+    current_user: User = Depends(get_reading_user)
+):
+    """Serve a stored image to a user who has an analysis of it."""
+    owned = await db.analysis_results.find_one(
+        {"user_id": analysis_codec.match_id(current_user.id), "image_sha256": digest}, {"_id": 1}
+    )
+    if not owned or not await image_storage.exists(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return await image_storage.serve(digest)
+
 @api_router.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "ZemedicAI"}
+    return {
+        "status": "healthy",
+        "service": "ZemedicAI",
+        "indexes": index_manager.status(),
+        "startup": startup_report,
+    }
+
+@api_router.get("/inference/metrics")
+async def inference_metrics():
+    return {
+        "executor": {
+            "mode": inference_executor.mode,
+            "workers": inference_executor.workers,
+            "pending": inference_executor.pending
+        },
+        "batching": analysis_batcher.stats(),
+        "scheduler": analysis_scheduler.stats(),
+        "cache": analysis_cache.stats(),
+    }
 
 # Model Training Routes (for doctors)
 @api_router.post("/model/train")
@@ -285,95 +949,34 @@ async def train_model(
     }
 
 # Google Health API Integration
-@api_router.post("/google-health/analyze")
-async def google_health_analyze(
-    analysis_request: AnalysisRequest,
-    current_user: User = Depends(get_current_active_user)
-):
-    """
-    Endpoint for integrating with Google Health API
-    This would be implemented with the actual Google Health API in production
-    """
-    # For now, we're using the mock analysis function
-    # In production, this would call the Google Health API
-    analysis_result = analyze_medical_image(
-        analysis_request.image_type,
-        analysis_request.image_data
-    )
-    
-    # Add some more detailed findings that would come from Google Health API
-    if analysis_request.image_type.lower() == "xray":
-        analysis_result["findings"].append({
-            "name": "Improved Analysis with Google Health API",
-            "location": "Full Image",
-            "severity": "Informational",
-            "description": "This analysis is enhanced with Google Health API's advanced machine learning models",
-            "recommendation": "Follow up with your healthcare provider for a detailed consultation"
-        })
-    
-    # Create result object with a note about Google Health API
-    result = ImageAnalysisResult(
-        user_id=current_user.id,
-        image_type=analysis_request.image_type,
-        findings=analysis_result["findings"],
-        confidence_scores=analysis_result["confidence_scores"]
-    )
-    
-    # Save to database with a note about Google Health API
-    await db.analysis_results.insert_one({**result.dict(), "api_source": "google_health"})
-    
-    return result
-
-# Google Health API Integration
-@api_router.post("/google-health/analyze")
+@api_router.post("/google-health/analyze", response_model=ImageAnalysisResult)
 async def google_health_analyze(
     analysis_request: AnalysisRequest,
-    current_user: User = Depends(get_current_active_user)
+    current_user: User = Depends(get_analysis_user)
 ):
     """
-    Endpoint for integrating with Google Health API
-    This would be implemented with the actual Google Health API in production
+    Endpoint for integrating with Google Health API. Runs through the
+    "google_health" analyzers, which fall back to the default ones for
+    modalities they do not cover.
     """
-    # For now, we're using the mock analysis function
-    # In production, this would call the Google Health API
-    analysis_result = analyze_medical_image(
+    image_bytes, digest = decode_and_hash(analysis_request.image_data)
+    job = await analysis_jobs.submit(
+        current_user.id,
         analysis_request.image_type,
-        analysis_request.image_data
-    )
-    
-    # Add some more detailed findings that would come from Google Health API
-    if analysis_request.image_type.lower() == "xray":
-        analysis_result["findings"].append({
-            "name": "Improved Analysis with Google Health API",
-            "location": "Full Image",
-            "severity": "Informational",
-            "description": "This analysis is enhanced with Google Health API's advanced machine learning models",
-            "recommendation": "Follow up with your healthcare provider for a detailed consultation"
-        })
-    
-    # Create result object with a note about Google Health API
-    result = ImageAnalysisResult(
-        user_id=current_user.id,
-        image_type=analysis_request.image_type,
-        findings=analysis_result["findings"],
-        confidence_scores=analysis_result["confidence_scores"]
+        lambda: analyze_and_store(
+            current_user.id, analysis_request.image_type, image_bytes, digest, source="google_health"
+        ),
+        background=False,
+        priority=analysis_priority(analysis_request.priority, current_user)
     )
-    
-    # Save to database with a note about Google Health API
-    await db.analysis_results.insert_one({**result.dict(), "api_source": "google_health"})
-    
-    return result
-
-# Include the router in the main app
-app.include_router(api_router)
+    return await analysis_jobs.wait(job["id"])
 
-# Create a test user on startup if it doesn't exist
-@app.on_event("startup")
-async def create_test_users():
+# Demo accounts, created by `python -m backend.manage seed-test-users`
+async def create_test_users(db):
     # Create a test patient user
     test_patient = await db.users.find_one({"email": "patient@example.com"})
     if not test_patient:
-        hashed_password = get_password_hash("testpassword")
+        hashed_password = await get_password_hash("testpassword")
         test_patient_obj = UserInDB(
             email="patient@example.com",
             first_name="Test",
@@ -387,7 +990,7 @@ async def create_test_users():
     # Create a test doctor user
     test_doctor = await db.users.find_one({"email": "doctor@example.com"})
     if not test_doctor:
-        hashed_password = get_password_hash("testpassword")
+        hashed_password = await get_password_hash("testpassword")
         test_doctor_obj = UserInDB(
             email="doctor@example.com",
             first_name="Test",
@@ -398,13 +1001,110 @@ async def create_test_users():
         await db.users.insert_one(test_doctor_obj.dict())
         logger.info("Created test doctor user")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def bind_database(database):
+    """Point the module-level `db` and everything holding a collection at `database`."""
+    global db
+    db = database
+    analysis_jobs.collection = db.analysis_jobs
+    analysis_stats.collection = db.analysis_stats
+    finding_index.collection = db.analysis_findings
+    analysis_codec.vocabulary.collection = db.analysis_vocabulary
+    if analysis_writes is not None:
+        analysis_writes.collection = db.analysis_results
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client
+    # One Motor pool per worker, opened inside the worker's own event loop.
+    # A database bound beforehand (e.g. by a test harness) is kept as is.
+    if db is None:
+        client, database = create_client(event_listeners=[MongoCommandTimer()])
+    else:
+        database = db
+    bind_database(database)
+    init_started = time.perf_counter()
+
+    # Index builds on large collections can take a while; report progress on
+    # /api/health instead of holding up startup.
+    app.state.index_build = asyncio.create_task(index_manager.ensure(db))
+    step_started = time.perf_counter()
+    if FAST_START:
+        app.state.warmup = asyncio.create_task(inference_executor.start())
+    else:
+        # Loads the models (ANALYZER_PRELOAD) before the worker accepts traffic
+        await inference_executor.start()
+    startup_report["init_ms"]["inference_executor"] = 1000 * (time.perf_counter() - step_started)
+    if analysis_writes is not None:
+        step_started = time.perf_counter()
+        await analysis_writes.start()
+        startup_report["init_ms"]["analysis_writes"] = 1000 * (time.perf_counter() - step_started)
+    startup_report["init_ms"]["total"] = 1000 * (time.perf_counter() - init_started)
+    logger.info(
+        "Worker %d ready: imports %.0f ms, init %.0f ms (%s)",
+        os.getpid(), startup_report["import_ms"], startup_report["init_ms"]["total"],
+        ", ".join(f"{step} {ms:.0f} ms" for step, ms in startup_report["init_ms"].items() if step != "total"),
+    )
+
+    yield
+
+    # Uvicorn stops accepting connections and finishes open requests on
+    # SIGTERM before getting here; what is left are background jobs.
+    logger.info("Worker %d draining", os.getpid())
+    await analysis_jobs.shutdown(timeout=SHUTDOWN_DRAIN_TIMEOUT_SECONDS)
+    await analysis_batcher.shutdown()
+    if FAST_START:
+        await asyncio.gather(app.state.warmup, return_exceptions=True)
+    await inference_executor.shutdown()
+    if analysis_writes is not None:
+        await analysis_writes.shutdown()
+    await analysis_cache.close()
+    await rate_limiter.close()
+    password_hasher.shutdown()
+    if client is not None:
+        client.close()
+        client = None
+
+def create_app() -> FastAPI:
+    """
+    The ASGI application. Run several workers with
+    `uvicorn backend.server:app --workers N` (or
+    `uvicorn --factory backend.server:create_app`); every worker gets its own
+    Mongo pool and inference executor and shares cache, rate limits and job
+    state through Mongo and Redis.
+    """
+    app = FastAPI(
+        title="ZemedicAI API",
+        description="AI-powered medical imaging analysis API",
+        default_response_class=ORJSONResponse if FAST_SERIALIZATION else JSONResponse,
+        lifespan=lifespan,
+    )
+    app.include_router(api_router)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor"],
+    )
+    app.add_middleware(PrometheusMiddleware)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+    return app
+
+register_stats({
+    "inference_executor": lambda: {"pending": inference_executor.pending, "workers": inference_executor.workers},
+    "analysis_batcher": analysis_batcher.stats,
+    "analysis_cache": analysis_cache.stats,
+    "analysis_jobs": lambda: {"queued": analysis_jobs.queued},
+    "analysis_scheduler": analysis_scheduler.stats,
+    "user_cache": user_cache.stats,
+    "password_hasher": lambda: {"pending": password_hasher.pending},
+    "rate_limiter": rate_limiter.stats,
+    "analysis_writes": lambda: analysis_writes.stats() if analysis_writes is not None else {},
+    "analysis_stats": analysis_stats.stats,
+    "finding_index": finding_index.stats,
+    "analysis_vocabulary": analysis_codec.vocabulary.stats,
+})
 
 # Configure logging
 logging.basicConfig(
@@ -413,6 +1113,7 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+# Where worker startup time goes; logged once ready and shown on /api/health
+startup_report = {"import_ms": 1000 * (time.perf_counter() - IMPORT_STARTED), "init_ms": {}}
+
+app = create_app()
@@ -0,0 +1,140 @@
+"""
+Content-addressed storage for uploaded images.
+
+Images are written once under their SHA-256, so re-uploads of the same study
+are deduplicated, and analysis documents only keep a reference
+(`image_url`). Two backends: the local filesystem and S3-compatible object
+storage (AWS, MinIO or any stand-in reachable through `endpoint_url`).
+"""
+import asyncio
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional, Union
+
+from starlette.responses import FileResponse, RedirectResponse, Response
+
+ImageSource = Union[Path, bytes]
+
+
+def image_url(digest: str) -> str:
+    return f"/api/images/{digest}"
+
+
+class ImageStorage:
+    async def save(self, digest: str, source: ImageSource, content_type: Optional[str] = None) -> str:
+        """Store the image unless it is already there; returns its API URL."""
+        raise NotImplementedError
+
+    async def exists(self, digest: str) -> bool:
+        raise NotImplementedError
+
+    async def serve(self, digest: str) -> Response:
+        raise NotImplementedError
+
+
+class NullImageStorage(ImageStorage):
+    """Keeps nothing; analyses are stored without an image_url."""
+
+    async def save(self, digest, source, content_type=None):
+        return None
+
+    async def exists(self, digest):
+        return False
+
+
+class LocalImageStorage(ImageStorage):
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    async def save(self, digest, source, content_type=None):
+        await asyncio.to_thread(self._save, digest, source)
+        return image_url(digest)
+
+    def _save(self, digest: str, source: ImageSource):
+        path = self._path(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{digest}.{uuid.uuid4().hex}.tmp")
+        try:
+            if isinstance(source, Path):
+                try:
+                    # Spooled uploads already sit on disk: hard-link instead of copying.
+                    os.link(source, tmp)
+                except OSError:
+                    shutil.copyfile(source, tmp)
+            else:
+                tmp.write_bytes(source)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    async def exists(self, digest):
+        return self._path(digest).exists()
+
+    async def serve(self, digest):
+        return FileResponse(self._path(digest), media_type="application/octet-stream")
+
+
+class S3ImageStorage(ImageStorage):
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "images/",
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        url_expiry: int = 300,
+    ):
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_expiry = url_expiry
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region_name)
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}{digest[:2]}/{digest}"
+
+    def _exists(self, key: str) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def _save(self, digest: str, source: ImageSource, content_type: Optional[str]):
+        key = self._key(digest)
+        if self._exists(key):
+            return
+        extra = {"ContentType": content_type} if content_type else {}
+        if isinstance(source, Path):
+            # upload_file streams from disk and switches to multipart for large studies
+            self.client.upload_file(str(source), self.bucket, key, ExtraArgs=extra or None)
+        else:
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=source, **extra)
+
+    async def save(self, digest, source, content_type=None):
+        await asyncio.to_thread(self._save, digest, source, content_type)
+        return image_url(digest)
+
+    async def exists(self, digest):
+        return await asyncio.to_thread(self._exists, self._key(digest))
+
+    async def serve(self, digest):
+        url = await asyncio.to_thread(
+            self.client.generate_presigned_url,
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._key(digest)},
+            ExpiresIn=self.url_expiry,
+        )
+        return RedirectResponse(url, status_code=307)
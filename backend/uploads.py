@@ -0,0 +1,254 @@
+"""
+Streaming multipart uploads for medical images.
+
+The request body is parsed chunk by chunk as it arrives from the client. The
+image part is hashed on the fly and spooled to memory up to a threshold, then
+to a temporary file, so peak memory per upload stays flat no matter how large
+the study is.
+"""
+import hashlib
+import io
+import os
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # older python-multipart releases
+    import multipart
+    from multipart.multipart import parse_options_header
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class SpooledUpload:
+    """
+    Image bytes received from a client, hashed while they are written.
+    Data stays in memory up to `max_memory` bytes and rolls over to a named
+    temporary file after that, so worker processes can open it by path.
+    """
+
+    def __init__(self, max_memory: int, max_bytes: int, tmp_dir: Optional[str] = None):
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self.tmp_dir = tmp_dir
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self.size = 0
+        self.path: Optional[str] = None
+        self._file = io.BytesIO()
+        self._hasher = hashlib.sha256()
+
+    @property
+    def sha256(self) -> str:
+        return self._hasher.hexdigest()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def write(self, chunk: bytes):
+        if self.size + len(chunk) > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit")
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+        if self.path is None and self.size > self.max_memory:
+            self._rollover()
+        self._file.write(chunk)
+
+    def _rollover(self):
+        spool = tempfile.NamedTemporaryFile(prefix="zemedic-upload-", dir=self.tmp_dir, delete=False)
+        spool.write(self._file.getbuffer())
+        self._file = spool
+        self.path = spool.name
+
+    def open(self):
+        """Return the spooled file rewound to the start, ready for reading."""
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+
+    def getvalue(self) -> bytes:
+        return self.open().read()
+
+    def payload(self):
+        """
+        Picklable handle on the upload for inference workers: the spool file's
+        `Path` once rolled over to disk, otherwise the (small) bytes themselves.
+        """
+        if self.path is not None:
+            self._file.flush()
+            return Path(self.path)
+        return self.getvalue()
+
+    def close(self):
+        self._file.close()
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class UploadReceiver:
+    """
+    Parses a multipart/form-data request body straight from the ASGI stream.
+    Parts named `file_field` are spooled into `SpooledUpload`s; every other
+    part is collected as a small text form field.
+    """
+
+    def __init__(
+        self,
+        max_memory: int = 1024 * 1024,
+        max_bytes: int = 200 * 1024 * 1024,
+        tmp_dir: Optional[str] = None,
+        max_field_bytes: int = 64 * 1024,
+    ):
+        self.max_memory = max_memory
+        self.max_bytes = max_bytes
+        self.tmp_dir = tmp_dir
+        self.max_field_bytes = max_field_bytes
+
+    async def receive(self, request: Request, file_field: str = "file") -> Tuple[SpooledUpload, Dict[str, str]]:
+        """Receive a single file upload plus its form fields."""
+        fields: Dict[str, str] = {}
+        upload = None
+        try:
+            async for upload, _ in self.iter_files(request, fields, file_field=file_field, max_files=1):
+                pass
+        except BaseException:
+            # The file may already be ours when a later part or the end of the body fails
+            if upload is not None:
+                upload.close()
+            raise
+        if upload is None:
+            raise HTTPException(status_code=400, detail="No image file provided")
+        return upload, fields
+
+    async def iter_files(
+        self,
+        request: Request,
+        fields: Dict[str, str],
+        file_field: str = "file",
+        max_files: int = 1,
+    ) -> AsyncIterator[Tuple[SpooledUpload, Dict[str, str]]]:
+        """
+        Yield each file as soon as its part has been received, together with a
+        snapshot of the form fields sent before it. `fields` is filled in as
+        the body is parsed and is complete once iteration ends. Yielded
+        uploads belong to the caller, who must close them.
+        """
+        content_type, params = parse_options_header(request.headers.get("content-type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(status_code=415, detail="Expected a multipart/form-data upload")
+
+        # Finished uploads, each with the fields sent before it
+        completed: List[Tuple[SpooledUpload, Dict[str, str]]] = []
+        state = {"headers": {}, "field": b"", "value": b"", "name": None, "data": None, "files": 0, "ended": False}
+
+        def on_part_begin():
+            state["headers"] = {}
+            state["name"] = None
+            state["data"] = None
+
+        def on_header_field(data, start, end):
+            state["field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["value"] += data[start:end]
+
+        def on_header_end():
+            state["headers"][state["field"].lower()] = state["value"]
+            state["field"] = b""
+            state["value"] = b""
+
+        def on_headers_finished():
+            _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+            name = options.get(b"name", b"").decode("latin-1")
+            state["name"] = name
+            if name == file_field and b"filename" in options:
+                state["files"] += 1
+                if state["files"] > max_files:
+                    raise UploadTooLarge(f"At most {max_files} file(s) per request")
+                upload = SpooledUpload(self.max_memory, self.max_bytes, self.tmp_dir)
+                upload.filename = options[b"filename"].decode("latin-1")
+                part_type = state["headers"].get(b"content-type")
+                upload.content_type = part_type.decode("latin-1") if part_type else None
+                state["data"] = upload
+            else:
+                state["data"] = bytearray()
+
+        def on_part_data(data, start, end):
+            target = state["data"]
+            if isinstance(target, SpooledUpload):
+                target.write(data[start:end])
+            else:
+                if len(target) + (end - start) > self.max_field_bytes:
+                    raise UploadTooLarge(f"Form field {state['name']!r} is too large")
+                target.extend(data[start:end])
+
+        def on_part_end():
+            target = state["data"]
+            state["data"] = None
+            if isinstance(target, SpooledUpload):
+                if target.size == 0:
+                    target.close()
+                else:
+                    completed.append((target, dict(fields)))
+            elif state["name"]:
+                fields[state["name"]] = bytes(target).decode("utf-8", errors="replace")
+
+        def on_end():
+            state["ended"] = True
+
+        parser = multipart.MultipartParser(
+            params[b"boundary"],
+            callbacks={
+                "on_part_begin": on_part_begin,
+                "on_part_data": on_part_data,
+                "on_part_end": on_part_end,
+                "on_header_field": on_header_field,
+                "on_header_value": on_header_value,
+                "on_header_end": on_header_end,
+                "on_headers_finished": on_headers_finished,
+                "on_end": on_end,
+            },
+        )
+
+        def discard():
+            if isinstance(state["data"], SpooledUpload):
+                state["data"].close()
+            while completed:
+                completed.pop()[0].close()
+
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    parser.write(chunk)
+                while completed:
+                    yield completed.pop(0)
+            parser.finalize()
+            if not state["ended"]:
+                # The client stopped before the closing boundary
+                raise multipart.exceptions.MultipartParseError("Truncated multipart body")
+        except UploadTooLarge as e:
+            discard()
+            raise HTTPException(status_code=413, detail=str(e))
+        except multipart.exceptions.MultipartParseError:
+            discard()
+            raise HTTPException(status_code=400, detail="Malformed multipart upload")
+        except BaseException:
+            discard()
+            raise
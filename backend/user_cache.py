@@ -0,0 +1,59 @@
+"""
+Short-lived cache of authenticated users.
+
+`get_current_user` would otherwise load the user document from Mongo on
+every request. Entries are keyed by token subject and token id (`jti`), live
+for a few seconds, and are dropped for a subject as soon as that user's
+record changes in this process; other workers converge within the TTL.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+
+class UserCache:
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, Any]]" = OrderedDict()
+        self._by_subject: Dict[str, Set[Optional[str]]] = {}
+
+    def get(self, subject: str, token_id: Optional[str]):
+        key = (subject, token_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, subject: str, token_id: Optional[str], user):
+        if self.ttl <= 0:
+            return
+        key = (subject, token_id)
+        self._entries[key] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(key)
+        self._by_subject.setdefault(subject, set()).add(token_id)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, subject: str):
+        """Forget every cached session of a user, e.g. after their record changed."""
+        for token_id in self._by_subject.pop(subject, ()):
+            self._entries.pop((subject, token_id), None)
+
+    def _remove(self, key: Tuple[str, Optional[str]]):
+        self._entries.pop(key, None)
+        token_ids = self._by_subject.get(key[0])
+        if token_ids is not None:
+            token_ids.discard(key[1])
+            if not token_ids:
+                del self._by_subject[key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses, "ttl_seconds": self.ttl}
@@ -0,0 +1,279 @@
+"""
+Write-behind buffering for analysis_results inserts.
+
+With the buffer enabled, storing a result only appends it to a local spill
+file and an in-memory queue; a background task flushes the queue with
+unordered `insert_many` calls once `flush_size` documents are waiting or
+every `flush_interval` seconds, retrying transient failures with backoff.
+Request latency is then independent of Mongo write latency.
+
+Every document gets its `_id` before it is buffered, so replaying a write
+that already reached Mongo fails with a duplicate key error, which is
+treated as success. Spill files are per process and held under an
+exclusive lock; on start, files left behind by a crashed process are
+replayed into the current one. Flushed documents are acknowledged in the
+spill file, which is rewritten with only the still-pending documents once
+`compact_ratio` of the documents it holds are acknowledged, so it stays
+proportional to the backlog under steady load.
+
+Spill writes survive a crash of the process at once, but are fsynced only
+once per flush cycle: a crash of the host can lose the documents buffered in
+the last `flush_interval` seconds.
+"""
+import asyncio
+import collections
+import fcntl
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection,
+        spill_dir: Union[str, Path],
+        max_pending: int = 10000,
+        flush_size: int = 500,
+        flush_interval: float = 0.25,
+        retry_attempts: int = 5,
+        retry_max_wait: float = 5.0,
+        key: str = "id",
+        compact_ratio: float = 0.5,
+    ):
+        self.collection = collection
+        self.spill_dir = Path(spill_dir)
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retry_attempts = retry_attempts
+        self.retry_max_wait = retry_max_wait
+        self.key = key
+        self.compact_ratio = compact_ratio
+        # Buffered documents by key, including the batch being written
+        self._pending: Dict[Any, dict] = {}
+        self._queue: Deque[Any] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._spill = None
+        self._spill_path: Optional[Path] = None
+        # Documents written to the current spill file, how many of them are acknowledged,
+        # and whether anything was written since the last fsync
+        self._spilled = 0
+        self._acked = 0
+        self._unsynced = False
+        self.flushed = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        self._spill_path = self.spill_dir / f"{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+        self._spill = open(self._spill_path, "a+", encoding="utf-8")
+        fcntl.flock(self._spill, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._recover()
+        self._task = asyncio.create_task(self._run())
+
+    def _recover(self):
+        """Adopt the unacknowledged writes of spill files no live process holds."""
+        for path in sorted(self.spill_dir.glob("*.jsonl")):
+            if path == self._spill_path:
+                continue
+            with open(path, "r", encoding="utf-8") as orphan:
+                try:
+                    fcntl.flock(orphan, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # still owned by another worker
+                if not _same_file(orphan, path):
+                    continue  # compacted by its owner since we opened it
+                docs = _replay(orphan, self.key)
+                for doc in docs:
+                    self._buffer(doc)
+                path.unlink()
+            if docs:
+                logger.warning("Recovered %d unwritten analysis results from %s", len(docs), path.name)
+        # A crash while compacting leaves the original spill file intact
+        for path in self.spill_dir.glob("*.compacting"):
+            with open(path, "r", encoding="utf-8") as partial:
+                try:
+                    fcntl.flock(partial, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue
+                if _same_file(partial, path):
+                    path.unlink()
+        if self._queue:
+            self._wakeup.set()
+
+    def _buffer(self, doc: dict):
+        key = doc[self.key]
+        self._pending[key] = doc
+        self._queue.append(key)
+        self._spill.write(json_util.dumps({"put": doc}) + "\n")
+        self._spill.flush()
+        self._spilled += 1
+        self._unsynced = True
+
+    async def put(self, doc: dict):
+        """Buffer a document; waits only when `max_pending` documents are already buffered."""
+        if self._spill is None or self._closing:
+            raise RuntimeError("Write-behind buffer is not running")
+        while len(self._pending) >= self.max_pending:
+            self._space.clear()
+            self._wakeup.set()
+            await self._space.wait()
+        self._buffer({"_id": ObjectId(), **doc})
+        if len(self._queue) >= self.flush_size:
+            self._wakeup.set()
+
+    def get(self, key) -> Optional[dict]:
+        """Read-your-writes overlay: the buffered document, if it has not been flushed yet."""
+        doc = self._pending.get(key)
+        if doc is None:
+            return None
+        return {field: value for field, value in doc.items() if field != "_id"}
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.sync()
+            await self.flush()
+
+    async def sync(self):
+        """fsync the spill file if anything was written to it since the last time."""
+        if self._unsynced:
+            self._unsynced = False
+            await asyncio.to_thread(os.fsync, self._spill.fileno())
+
+    async def flush(self) -> bool:
+        """Write everything queued so far; returns False if a batch had to be kept for later."""
+        while self._queue:
+            keys = [self._queue.popleft() for _ in range(min(self.flush_size, len(self._queue)))]
+            docs = [self._pending[key] for key in keys]
+            if not await self._insert(docs):
+                self.failed_flushes += 1
+                self._queue.extendleft(reversed(keys))
+                return False
+            for key in keys:
+                del self._pending[key]
+            self.flushed += len(keys)
+            self._acknowledge(keys)
+            self._space.set()
+        return True
+
+    async def _insert(self, docs: List[dict]) -> bool:
+        try:
+            async for attempt in AsyncRetrying(
+                stop=stop_after_attempt(self.retry_attempts),
+                wait=wait_exponential(multiplier=0.1, max=self.retry_max_wait),
+                retry=retry_if_exception_type(PyMongoError),
+                reraise=True,
+            ):
+                with attempt:
+                    try:
+                        await self.collection.insert_many(docs, ordered=False)
+                    except BulkWriteError as e:
+                        # Duplicates were written by an earlier attempt or before a crash;
+                        # anything else will not succeed on retry either.
+                        errors = [err for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY]
+                        for err in errors:
+                            logger.error("Dropping analysis result %s: %s",
+                                         docs[err["index"]].get(self.key), err.get("errmsg"))
+                        self.dropped += len(errors)
+        except PyMongoError as e:
+            logger.error("Could not flush %d analysis results, will retry: %s", len(docs), e)
+            return False
+        return True
+
+    def _acknowledge(self, keys: List[Any]):
+        self._acked += len(keys)
+        if not self._pending:
+            # Nothing left to recover: start the spill file over
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spilled = self._acked = 0
+        elif self._acked >= self.flush_size and self._acked >= self.compact_ratio * self._spilled:
+            self._compact()
+        else:
+            self._spill.write(json_util.dumps({"ack": keys}) + "\n")
+        self._spill.flush()
+        self._unsynced = True
+
+    def _compact(self):
+        """Replace the spill file with one holding only the pending documents."""
+        temporary = self._spill_path.with_suffix(".compacting")
+        spill = open(temporary, "w+", encoding="utf-8")
+        fcntl.flock(spill, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        for doc in self._pending.values():
+            spill.write(json_util.dumps({"put": doc}) + "\n")
+        spill.flush()
+        os.fsync(spill.fileno())
+        os.replace(temporary, self._spill_path)
+        self._spill.close()
+        self._spill = spill
+        self._spilled, self._acked = len(self._pending), 0
+
+    async def shutdown(self):
+        """Stop the flusher and drain the buffer; unwritten documents stay in the spill file."""
+        if self._spill is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if not await self.flush():
+            logger.error("%d analysis results left unwritten in %s", len(self._pending), self._spill_path)
+        await self.sync()
+        self._spill.close()
+        self._spill = None
+        if not self._pending:
+            self._spill_path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
+
+
+def _same_file(handle, path: Path) -> bool:
+    try:
+        return os.path.samestat(os.fstat(handle.fileno()), os.stat(path))
+    except FileNotFoundError:
+        return False
+
+
+def _replay(spill, key: str) -> List[dict]:
+    docs: Dict[Any, dict] = {}
+    for line in spill:
+        if not line.strip():
+            continue
+        try:
+            entry = json_util.loads(line)
+        except ValueError:
+            break  # torn final write
+        if "put" in entry:
+            docs[entry["put"][key]] = entry["put"]
+        else:
+            for acknowledged in entry["ack"]:
+                docs.pop(acknowledged, None)
+    return list(docs.values())
@@ -2,7 +2,6 @@
 import requests
 import sys
 import uuid
-import base64
 from datetime import datetime
 
 class ZemedicAITester:
@@ -165,9 +164,9 @@ class ZemedicAITester:
             print("❌ Skipping Google Health API test - No authentication token")
             return False, {}
             
-        # Create a mock image data (base64 encoded string)
+        # A 1x1 grayscale PNG (base64 encoded string): images that cannot be decoded are rejected
         # In a real test, this would be an actual medical image
-        mock_image_data = base64.b64encode(b"mock_image_data").decode('utf-8')
+        mock_image_data = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR4nGNgAAAAAgABSK+kcQAAAABJRU5ErkJggg=="
         
         data = {
             "image_type": "xray",
@@ -189,7 +188,8 @@ def main():
     # Run tests
     health_success, _ = tester.test_health_check()
     
-    # Test with demo accounts
+    # Test with demo accounts (created by `python -m backend.manage seed-test-users`,
+    # which scripts/update-and-start.sh runs)
     if health_success:
         # Test patient demo account
         print("\n🔍 Testing with patient demo account...")
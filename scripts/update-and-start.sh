@@ -79,8 +79,11 @@ else
     exit 1
 fi
 
-# Start only backend and frontend services
+# Start only backend and frontend services. Supervisor runs the backend from
+# /app as `uvicorn backend.server:app`; its modules import each other
+# relative to the backend package, so it cannot be started from /app/backend.
 echo "Starting development services..."
+cd /app
 if command_exists supervisorctl; then
     supervisorctl start backend
     supervisorctl start frontend
@@ -93,6 +96,11 @@ fi
 echo "Waiting for services to start up..."
 sleep 5
 
+# The server no longer creates the demo accounts at startup; backend_test.py
+# logs in as patient@example.com and doctor@example.com, so seed them here.
+echo "Seeding demo accounts..."
+python -m backend.manage seed-test-users || echo "Warning: could not seed demo accounts"
+
 # Show logs for both services
 show_logs "backend"
 show_logs "frontend"
@@ -0,0 +1,115 @@
+import asyncio
+
+import pytest
+
+from backend import analysis_cache
+from backend.analysis_cache import AnalysisCache, LocalCacheTier
+
+KEY = "analysis:test:xray:abc"
+
+
+def test_concurrent_callers_share_one_compute():
+    async def scenario():
+        cache = AnalysisCache()
+        release = asyncio.Event()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return {"findings": ["Normal chest X-ray"]}
+
+        first = asyncio.create_task(cache.get_or_compute(KEY, compute))
+        second = asyncio.create_task(cache.get_or_compute(KEY, compute))
+        await asyncio.sleep(0)
+        release.set()
+        (first_result, first_hit), (second_result, second_hit) = await asyncio.gather(first, second)
+
+        assert len(calls) == 1
+        assert (first_hit, second_hit) == (False, True)
+        assert first_result == second_result == {"findings": ["Normal chest X-ray"]}
+        # Each caller gets its own copy to modify
+        assert first_result is not second_result
+
+        assert await cache.get_or_compute(KEY, compute) == ({"findings": ["Normal chest X-ray"]}, True)
+        assert len(calls) == 1
+        assert {name: cache.stats()[name] for name in ("hits", "misses", "coalesced")} == {
+            "hits": 1, "misses": 1, "coalesced": 1,
+        }
+
+    asyncio.run(scenario())
+
+
+def test_failed_compute_is_not_cached():
+    async def scenario():
+        cache = AnalysisCache()
+        release = asyncio.Event()
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            await release.wait()
+            raise RuntimeError("inference worker crashed")
+
+        waiters = [asyncio.create_task(cache.get_or_compute(KEY, failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+        assert [type(outcome) for outcome in outcomes] == [RuntimeError, RuntimeError]
+        assert len(calls) == 1
+        assert len(cache.local) == 0
+
+        async def compute():
+            calls.append(1)
+            return {"findings": []}
+
+        assert await cache.get_or_compute(KEY, compute) == ({"findings": []}, False)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_local_tier_evicts_least_recently_used_entries():
+    tier = LocalCacheTier(max_entries=2)
+    tier.set("a", b"1")
+    tier.set("b", b"2")
+    assert tier.get("a") == b"1"
+    tier.set("c", b"3")
+
+    assert tier.get("b") is None
+    assert (tier.get("a"), tier.get("c")) == (b"1", b"3")
+    assert len(tier) == 2
+
+
+def test_local_tier_stays_within_max_bytes():
+    tier = LocalCacheTier(max_bytes=10)
+    tier.set("a", b"x" * 4)
+    tier.set("b", b"x" * 4)
+    tier.set("a", b"x" * 5)
+    tier.set("c", b"x" * 3)
+
+    assert tier.get("b") is None
+    assert tier.size == 8
+    # Larger than the whole tier: never stored, and nothing evicted for it
+    tier.set("huge", b"x" * 11)
+    assert tier.get("huge") is None
+    assert len(tier) == 2
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(analysis_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_local_tier_expires_entries_after_ttl(clock):
+    tier = LocalCacheTier(ttl=60)
+    tier.set("a", b"1")
+    clock[0] += 59
+    assert tier.get("a") == b"1"
+    clock[0] += 2
+
+    assert tier.get("a") is None
+    assert len(tier) == 0
+    assert tier.size == 0
@@ -0,0 +1,90 @@
+import asyncio
+import uuid
+from datetime import datetime
+
+import bson
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.analysis_schema import SCHEMA_VERSION, AnalysisCodec, Vocabulary
+
+
+def analysis(**overrides):
+    document = {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "image_type": "xray",
+        "findings": [
+            {"name": "Pneumonia", "location": "Right Lower Lobe", "severity": "Moderate"},
+            {"name": "Pleural Effusion", "location": "Right Side", "severity": "Mild",
+             "description": "x" * 600, "recommendation": "Follow up", "extra": 3},
+        ],
+        "confidence_scores": {"Pneumonia": 0.94, "Pleural Effusion": 0.78, "y" * 600: 0.1},
+        "timestamp": datetime(2026, 5, 1, 12, 30, 15, 123000),
+        "image_url": "/api/images/abc",
+        "image_sha256": "abc",
+        "cache_hit": True,
+    }
+    document.update(overrides)
+    return document
+
+
+def test_v1_v2_round_trip_through_a_cold_vocabulary():
+    async def scenario():
+        collection = AsyncMongoMockClient()["zemedic_test"].analysis_vocabulary
+        writer = AnalysisCodec(Vocabulary(collection, max_term_length=512), compact=True)
+        documents = [analysis(), analysis(cache_hit=False), analysis(id="legacy-id", findings=[])]
+
+        stored = await writer.encode_many(documents)
+        # What is written is what Mongo returns
+        stored = [bson.decode(bson.encode(document)) for document in stored]
+
+        assert all(document["v"] == SCHEMA_VERSION for document in stored)
+        assert isinstance(stored[0]["id"], bson.binary.Binary)
+        assert stored[2]["id"] == "legacy-id"
+        assert "cache_hit" not in stored[1]
+        # Long free text stays inline instead of growing the vocabulary
+        assert stored[0]["findings"][1]["description"] == "x" * 600
+        assert set(stored[0]["findings"][0]) == {"n", "l", "s"}
+        assert len(bson.encode(stored[0])) < len(bson.encode(documents[0]))
+
+        reader = AnalysisCodec(Vocabulary(collection))
+        decoded = await reader.decode_many(stored)
+        expected = [dict(document) for document in documents]
+        expected[1].pop("cache_hit")  # False is left out; the API model defaults it
+        assert decoded == expected
+
+        # Version 1 documents read back unchanged, and encoding v2 again is a no-op
+        assert await reader.decode_many(documents) == documents
+        assert await writer.encode_many(stored) == stored
+
+    asyncio.run(scenario())
+
+
+def test_codes_are_shared_between_workers():
+    async def scenario():
+        collection = AsyncMongoMockClient()["zemedic_test"].analysis_vocabulary
+        first, second = Vocabulary(collection), Vocabulary(collection)
+        codes = dict(await first.codes(["Pneumonia", "Mild"]))
+        assert dict(await second.codes(["Mild", "Pneumonia", "Moderate"])) == {**codes, "Moderate": 3}
+        assert await first.terms([3]) == {**{code: term for term, code in codes.items()}, 3: "Moderate"}
+
+    asyncio.run(scenario())
+
+
+def test_projected_documents_decode():
+    async def scenario():
+        collection = AsyncMongoMockClient()["zemedic_test"].analysis_results
+        codec = AnalysisCodec(Vocabulary(collection.database.analysis_vocabulary), compact=True)
+        document = analysis()
+        await collection.insert_many([await codec.encode(document), analysis()])
+
+        projection = AnalysisCodec.projection({"_id": 0, "id": 1, "findings.name": 1})
+        pages = await codec.decode_many(await collection.find({}, projection).to_list(None))
+        names = [finding["name"] for finding in document["findings"]]
+        assert [page["findings"] for page in pages] == [[{"name": name} for name in names]] * 2
+        assert pages[0]["id"] == document["id"]
+
+        found = await collection.find_one({"id": AnalysisCodec.match_id(document["id"])})
+        assert (await codec.decode(found))["id"] == document["id"]
+
+    asyncio.run(scenario())
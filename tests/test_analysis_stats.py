@@ -0,0 +1,70 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.analysis_stats import AnalysisStats
+
+
+def analysis(user_id, image_type, day, findings, scores):
+    return {
+        "user_id": user_id,
+        "image_type": image_type,
+        "timestamp": datetime(2026, 3, day),
+        "findings": [{"name": name, "severity": "Mild"} for name in findings],
+        "confidence_scores": scores,
+    }
+
+
+ANALYSES = [
+    analysis("alice", "xray", 3, ["Pneumonia"], {"Pneumonia": 0.94, "Tb.v2 $score": 0.05}),
+    analysis("alice", "xray", 1, ["Pneumonia", "Effusion"], {"Pneumonia": 0.5, "Tb.v2 $score": 1.0}),
+    analysis("alice", "m.r.i", 2, [], {}),
+    analysis("bob", "xray", 5, ["Effusion"], {"Effusion": 0.0}),
+]
+
+
+def test_summaries_accumulate_with_inc():
+    async def scenario():
+        stats = AnalysisStats(AsyncMongoMockClient()["zemedic_test"].analysis_stats)
+        # Recorded across several calls, as results come in
+        await stats.record(ANALYSES[:1])
+        await stats.record(ANALYSES[1:])
+
+        alice = await stats.get("alice")
+        assert alice["total"] == 3
+        assert alice["image_types"] == {"xray": 2, "m.r.i": 1}
+        assert alice["findings"] == {"Pneumonia": 2, "Effusion": 1}
+        assert (alice["first_analysis_at"], alice["last_analysis_at"]) == (datetime(2026, 3, 1), datetime(2026, 3, 3))
+        pneumonia = alice["confidence"]["Pneumonia"]
+        assert pneumonia["count"] == 2
+        assert pneumonia["mean"] == pytest.approx(0.72)
+        assert pneumonia["buckets"] == [0, 0, 0, 0, 0, 1, 0, 0, 0, 1]
+        # Field names with "." and "$" round-trip; a score of 1.0 lands in the last bucket
+        assert alice["confidence"]["Tb.v2 $score"]["buckets"] == [1, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+
+        assert (await stats.get("bob"))["confidence"]["Effusion"]["buckets"][0] == 1
+        assert await stats.get("nobody") == {
+            "total": 0, "image_types": {}, "findings": {}, "confidence": {},
+            "first_analysis_at": None, "last_analysis_at": None,
+        }
+
+    asyncio.run(scenario())
+
+
+def test_rebuild_matches_incremental_summaries():
+    async def scenario():
+        database = AsyncMongoMockClient()["zemedic_test"]
+        await database.analysis_results.insert_many([dict(document) for document in ANALYSES])
+        incremental = AnalysisStats(database.incremental_stats)
+        await incremental.record(ANALYSES)
+
+        rebuilt = AnalysisStats(database.analysis_stats)
+        await rebuilt.record(ANALYSES[:2])  # stale summary, replaced by the rebuild
+        assert await rebuilt.rebuild(database.analysis_results, batch_size=2) == 2
+
+        for user_id in ("alice", "bob"):
+            assert await rebuilt.get(user_id) == await incremental.get(user_id)
+
+    asyncio.run(scenario())
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from backend.batching import MicroBatcher
+from backend.inference import InferenceUnavailable
+
+
+class RecordingExecutor:
+    def __init__(self):
+        self.calls = []
+
+    async def run(self, fn, *args):
+        self.calls.append(args)
+        return fn(*args)
+
+    def retry_after(self):
+        return 1
+
+
+def echo_batch(analyzer, payloads, image_types):
+    return [{"analyzer": analyzer, "payload": payload, "image_type": image_type}
+            for payload, image_type in zip(payloads, image_types)]
+
+
+def test_concurrent_submissions_are_batched_per_analyzer():
+    async def scenario():
+        executor = RecordingExecutor()
+        batcher = MicroBatcher(executor, echo_batch, max_batch_size=8, max_wait_ms=20)
+        results = await asyncio.gather(
+            batcher.submit("xray", b"a"), batcher.submit("XRAY", b"b"), batcher.submit("ct", b"c"),
+        )
+        await batcher.shutdown()
+        assert [result["payload"] for result in results] == [b"a", b"b", b"c"]
+        assert [result["image_type"] for result in results] == ["xray", "XRAY", "ct"]
+        assert sorted(analyzer for analyzer, _, _ in executor.calls) == ["other", "xray"]
+
+    asyncio.run(scenario())
+
+
+def test_shutdown_fails_requests_still_queued():
+    async def scenario():
+        batcher = MicroBatcher(RecordingExecutor(), echo_batch, max_batch_size=8, max_wait_ms=1000)
+        submissions = [asyncio.create_task(batcher.submit("xray", bytes([index]))) for index in range(3)]
+        await asyncio.sleep(0)
+        assert batcher.stats()["queued"]["xray"] == 3
+
+        await batcher.shutdown()
+
+        for submission in submissions:
+            with pytest.raises(InferenceUnavailable):
+                await submission
+
+    asyncio.run(scenario())
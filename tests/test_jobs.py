@@ -0,0 +1,29 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.jobs import AnalysisJobManager
+
+
+def test_foreground_task_is_discarded_when_its_waiter_goes_away():
+    async def scenario():
+        jobs = AnalysisJobManager(AsyncMongoMockClient()["zemedic_test"].analysis_jobs)
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return {"findings": []}
+
+        job = await jobs.submit("user", "xray", work, background=False)
+        waiter = asyncio.create_task(jobs.wait(job["id"]))
+        await asyncio.sleep(0)
+        # The client disconnects while the analysis is still running
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert job["id"] in jobs._tasks
+
+        release.set()
+        await asyncio.sleep(0.01)
+        assert jobs._tasks == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from backend.pagination import SORT_ORDER, encode_cursor, keyset_filter, parse_projection
+
+
+async def page(collection, limit, cursor=None):
+    documents = await collection.find(
+        keyset_filter({"user_id": "user"}, cursor=cursor), {"_id": 0}
+    ).sort(SORT_ORDER).limit(limit + 1).to_list(limit + 1)
+    next_cursor = encode_cursor(documents[limit - 1]) if len(documents) > limit else None
+    return documents[:limit], next_cursor
+
+
+def test_cursor_is_stable_across_pages_and_concurrent_inserts():
+    async def scenario():
+        collection = AsyncMongoMockClient()["zemedic_test"].analysis_results
+        start = datetime(2026, 1, 1)
+        # Runs of equal timestamps straddle the page boundaries
+        documents = [
+            {"id": str(uuid.uuid4()), "user_id": "user", "timestamp": start + timedelta(seconds=index // 4)}
+            for index in range(23)
+        ]
+        await collection.insert_many([dict(document) for document in documents])
+        await collection.insert_one({"id": "other", "user_id": "someone else", "timestamp": start})
+
+        seen, cursor = [], None
+        while True:
+            items, cursor = await page(collection, 5, cursor)
+            seen.extend(item["id"] for item in items)
+            # Newer results arriving meanwhile do not shift later pages
+            await collection.insert_one({"id": str(uuid.uuid4()), "user_id": "user",
+                                         "timestamp": start + timedelta(hours=1)})
+            if cursor is None:
+                break
+
+        expected = sorted(documents, key=lambda document: (document["timestamp"], document["id"]), reverse=True)
+        assert seen == [document["id"] for document in expected]
+
+    asyncio.run(scenario())
+
+
+def test_since_and_invalid_cursors():
+    since = datetime(2026, 1, 1)
+    assert keyset_filter({}, since=since) == {"timestamp": {"$gt": since}}
+    for cursor in ("not-a-cursor", "e30", "eyJ0IjoxfQ"):
+        with pytest.raises(HTTPException) as error:
+            keyset_filter({}, cursor=cursor)
+        assert error.value.status_code == 400
+
+
+def test_projection_always_keeps_the_sort_key():
+    assert parse_projection("findings, image_type", ["findings", "image_type", "id"]) == {
+        "findings": 1, "image_type": 1, "id": 1, "timestamp": 1, "_id": 0,
+    }
+    assert parse_projection(None, ["id"]) is None
+    with pytest.raises(HTTPException):
+        parse_projection("password", ["id"])
@@ -0,0 +1,41 @@
+import io
+
+import numpy as np
+from PIL import Image
+
+from backend.analysis import analyze_medical_image, analyze_medical_image_batch
+from backend.preprocessing import ImageDecoder, _DECODERS, _DECODERS_BY_IMAGE_TYPE, preprocess_batch, register_decoder
+
+
+def png(value: int = 128, size=(32, 32)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", size, value).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class ConstantDecoder(ImageDecoder):
+    name = "constant"
+
+    def decode_into(self, source, out):
+        out[...] = 1000
+
+
+def test_decoder_is_chosen_by_image_type(monkeypatch):
+    monkeypatch.setattr("backend.preprocessing._DECODERS", dict(_DECODERS))
+    monkeypatch.setattr("backend.preprocessing._DECODERS_BY_IMAGE_TYPE", dict(_DECODERS_BY_IMAGE_TYPE))
+    register_decoder(ConstantDecoder(), image_types=("dicom",))
+
+    batch = preprocess_batch("other", [png(), b"not a raster image"], image_types=["other", "DICOM"])
+
+    assert batch.valid.tolist() == [True, True]
+    plane = batch.tensor[1, 0]
+    assert np.allclose(plane, plane.flat[0])
+
+
+def test_undecodable_images_are_reported_per_item():
+    results = analyze_medical_image_batch("xray", [png(), b"\x00" * 64, png(255)], ["xray"] * 3)
+
+    assert [bool(result["findings"]) for result in results] == [True, False, True]
+    assert results[1]["error"] == "Unrecognized image format"
+    assert "error" not in results[0]
+    assert analyze_medical_image("mri", "not base64!")["error"]
@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from backend.rate_limits import LocalRateLimitBackend, TokenBucketLimit
+
+
+@pytest.mark.parametrize("spec", [None, "", "0", "0.0", " 0 ", "none", "unlimited"])
+def test_unlimited_specs(spec):
+    assert TokenBucketLimit.parse(spec) is None
+
+
+@pytest.mark.parametrize("spec", ["0,5", "-1,5", "-2", "nan", "1,0", "1,-3", "fast", "1,x"])
+def test_specs_that_would_never_refill_are_rejected(spec):
+    with pytest.raises(ValueError, match="Invalid rate limit"):
+        TokenBucketLimit.parse(spec)
+
+
+def test_burst_defaults_to_one_second_of_rate():
+    limit = TokenBucketLimit.parse("2.5")
+    assert (limit.rate, limit.burst) == (2.5, 3)
+    assert TokenBucketLimit.parse("0.1").burst == 1
+
+
+def test_token_bucket_admits_burst_then_reports_wait():
+    async def scenario():
+        backend = LocalRateLimitBackend()
+        limit = TokenBucketLimit(rate=0.5, burst=3)
+        admitted = [await backend.take("user", limit) for _ in range(4)]
+        assert [allowed for allowed, _ in admitted] == [True, True, True, False]
+        assert 1.9 < admitted[-1][1] <= 2.0
+        # Buckets are per key
+        assert (await backend.take("other", limit))[0]
+
+    asyncio.run(scenario())
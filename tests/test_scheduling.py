@@ -0,0 +1,84 @@
+import asyncio
+
+from backend.scheduling import FairScheduler, Priority
+
+
+def queued(scheduler, priority=Priority.ROUTINE):
+    return scheduler.stats()["classes"][priority.value]["queued"]
+
+
+def test_release_skips_waiter_cancelled_before_dispatch():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        cancelled = asyncio.create_task(scheduler.acquire("gone"))
+        behind = asyncio.create_task(scheduler.acquire("next"))
+        await asyncio.sleep(0)
+        assert queued(scheduler) == 2
+
+        # The client goes away, and the slot is released before the cancellation is handled
+        cancelled.cancel()
+        scheduler.release()
+
+        await asyncio.wait_for(behind, 1)
+        assert cancelled.cancelled()
+        assert scheduler.active == 1
+        assert queued(scheduler) == 0
+        scheduler.release()
+        assert scheduler.active == 0
+
+    asyncio.run(scenario())
+
+
+def test_release_with_only_cancelled_waiters_frees_the_slot():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        async with scheduler.slot("holder"):
+            cancelled = asyncio.create_task(scheduler.acquire("gone"))
+            await asyncio.sleep(0)
+            cancelled.cancel()
+        # Leaving the slot must not fail, and must not keep it held for the cancelled waiter
+        assert scheduler.active == 0
+        assert queued(scheduler) == 0
+        await asyncio.wait_for(scheduler.acquire("later"), 1)
+        assert scheduler.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_slot_handed_over_to_cancelled_caller_is_released():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        waiting = asyncio.create_task(scheduler.acquire("gone"))
+        await asyncio.sleep(0)
+        scheduler.release()
+        # Admitted, but cancelled before it got to run
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.active == 0
+        assert queued(scheduler) == 0
+
+    asyncio.run(scenario())
+
+
+def test_users_share_slots_fairly_within_a_class():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        order = []
+
+        async def request(user_id):
+            await scheduler.acquire(user_id)
+            order.append(user_id)
+            scheduler.release()
+
+        tasks = [asyncio.create_task(request("bulk-user")) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request("other")))
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        assert order.index("other") < 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+from botocore.exceptions import ClientError
+from starlette.responses import FileResponse, RedirectResponse
+
+from backend import storage
+from backend.storage import LocalImageStorage, S3ImageStorage
+
+IMAGE = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+DIGEST = hashlib.sha256(IMAGE).hexdigest()
+
+
+def stored_files(root):
+    return sorted(path.relative_to(root).as_posix() for path in Path(root).rglob("*") if path.is_file())
+
+
+def test_local_storage_keeps_the_first_copy_of_an_image(tmp_path):
+    images = LocalImageStorage(tmp_path)
+
+    async def scenario():
+        assert await images.save(DIGEST, IMAGE) == f"/api/images/{DIGEST}"
+        # Same digest again: nothing is rewritten
+        assert await images.save(DIGEST, b"re-upload") == f"/api/images/{DIGEST}"
+        assert await images.exists(DIGEST)
+        assert not await images.exists("0" * 64)
+        return await images.serve(DIGEST)
+
+    response = asyncio.run(scenario())
+
+    assert stored_files(tmp_path) == [f"{DIGEST[:2]}/{DIGEST}"]
+    assert (tmp_path / DIGEST[:2] / DIGEST).read_bytes() == IMAGE
+    assert isinstance(response, FileResponse)
+    assert response.path == tmp_path / DIGEST[:2] / DIGEST
+
+
+def test_local_storage_hard_links_spooled_uploads(tmp_path):
+    spooled = tmp_path / "spool" / "zemedic-upload-1"
+    spooled.parent.mkdir()
+    spooled.write_bytes(IMAGE)
+    images = LocalImageStorage(tmp_path / "images")
+
+    asyncio.run(images.save(DIGEST, spooled))
+
+    stored = tmp_path / "images" / DIGEST[:2] / DIGEST
+    assert stored.stat().st_ino == spooled.stat().st_ino
+    # The upload can go away without taking the stored image with it
+    spooled.unlink()
+    assert stored.read_bytes() == IMAGE
+    assert stored_files(tmp_path / "images") == [f"{DIGEST[:2]}/{DIGEST}"]
+
+
+def test_local_storage_copies_when_it_cannot_link(tmp_path, monkeypatch):
+    def cross_device(source, destination):
+        raise OSError(18, "Invalid cross-device link")
+
+    monkeypatch.setattr(storage.os, "link", cross_device)
+    spooled = tmp_path / "zemedic-upload-1"
+    spooled.write_bytes(IMAGE)
+    images = LocalImageStorage(tmp_path / "images")
+
+    asyncio.run(images.save(DIGEST, spooled))
+
+    stored = tmp_path / "images" / DIGEST[:2] / DIGEST
+    assert stored.read_bytes() == IMAGE
+    assert stored.stat().st_ino != spooled.stat().st_ino
+    assert stored_files(tmp_path / "images") == [f"{DIGEST[:2]}/{DIGEST}"]
+
+
+class StubS3Client:
+    """The handful of S3 client calls S3ImageStorage makes, against a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def head_object(self, Bucket, Key):
+        self.calls.append("head_object")
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ContentLength": len(self.objects[Bucket, Key][0])}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None):
+        self.calls.append("put_object")
+        self.objects[Bucket, Key] = (Body, ContentType)
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs=None):
+        self.calls.append("upload_file")
+        self.objects[Bucket, Key] = (Path(Filename).read_bytes(), (ExtraArgs or {}).get("ContentType"))
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?method={ClientMethod}&expires={ExpiresIn}"
+
+
+def s3_storage():
+    images = S3ImageStorage("studies", region_name="us-east-1", url_expiry=60)
+    images.client = StubS3Client()
+    return images
+
+
+def test_s3_storage_uploads_each_image_once():
+    images = s3_storage()
+    key = ("studies", f"images/{DIGEST[:2]}/{DIGEST}")
+
+    async def scenario():
+        assert not await images.exists(DIGEST)
+        assert await images.save(DIGEST, IMAGE, "image/png") == f"/api/images/{DIGEST}"
+        assert await images.save(DIGEST, b"re-upload", "image/png") == f"/api/images/{DIGEST}"
+        assert await images.exists(DIGEST)
+
+    asyncio.run(scenario())
+
+    assert images.client.objects == {key: (IMAGE, "image/png")}
+    assert images.client.calls.count("put_object") == 1
+
+
+def test_s3_storage_streams_spooled_uploads_from_disk(tmp_path):
+    images = s3_storage()
+    spooled = tmp_path / "zemedic-upload-1"
+    spooled.write_bytes(IMAGE)
+
+    asyncio.run(images.save(DIGEST, spooled))
+
+    assert images.client.calls == ["head_object", "upload_file"]
+    assert images.client.objects[("studies", f"images/{DIGEST[:2]}/{DIGEST}")] == (IMAGE, None)
+
+
+def test_s3_storage_serves_a_presigned_redirect():
+    response = asyncio.run(s3_storage().serve(DIGEST))
+
+    assert isinstance(response, RedirectResponse)
+    assert response.status_code == 307
+    assert response.headers["location"] == (
+        f"https://s3.test/studies/images/{DIGEST[:2]}/{DIGEST}?method=get_object&expires=60"
+    )
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+
+from backend.uploads import UploadReceiver
+
+BOUNDARY = "----zemedic-test-boundary"
+
+
+class StreamedRequest:
+    """Just what UploadReceiver reads from a Starlette request: headers and the body stream."""
+
+    def __init__(self, body: bytes, chunk_sizes, content_type=f"multipart/form-data; boundary={BOUNDARY}"):
+        self.headers = {"content-type": content_type}
+        self.body = body
+        self.chunk_sizes = chunk_sizes
+
+    async def stream(self):
+        position, index = 0, 0
+        while position < len(self.body):
+            size = self.chunk_sizes[index % len(self.chunk_sizes)]
+            yield self.body[position:position + size]
+            position += size
+            index += 1
+
+
+def multipart_body(parts) -> bytes:
+    body = b""
+    for name, value, filename in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n".encode()
+        if filename:
+            body += b"Content-Type: image/png\r\n"
+        body += b"\r\n" + value + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+# Image bytes that contain most of the boundary, and CRLFs, without ending it
+IMAGES = [
+    bytes(range(256)) * 40 + f"\r\n--{BOUNDARY[:-3]}".encode() + b"\x00" * 500,
+    b"\r\n\r\n--" + b"\xff" * 3000,
+]
+
+
+def receive_all(receiver, request, max_files=5):
+    async def collect():
+        fields = {}
+        received = []
+        async for upload, seen in receiver.iter_files(request, fields, file_field="files", max_files=max_files):
+            received.append((upload.filename, upload.getvalue(), upload.sha256, upload.in_memory, dict(seen)))
+            upload.close()
+        return received, fields
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("chunk_sizes", [[1], [7], [len(BOUNDARY) + 3], [5, 64, 2, 1000], [1 << 20]])
+def test_files_and_fields_survive_any_chunking(chunk_sizes):
+    body = multipart_body([
+        ("type", b"xray", None),
+        ("files", IMAGES[0], "first.png"),
+        ("priority", b"stat", None),
+        ("files", IMAGES[1], "second.png"),
+    ])
+    receiver = UploadReceiver(max_memory=4096)
+
+    received, fields = receive_all(receiver, StreamedRequest(body, chunk_sizes))
+
+    assert [(name, data) for name, data, *_ in received] == [("first.png", IMAGES[0]), ("second.png", IMAGES[1])]
+    assert [digest for _, _, digest, *_ in received] == [hashlib.sha256(image).hexdigest() for image in IMAGES]
+    # The first image is larger than max_memory and went to a temporary file
+    assert [in_memory for *_, in_memory, _ in received] == [False, True]
+    # Each file comes with the fields sent before it
+    assert received[0][-1] == {"type": "xray"}
+    assert received[1][-1] == {"type": "xray", "priority": "stat"}
+    assert fields == {"type": "xray", "priority": "stat"}
+
+
+def test_too_many_files_is_rejected_and_spooled_files_removed(tmp_path):
+    body = multipart_body([("files", IMAGES[0], f"{index}.png") for index in range(3)])
+    receiver = UploadReceiver(max_memory=16, tmp_dir=str(tmp_path))
+
+    with pytest.raises(HTTPException) as error:
+        receive_all(receiver, StreamedRequest(body, [100]), max_files=2)
+
+    assert error.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_truncated_body_is_malformed():
+    body = multipart_body([("files", IMAGES[1], "cut.png")])[:-40]
+    with pytest.raises(HTTPException) as error:
+        receive_all(UploadReceiver(), StreamedRequest(body, [13]))
+    assert error.value.status_code == 400
+
+
+def test_non_multipart_request_is_refused():
+    with pytest.raises(HTTPException) as error:
+        receive_all(UploadReceiver(), StreamedRequest(b"{}", [2], content_type="application/json"))
+    assert error.value.status_code == 415
+
+
+@pytest.mark.parametrize("body, status_code", [
+    # A second file after the one allowed
+    (multipart_body([("file", IMAGES[0], "first.png"), ("file", IMAGES[0], "second.png")]), 413),
+    # The client goes away after the file, before the closing boundary
+    (multipart_body([("file", IMAGES[0], "first.png"), ("type", b"xray", None)])[:-20], 400),
+], ids=["second-file", "disconnect"])
+def test_receive_removes_the_spooled_file_when_the_body_fails_after_it(tmp_path, body, status_code):
+    receiver = UploadReceiver(max_memory=16, tmp_dir=str(tmp_path))
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(receiver.receive(StreamedRequest(body, [64])))
+
+    assert error.value.status_code == status_code
+    assert list(tmp_path.iterdir()) == []
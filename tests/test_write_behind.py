@@ -0,0 +1,85 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import AutoReconnect
+
+from backend.write_behind import WriteBehindBuffer
+
+
+class BusyCollection:
+    """Every insert lets `arrivals_per_insert` new documents be buffered meanwhile, so the buffer never drains."""
+
+    def __init__(self, collection, arrivals, arrivals_per_insert):
+        self.collection = collection
+        self.arrivals = arrivals
+        self.arrivals_per_insert = arrivals_per_insert
+        self.buffer = None
+        self.spill_sizes = []
+
+    async def insert_many(self, documents, ordered=True):
+        for _ in range(min(self.arrivals_per_insert, len(self.arrivals))):
+            await self.buffer.put(self.arrivals.pop())
+        self.spill_sizes.append(self.buffer._spill_path.stat().st_size)
+        return await self.collection.insert_many(documents, ordered=ordered)
+
+
+def test_spill_file_is_compacted_under_steady_load(tmp_path):
+    async def scenario():
+        collection = AsyncMongoMockClient()["zemedic_test"].analysis_results
+        documents = [{"id": str(index), "report": "x" * 200} for index in range(5000)]
+        busy = BusyCollection(collection, documents[50:], arrivals_per_insert=50)
+        buffer = busy.buffer = WriteBehindBuffer(busy, tmp_path, flush_size=50, flush_interval=60)
+        await buffer.start()
+        for document in documents[:50]:
+            await buffer.put(document)
+        assert await buffer.flush()
+
+        assert len(busy.spill_sizes) >= 100
+        # Bounded by the backlog, not by the ~1.4 MB of documents put in total
+        assert max(busy.spill_sizes) < 100_000
+        await buffer.shutdown()
+        assert await collection.count_documents({}) == 5000
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(scenario())
+
+
+class FailingCollection:
+    async def insert_many(self, documents, ordered=True):
+        raise AutoReconnect("primary unavailable")
+
+
+def test_unwritten_documents_are_recovered_after_a_crash(tmp_path):
+    async def scenario():
+        collection = AsyncMongoMockClient()["zemedic_test"].analysis_results
+        crashed = WriteBehindBuffer(FailingCollection(), tmp_path, flush_interval=60, retry_attempts=1)
+        await crashed.start()
+        for index in range(5):
+            await crashed.put({"id": str(index)})
+        assert not await crashed.flush()
+        # One of them had reached Mongo before the crash
+        await collection.insert_one(dict(crashed._pending[crashed._queue[0]]))
+
+        # While the owner is alive its spill file is left alone
+        live = WriteBehindBuffer(collection, tmp_path, flush_interval=60)
+        await live.start()
+        assert live.stats()["pending"] == 0
+        await live.shutdown()
+
+        # Crash: the process goes away without flushing, mid-way through a write
+        crashed._task.cancel()
+        crashed._spill.write('{"put": {"id": "torn')
+        crashed._spill.close()
+
+        recovered = WriteBehindBuffer(collection, tmp_path, flush_interval=60)
+        await recovered.start()
+        assert recovered.stats()["pending"] == 5
+        assert recovered.get("3") == {"id": "3"}
+        assert await recovered.flush()
+        await recovered.shutdown()
+
+        assert sorted(document["id"] for document in await collection.find({}).to_list(None)) == list("01234")
+        assert recovered.stats()["dropped"] == 0
+        assert list(tmp_path.iterdir()) == []
+
+    asyncio.run(scenario())